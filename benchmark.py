@@ -0,0 +1,242 @@
+"""
+VaultNote Benchmarks (Standalone - No GUI Dependencies)
+Times startup, key derivation, encryption, vault persistence and bulk
+export/import at scale
+
+Usage:
+    python benchmark.py [--quick] [--output results.json]
+                        [--baseline baseline.json] [--threshold 0.25]
+
+Results are written as JSON. With --baseline, every case that got slower
+than the baseline by more than the threshold is reported and the exit
+status is 1, so CI can fail on regressions.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import vault
+from encryption import KDF, VaultKey, calibrate_kdf, decrypt_stream, encrypt_stream
+
+PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 100 * 1024 * 1024]
+VAULT_SIZES = [10, 1000, 10000, 100000]
+QUICK_PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024]
+QUICK_VAULT_SIZES = [10, 1000]
+BULK_COUNT = 64
+QUICK_BULK_COUNT = 16
+NOTE_CONTENT_SIZE = 512
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(fn, repeat: int = 3, setup=None) -> dict:
+    """Return the median wall time of fn and the peak traced allocation
+
+    setup, if given, runs before every call and its result is passed to fn
+    so that preparation is excluded from the timing.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    arg = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "peak_bytes": peak}
+
+
+def make_notes(count: int) -> list:
+    filler = "lorem ipsum dolor sit amet " * (NOTE_CONTENT_SIZE // 27 + 1)
+    return [
+        {
+            "title": f"Note {i}",
+            "content": filler[:NOTE_CONTENT_SIZE],
+            "locked": False,
+            "pin_hash": None,
+            "timestamp": "2024-01-01T00:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def bench_startup(results: dict):
+    """Cold start of a fresh interpreter: CLI help, and importing the core"""
+    def spawn(argv):
+        subprocess.run([sys.executable, *argv], cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+
+    results["startup/cli_help"] = measure(lambda _: spawn(["cli.py", "--help"]), repeat=5)
+    results["startup/core_import"] = measure(
+        lambda _: spawn(["-c", "import encryption, settings, vault, search, jobs"]), repeat=5)
+
+
+def bench_key_derivation(results: dict):
+    results["kdf/pbkdf2"] = measure(lambda _: VaultKey.derive("benchmark"), repeat=5)
+    results["kdf/scrypt"] = measure(lambda _: VaultKey.derive("benchmark", kdf=KDF.scrypt()), repeat=5)
+    results["kdf/calibration"] = measure(lambda _: calibrate_kdf(), repeat=3)
+    calibrated = calibrate_kdf()
+    results["kdf/calibrated"] = dict(measure(lambda _: VaultKey.derive("benchmark", kdf=calibrated), repeat=3),
+                                     params=calibrated.to_dict())
+
+
+def bench_payloads(results: dict, sizes: list):
+    vault_key = VaultKey.derive("benchmark")
+    for size in sizes:
+        data = os.urandom(size)
+        blob = vault_key.encrypt(data)
+        repeat = 3 if size <= 16 * 1024 * 1024 else 1
+        results[f"encrypt/{size}"] = dict(measure(lambda _: vault_key.encrypt(data), repeat), bytes=size)
+        results[f"decrypt/{size}"] = dict(measure(lambda _: vault_key.decrypt(blob), repeat), bytes=size)
+
+        stream = io.BytesIO()
+        encrypt_stream(io.BytesIO(data), stream, "benchmark")
+        results[f"stream_encrypt/{size}"] = dict(measure(
+            lambda _: encrypt_stream(io.BytesIO(data), io.BytesIO(), "benchmark"), repeat), bytes=size)
+        results[f"stream_decrypt/{size}"] = dict(measure(
+            lambda _: decrypt_stream(io.BytesIO(stream.getvalue()), io.BytesIO(), "benchmark"), repeat), bytes=size)
+
+
+def bench_vaults(results: dict, sizes: list, directory: str):
+    for count in sizes:
+        path = os.path.join(directory, f"vault_{count}")
+        os.makedirs(path)
+        notes = make_notes(count)
+        store, _, _ = vault.open_vault("benchmark", path)
+        repeat = 3 if count <= 10000 else 1
+
+        results[f"vault_create/{count}"] = dict(measure(lambda _: store.create(notes), repeat), notes=count)
+        results[f"vault_unlock/{count}"] = dict(measure(
+            lambda _: vault.open_vault("benchmark", path, lazy=True), repeat), notes=count)
+        results[f"vault_load/{count}"] = dict(measure(lambda _: store.load(), repeat), notes=count)
+
+        edited = dict(notes[count // 2], content="edited " * 100)
+        results[f"vault_save_one/{count}"] = dict(measure(lambda _: store.put(edited), repeat), notes=count)
+        grouped = vault.VaultStore(store.key, path, commit_delay=60)
+        grouped.open_index()
+        results[f"vault_save_one_grouped/{count}"] = dict(measure(lambda _: grouped.put(edited), repeat), notes=count)
+        grouped.flush()
+        store.open_index()
+        results[f"vault_save_all/{count}"] = dict(measure(lambda _: store.sync(notes), repeat), notes=count)
+
+        results[f"vault_delete_one/{count}"] = dict(measure(
+            store.delete, repeat, setup=lambda: store.put({"title": "Scratch", "content": "scratch"})), notes=count)
+
+        results[f"vault_rewrap/{count}"] = dict(measure(lambda _: store.rewrap("benchmark"), repeat), notes=count)
+
+        disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        results[f"vault_create/{count}"]["disk_bytes"] = disk
+        shutil.rmtree(path)
+
+
+def bench_export(results: dict, sizes: list, directory: str):
+    for size in sizes:
+        note = {"title": "Export", "content": "x" * size, "timestamp": "2024-01-01T00:00:00"}
+        path = os.path.join(directory, "export.venc")
+        repeat = 3 if size <= 16 * 1024 * 1024 else 1
+        results[f"export/{size}"] = dict(measure(lambda _: vault.export_note(note, path, "benchmark"), repeat), bytes=size)
+        results[f"import/{size}"] = dict(measure(lambda _: vault.read_export(path, "benchmark"), repeat), bytes=size)
+        os.remove(path)
+
+
+def bench_bulk(results: dict, count: int, directory: str):
+    """Bulk export and import of many small notes, serial and in parallel"""
+    notes = make_notes(count)
+    exports = os.path.join(directory, "bulk")
+    os.makedirs(exports)
+    items = [(note, os.path.join(exports, f"note{i}.venc")) for i, note in enumerate(notes)]
+    for label, workers in (("serial", 1), ("parallel", None)):
+        results[f"bulk_export_{label}/{count}"] = dict(measure(
+            lambda _: list(vault.export_notes(items, "benchmark", workers)), 1), notes=count)
+        target = os.path.join(directory, f"bulk_{label}")
+        os.makedirs(target)
+        store, _, _ = vault.open_vault("benchmark", target)
+        results[f"bulk_import_{label}/{count}"] = dict(measure(
+            lambda _: vault.import_directory(store, exports, "benchmark", workers), 1), notes=count)
+        store.close()
+    archive = os.path.join(directory, "bulk.venc")
+    results[f"archive_export/{count}"] = dict(measure(
+        lambda _: vault.export_archive(notes, archive, "benchmark")), notes=count)
+    results[f"archive_import/{count}"] = dict(measure(
+        lambda _: list(vault.read_export_notes(archive, "benchmark"))), notes=count)
+    shutil.rmtree(exports)
+
+
+def run(quick: bool = False) -> dict:
+    """Run every benchmark and return the results document"""
+    payload_sizes = QUICK_PAYLOAD_SIZES if quick else PAYLOAD_SIZES
+    vault_sizes = QUICK_VAULT_SIZES if quick else VAULT_SIZES
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        bench_startup(results)
+        bench_key_derivation(results)
+        bench_payloads(results, payload_sizes)
+        bench_vaults(results, vault_sizes, directory)
+        bench_export(results, payload_sizes, directory)
+        bench_bulk(results, QUICK_BULK_COUNT if quick else BULK_COUNT, directory)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "quick": quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Return (name, baseline seconds, current seconds) for each regression"""
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((name, before["seconds"], result["seconds"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="VaultNote benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller payloads and vaults, for CI")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="compare against a stored results JSON")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown before a case counts as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    document = run(args.quick)
+    for name, result in document["results"].items():
+        print(f"{name:32} {result['seconds'] * 1000:10.2f} ms  peak {result['peak_bytes'] / 1024:10.0f} KiB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(document, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
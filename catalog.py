@@ -0,0 +1,214 @@
+"""
+VaultNote Catalog
+Sorted, paginated view of the vault manifest (no GUI dependencies)
+
+The catalog holds note summaries and keeps one sorted index per order
+(vault order, case-folded title, timestamp) and lock filter (all, locked,
+unlocked). Adding, updating or removing a note moves its keys in each
+index with a binary search, so the list never has to be re-sorted.
+
+Pages are read with a cursor: the sort key of the last note shown. A
+cursor stays valid across edits, so the next page continues after that
+note even if notes were added or removed in the meantime.
+"""
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+from notes import Note, stamp_from_iso
+
+PAGE_SIZE = 50
+ORDERS = ("added", "title", "timestamp")
+FILTERS = (None, True, False)
+
+# Sorted lists are split into sublists of about this length, so an insert
+# or delete shifts one short sublist rather than the whole index
+_LOAD = 256
+
+
+class SortedKeys:
+    """Sorted collection of unique keys held as a list of short sorted lists"""
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + _LOAD] for i in range(0, len(keys), _LOAD)]
+        self._maxes = [keys[-1] for keys in self._lists]
+        self._size = len(keys)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        for keys in self._lists:
+            yield from keys
+
+    def add(self, key):
+        self._size += 1
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._lists[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._lists[i], key)
+        keys = self._lists[i]
+        if len(keys) > 2 * _LOAD:
+            self._lists[i:i + 1] = [keys[:_LOAD], keys[_LOAD:]]
+            self._maxes[i:i + 1] = [keys[_LOAD - 1], keys[-1]]
+
+    def remove(self, key):
+        i, j = self._locate(key)
+        keys = self._lists[i]
+        del keys[j]
+        self._size -= 1
+        if not keys:
+            del self._lists[i]
+            del self._maxes[i]
+        else:
+            self._maxes[i] = keys[-1]
+
+    def index(self, key) -> int:
+        """Position of key in sorted order; raises KeyError if it is not present"""
+        i, j = self._locate(key)
+        return sum(len(keys) for keys in self._lists[:i]) + j
+
+    def _locate(self, key):
+        i = bisect_left(self._maxes, key)
+        keys = self._lists[i] if i < len(self._lists) else ()
+        j = bisect_left(keys, key)
+        if j == len(keys) or keys[j] != key:
+            raise KeyError(key)
+        return i, j
+
+    def after(self, key=None):
+        """Yield keys greater than key (or from the start), in order"""
+        i, j = 0, 0
+        if key is not None:
+            i = bisect_right(self._maxes, key)
+            if i < len(self._lists):
+                j = bisect_right(self._lists[i], key)
+        for keys in self._lists[i:]:
+            yield from keys[j:]
+            j = 0
+
+    def before(self, key=None):
+        """Yield keys less than key (or from the end), in reverse order"""
+        i = len(self._lists) - 1
+        j = None
+        if key is not None:
+            i = min(bisect_left(self._maxes, key), i)
+            j = bisect_left(self._lists[i], key) if i >= 0 else None
+        while i >= 0:
+            yield from reversed(self._lists[i][:j])
+            i -= 1
+            j = None
+
+
+class Catalog:
+    """Note summaries with sorted indexes for paging by order and lock state"""
+
+    def __init__(self, notes=()):
+        self._notes = {}
+        # note id -> (sequence, title key, timestamp key); a key ends with the sequence
+        self._keys = {}
+        self._ids = {}
+        self._sequence = 0
+        for note in notes:
+            self._add(note)
+        # Loaded notes are sorted once per order; later changes are kept in order one by one
+        locked = {self._keys[note_id][0] for note_id, note in self._notes.items() if note.get("locked")}
+        self._indexes = {}
+        for position, order in enumerate(ORDERS):
+            ordered = sorted(self._order_keys(note_id)[position] for note_id in self._notes)
+            # Already sorted, so building each index is a linear pass
+            self._indexes[order, None] = SortedKeys(ordered)
+            self._indexes[order, True] = SortedKeys([key for key in ordered if key[-1] in locked])
+            self._indexes[order, False] = SortedKeys([key for key in ordered if key[-1] not in locked])
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._notes
+
+    def get(self, note_id: str):
+        return self._notes.get(note_id)
+
+    def count(self, locked: bool = None) -> int:
+        return len(self._indexes["added", locked])
+
+    def put(self, note):
+        """Add a note summary, or replace the one with the same id"""
+        note_id = note["id"]
+        previous = self._notes.get(note_id)
+        if previous is not None:
+            self._unindex(note_id, previous)
+        self._add(note)
+        locked = bool(note.get("locked"))
+        for order, key in zip(ORDERS, self._order_keys(note_id)):
+            self._indexes[order, None].add(key)
+            self._indexes[order, locked].add(key)
+
+    def remove(self, note_id: str):
+        note = self._notes.pop(note_id, None)
+        if note is None:
+            return
+        self._unindex(note_id, note)
+        del self._ids[self._keys.pop(note_id)[0]]
+
+    def page(self, order: str = "added", locked: bool = None, cursor=None, limit: int = PAGE_SIZE,
+             reverse: bool = False):
+        """Return (notes, cursor) for the page after cursor
+
+        locked=None lists every note, True or False only locked or
+        unlocked ones. reverse walks the order backwards (newest or Z
+        first). The returned cursor is None once there are no more notes.
+        """
+        index = self._indexes[order, locked]
+        walk = index.before if reverse else index.after
+        keys = list(islice(walk(cursor), limit + 1))
+        more = len(keys) > limit
+        keys = keys[:limit]
+        # Every key ends with the note's sequence number
+        notes = [self._notes[self._ids[key[-1]]] for key in keys]
+        return notes, keys[-1] if more else None
+
+    def position(self, note_id: str, order: str = "added", locked: bool = None, reverse: bool = False):
+        """Return where a note comes in page() order, or None if it is not listed there
+
+        The note list uses it to insert or move one row instead of reloading
+        every row it shows.
+        """
+        note = self._notes.get(note_id)
+        if note is None or (locked is not None and bool(note.get("locked")) != locked):
+            return None
+        index = self._indexes[order, locked]
+        position = index.index(self._order_keys(note_id)[ORDERS.index(order)])
+        return len(index) - 1 - position if reverse else position
+
+    def _add(self, note):
+        """Record a note and its sort keys, keeping the sequence of a replaced one"""
+        note_id = note["id"]
+        if note_id in self._keys:
+            sequence = self._keys[note_id][0]
+        else:
+            self._sequence += 1
+            sequence = self._sequence
+            self._ids[sequence] = note_id
+        self._notes[note_id] = note
+        stamp = note.stamp if isinstance(note, Note) else stamp_from_iso(note.get("timestamp"))
+        stamp = -1 if stamp is None else stamp
+        self._keys[note_id] = (sequence, (note["title"].casefold(), sequence), (stamp, sequence))
+
+    def _order_keys(self, note_id: str):
+        sequence, title_key, stamp_key = self._keys[note_id]
+        return (sequence,), title_key, stamp_key
+
+    def _unindex(self, note_id: str, note):
+        locked = bool(note.get("locked"))
+        for order, key in zip(ORDERS, self._order_keys(note_id)):
+            self._indexes[order, None].remove(key)
+            self._indexes[order, locked].remove(key)
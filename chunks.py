@@ -0,0 +1,62 @@
+"""
+VaultNote Chunks
+Content-defined chunking for deduplicated note storage (no GUI dependencies)
+
+Large note bodies are split where a rolling (gear) hash of the last few
+dozen bytes hits a bit pattern, so chunk boundaries follow the content
+rather than offsets: an insert or delete only changes the chunks around
+it, and the same text imported twice gives the same chunks.
+
+Chunks are addressed by a keyed hash (HMAC-SHA256 under a vault subkey,
+truncated to CHUNK_ID_SIZE bytes), so equal chunks are stored once without
+their ids revealing anything about the content to someone without the key.
+"""
+import hashlib
+import hmac
+
+CHUNK_ID_SIZE = 16
+# No cut before MIN_CHUNK bytes; then a cut is expected every ~8 KiB, and forced at MAX_CHUNK
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+_CUT_MASK = 0x1FFF << 19
+
+# One fixed pseudo-random 32-bit value per byte value
+_GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:4], "big") for value in range(256)]
+
+
+def chunk_boundaries(data) -> list:
+    """Return the end offset of each chunk of data"""
+    view = memoryview(data)
+    boundaries = []
+    start = 0
+    gear = _GEAR
+    while start < len(view):
+        end = min(start + MAX_CHUNK, len(view))
+        cut = end
+        h = 0
+        i = start + MIN_CHUNK
+        # Bytes before MIN_CHUNK cannot end a chunk, so they are not hashed
+        for byte in view[i:end]:
+            i += 1
+            h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+            if not h & _CUT_MASK:
+                cut = i
+                break
+        boundaries.append(cut)
+        start = cut
+    return boundaries
+
+
+def split_chunks(data) -> list:
+    """Split data into content-defined chunks"""
+    chunks = []
+    start = 0
+    for end in chunk_boundaries(data):
+        chunks.append(bytes(data[start:end]))
+        start = end
+    return chunks
+
+
+def chunk_id(key: bytes, chunk: bytes) -> str:
+    """Keyed address of a chunk, as hex"""
+    return hmac.new(key, chunk, hashlib.sha256).digest()[:CHUNK_ID_SIZE].hex()
@@ -0,0 +1,401 @@
+"""
+VaultNote Command Line (Standalone - No GUI Dependencies)
+Bulk list, export, import, PIN change and verification for a vault
+
+Usage:
+    python cli.py [--directory DIR] [--pin PIN] list [--sort added|title|newest|oldest] [--locked | --unlocked]
+    python cli.py export [NOTE ...] (--output DIR | --archive FILE) [--export-pin PIN]
+                          [--include-locked [--document-pin PIN]]
+    python cli.py import (FILE | DIR) ... [--export-pin PIN] [--max-size MB]
+    python cli.py rekey [--new-pin PIN | --remove-pin]
+    python cli.py verify
+    python cli.py scrub [FILE ...] [--export-pin PIN]
+    python cli.py recover TARGET
+    python cli.py history NOTE [--show REV [--document-pin PIN] | --restore REV]
+    python cli.py prune [--keep N] [--days DAYS]
+    python cli.py diagnostics [TRACE ...] [--json]
+
+The vault PIN is read from --pin, then VAULTNOTE_PIN, and is prompted
+for only if the vault has one. Notes are chosen by id, id prefix or exact
+title. Exports to separate files and imports are decrypted and encrypted
+across --workers processes. An import reads files ahead of the vault
+writer through a bounded queue, detects the encoding of text files, skips
+files over --max-size, and commits to the vault once, after the last
+file. Core modules are imported after the arguments are parsed so that
+--help and usage errors return without loading any crypto code.
+
+scrub checks every record, revision and chunk of the vault (across
+--workers processes) or every chunk of the given .venc files, and prints
+each damaged region by file and byte offset, with the throughput. recover
+copies every note that still reads into a fresh vault in TARGET, with the
+same vault PIN.
+
+--trace FILE records timing spans of any command as JSON lines. diagnostics
+prints per-operation latency percentiles and byte counts, either for trace
+files (such as vault_trace.jsonl from the app) or, with none given, for an
+unlock, a read of every note and a verify of this vault.
+"""
+import argparse
+import getpass
+import os
+import sys
+
+PIN_ENV = "VAULTNOTE_PIN"
+
+
+def _secret(value, prompt: str) -> str:
+    return value if value is not None else getpass.getpass(prompt)
+
+
+def _password(args):
+    """Return the vault password and settings, prompting for the PIN if needed"""
+    from settings import load_settings, vault_password
+
+    settings = load_settings(args.directory)
+    pin = args.pin if args.pin is not None else os.environ.get(PIN_ENV)
+    if settings.get("vault_locked") and pin is None:
+        pin = getpass.getpass("Vault PIN: ")
+    return vault_password(settings, pin), settings
+
+
+def _open(args, credentials=None):
+    import vault
+    from settings import device_kdf
+
+    password, settings = credentials or _password(args)
+    store, notes, success = vault.open_vault(password, args.directory, lazy=True,
+                                             kdf=device_kdf(settings, args.directory))
+    if not success:
+        raise ValueError("Failed to open vault. Wrong PIN or corrupted data.")
+    return store, notes, settings
+
+
+def _select(notes: list, selectors: list) -> list:
+    if not selectors:
+        return notes
+    chosen = []
+    for selector in selectors:
+        matches = [note for note in notes if note["id"].startswith(selector) or note["title"] == selector]
+        if not matches:
+            raise ValueError(f"No note matches {selector!r}")
+        chosen.extend(note for note in matches if note not in chosen)
+    return chosen
+
+
+def _export_name(note: dict, directory: str, used: set) -> str:
+    name = f"{note['title'].replace(' ', '_').replace(os.sep, '_')}.venc"
+    if name in used or os.path.exists(os.path.join(directory, name)):
+        name = f"{name[:-5]}_{note['id'][:8]}.venc"
+    used.add(name)
+    return os.path.join(directory, name)
+
+
+SORT_ORDERS = {"added": ("added", False), "title": ("title", False),
+               "newest": ("timestamp", True), "oldest": ("timestamp", False)}
+
+
+def cmd_list(args) -> int:
+    from catalog import Catalog
+
+    store, notes, _ = _open(args)
+    try:
+        order, reverse = SORT_ORDERS[args.sort]
+        catalog = Catalog(notes)
+        notes, _ = catalog.page(order, args.locked, limit=len(catalog), reverse=reverse)
+        for note in notes:
+            marker = "locked" if note.get("locked") else ""
+            print(f"{note['id']}  {note.get('timestamp') or '':26}  {marker:6}  {note['title']}")
+    finally:
+        store.close()
+    return 0
+
+
+def _open_note(store, summary, document_pin: str = None):
+    """Read a note, opening a locked one with its document PIN"""
+    if not summary.get("locked"):
+        return store.get(summary["id"])
+    pin = _secret(document_pin, f"Document PIN for {summary['title']}: ")
+    return store.unlock_note(summary["id"], pin)
+
+
+def cmd_export(args) -> int:
+    import vault
+
+    store, notes, _ = _open(args)
+    try:
+        notes = _select(notes, args.notes)
+        export_pin = _secret(args.export_pin, "Export PIN: ")
+        chosen = []
+        for summary in notes:
+            if summary.get("locked") and not args.include_locked:
+                print(f"skipped {summary['title']} (document PIN; use --include-locked)")
+            else:
+                chosen.append(summary)
+        opened = (_open_note(store, summary, args.document_pin) for summary in chosen)
+        if args.archive:
+            vault.export_archive(opened, args.archive, export_pin)
+            print(f"exported {len(chosen)} notes to {args.archive}")
+            return 0
+        os.makedirs(args.output, exist_ok=True)
+        used = set()
+        items = ((note, _export_name(note, args.output, used)) for note in opened)
+        for path in vault.export_notes(items, export_pin, args.workers):
+            print(f"exported {path}")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_import(args) -> int:
+    import vault
+
+    paths = vault.expand_import_paths(args.files)
+    store, _, _ = _open(args)
+    try:
+        export_pin = None
+        if any(path.lower().endswith(".venc") for path in paths):
+            export_pin = _secret(args.export_pin, "Export PIN: ")
+        note_ids, failed = vault.import_files(store, paths, export_pin, args.workers,
+                                              max_bytes=int(args.max_size * 1024 * 1024))
+    finally:
+        store.close()
+    for path, error in failed.items():
+        print(f"FAILED {path}: {error}")
+    print(f"imported {len(note_ids)} notes from {len(paths) - len(failed)} of {len(paths)} files")
+    return 1 if failed else 0
+
+
+def cmd_rekey(args) -> int:
+    from settings import change_vault_pin
+
+    credentials = _password(args)
+    store, _, settings = _open(args, credentials)
+    try:
+        new_pin = None if args.remove_pin else _secret(args.new_pin, "New vault PIN: ")
+        if not args.remove_pin and not new_pin:
+            raise ValueError("New vault PIN cannot be empty; use --remove-pin")
+        change_vault_pin(store, settings, new_pin, credentials[0], args.directory)
+    finally:
+        store.close()
+    print("Vault PIN set." if new_pin else "Vault PIN removed.")
+    return 0
+
+
+def cmd_verify(args) -> int:
+    store, notes, _ = _open(args)
+    try:
+        damaged = store.verify()
+    finally:
+        store.close()
+    titles = {note["id"]: note["title"] for note in notes}
+    for note_id in damaged:
+        print(f"DAMAGED {note_id}  {titles.get(note_id, '')}")
+    print(f"{len(notes) - len(damaged)} of {len(notes)} notes verified")
+    return 1 if damaged else 0
+
+
+def _print_damage(report: dict):
+    for entry in report["damaged"]:
+        detail = " ".join(f"{key}={entry[key]}" for key in ("id", "revision", "chunk") if key in entry)
+        print(f"DAMAGED {entry['file']} offset {entry['offset']} length {entry['length']}  "
+              f"{entry['kind']} {detail}  {entry['error']}")
+
+
+def cmd_scrub(args) -> int:
+    import scrub
+
+    damaged = False
+    if args.files:
+        export_pin = _secret(args.export_pin, "Export PIN: ")
+        for path in args.files:
+            report = scrub.scrub_export(path, export_pin)
+            _print_damage(report)
+            damaged = damaged or bool(report["damaged"])
+            print(f"{path}: {report['chunks'] - len(report['damaged'])} of {report['chunks']} chunks verified, "
+                  f"{report['bytes']} bytes at {report['mb_per_second']} MB/s")
+        return 1 if damaged else 0
+    password, _ = _password(args)
+    report = scrub.scrub_vault(args.directory, password, args.workers)
+    if report["index"] not in ("ok", "none"):
+        print(f"DAMAGED index ({report['index']}); checked the segments record by record")
+    _print_damage(report)
+    for note_id in report["damaged_notes"]:
+        print(f"UNREADABLE note {note_id}")
+    unverified = f", {report['unverified']} unverified" if report.get("unverified") else ""
+    print(f"{report['records']} records checked{unverified}, {len(report['damaged'])} damaged, "
+          f"{report['bytes']} bytes at {report['mb_per_second']} MB/s")
+    return 1 if report["damaged"] or report["index"] not in ("ok", "none") else 0
+
+
+def cmd_recover(args) -> int:
+    import shutil
+
+    import scrub
+    from settings import SETTINGS_NAME, device_kdf
+
+    password, settings = _password(args)
+    report = scrub.recover_vault(args.directory, password, args.target, device_kdf(settings, args.directory))
+    # The device key in the settings is part of the password when the vault has no PIN
+    settings_path = os.path.join(args.directory, SETTINGS_NAME)
+    if os.path.exists(settings_path) and not os.path.exists(os.path.join(args.target, SETTINGS_NAME)):
+        shutil.copy2(settings_path, os.path.join(args.target, SETTINGS_NAME))
+    for entry in report["from_revision"]:
+        print(f"rebuilt {entry['title']} from revision {entry['revision']}")
+    for entry in report["lost"]:
+        print(f"LOST {entry['id']}  {entry['title']}")
+    print(f"recovered {len(report['recovered'])} notes into {args.target}, lost {len(report['lost'])}")
+    return 1 if report["lost"] else 0
+
+
+def cmd_history(args) -> int:
+    store, notes, _ = _open(args)
+    try:
+        note = _select(notes, [args.note])[0]
+        if args.show is not None:
+            pin = _secret(args.document_pin, "Document PIN: ") if note.get("locked") else None
+            print(store.revision(note["id"], args.show, pin)["content"])
+        elif args.restore is not None:
+            store.restore(note["id"], args.restore)
+            print(f"restored revision {args.restore} of {note['title']}")
+        else:
+            for revision in store.revisions(note["id"]):
+                print(f"{revision['revision']:5}  {revision['timestamp'] or '':26}  {revision['size']:8} bytes")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_prune(args) -> int:
+    if args.keep is None and args.days is None:
+        raise ValueError("Give --keep, --days or both")
+    store, _, _ = _open(args)
+    try:
+        max_age = None if args.days is None else args.days * 86400
+        dropped = store.prune_history(keep=args.keep, max_age=max_age)
+    finally:
+        store.close()
+    print(f"dropped {dropped} revisions")
+    return 0
+
+
+def cmd_diagnostics(args) -> int:
+    import json
+
+    import instrument
+
+    if args.traces:
+        events = [event for path in args.traces for event in instrument.read_events(path)]
+    else:
+        sink = instrument.RingBufferSink()
+        previous = instrument.disable()
+        instrument.enable(sink)
+        try:
+            store, notes, _ = _open(args)
+            try:
+                for _ in range(2):
+                    for note in notes:
+                        if not note.get("locked"):
+                            store.get(note["id"])
+                store.verify()
+            finally:
+                store.close()
+        finally:
+            instrument.disable()
+            if previous is not None:
+                instrument.enable(previous)
+        events = sink.events()
+    summary = instrument.summarize(events)
+    print(json.dumps(summary, indent=2) if args.json else instrument.format_summary(summary))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="VaultNote command line")
+    parser.add_argument("--directory", default=".", help="vault directory (default: current directory)")
+    parser.add_argument("--pin", help=f"vault PIN (default: ${PIN_ENV}, or prompt)")
+    parser.add_argument("--workers", type=int, help="processes for bulk export, import and scrub (default: CPU count)")
+    parser.add_argument("--trace", help="append timing spans of this command to a JSON lines file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listing = commands.add_parser("list", help="list notes")
+    listing.add_argument("--sort", choices=list(SORT_ORDERS), default="added", help="order of the list")
+    states = listing.add_mutually_exclusive_group()
+    states.add_argument("--locked", action="store_const", const=True, help="only notes with a document PIN")
+    states.add_argument("--unlocked", dest="locked", action="store_const", const=False,
+                        help="only notes without a document PIN")
+    listing.set_defaults(run=cmd_list)
+
+    export = commands.add_parser("export", help="export notes as .venc files or one archive")
+    export.add_argument("notes", nargs="*", help="note ids, id prefixes or titles (default: all)")
+    targets = export.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--output", help="directory to write one .venc file per note to")
+    targets.add_argument("--archive", help="single .venc archive file to write every note to")
+    export.add_argument("--export-pin", help="PIN the exports are encrypted with (default: prompt)")
+    export.add_argument("--include-locked", action="store_true", help="also export notes with a document PIN")
+    export.add_argument("--document-pin", help="document PIN of locked notes (default: prompt for each)")
+    export.set_defaults(run=cmd_export)
+
+    imports = commands.add_parser("import", help="import .venc exports, archives and .txt files as notes")
+    imports.add_argument("files", nargs="+", help="files, or directories whose .venc and .txt files are imported")
+    imports.add_argument("--export-pin", help="PIN of the .venc files (default: prompt)")
+    imports.add_argument("--max-size", type=float, default=64, metavar="MB",
+                         help="skip files larger than this (default: 64)")
+    imports.set_defaults(run=cmd_import)
+
+    rekey = commands.add_parser("rekey", help="set, change or remove the vault PIN")
+    pins = rekey.add_mutually_exclusive_group()
+    pins.add_argument("--new-pin", help="new vault PIN (default: prompt)")
+    pins.add_argument("--remove-pin", action="store_true", help="unlock with the device key again")
+    rekey.set_defaults(run=cmd_rekey)
+
+    commands.add_parser("verify", help="decrypt every note and report damaged records").set_defaults(run=cmd_verify)
+
+    scrubbing = commands.add_parser("scrub", help="check every record, chunk and tag and report damaged regions")
+    scrubbing.add_argument("files", nargs="*", help=".venc exports or archives to check (default: the vault)")
+    scrubbing.add_argument("--export-pin", help="PIN of the .venc files (default: prompt)")
+    scrubbing.set_defaults(run=cmd_scrub)
+
+    recover = commands.add_parser("recover", help="copy every readable note into a fresh vault")
+    recover.add_argument("target", help="empty directory for the recovered vault")
+    recover.set_defaults(run=cmd_recover)
+
+    history = commands.add_parser("history", help="list, show or restore earlier versions of a note")
+    history.add_argument("note", help="note id, id prefix or title")
+    actions = history.add_mutually_exclusive_group()
+    actions.add_argument("--show", type=int, metavar="REV", help="print the content of a revision")
+    actions.add_argument("--restore", type=int, metavar="REV", help="make a revision the current version")
+    history.add_argument("--document-pin", help="document PIN of a locked note (default: prompt)")
+    history.set_defaults(run=cmd_history)
+
+    prune = commands.add_parser("prune", help="drop old revisions")
+    prune.add_argument("--keep", type=int, help="revisions to keep per note")
+    prune.add_argument("--days", type=float, help="drop revisions older than this many days")
+    prune.set_defaults(run=cmd_prune)
+
+    diagnostics = commands.add_parser("diagnostics", help="latency percentiles and byte counts per operation")
+    diagnostics.add_argument("traces", nargs="*", help="trace files to summarize (default: profile this vault)")
+    diagnostics.add_argument("--json", action="store_true", help="print the summary as JSON")
+    diagnostics.set_defaults(run=cmd_diagnostics)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    sink = None
+    try:
+        if args.trace:
+            import instrument
+            sink = instrument.JsonLinesSink(args.trace)
+            instrument.enable(sink)
+        return args.run(args)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if sink is not None:
+            instrument.disable()
+            sink.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
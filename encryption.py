@@ -1,36 +1,108 @@
 """
 VaultNote Encryption Module
 Pure Python encryption utilities without GUI dependencies
+
+cryptography is imported on first use, so tools that only read settings
+or print help start without loading it. Key derivation, AES-GCM and
+compression report timing spans to instrument while it is enabled.
 """
 import base64
 import hashlib
+import hmac
 import os
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+import re
+import struct
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+
+import instrument
+
+PBKDF2_ITERATIONS = 100000
+# Bounds for device calibration. scrypt uses 128 * r * N bytes of memory,
+# so N stops at 2**17 (128 MiB with r = 8) to stay safe on phones.
+KDF_TARGET_SECONDS = 0.25
+PBKDF2_MIN_ITERATIONS = 50000
+PBKDF2_MAX_ITERATIONS = 5000000
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_MIN_LOG_N = 14
+SCRYPT_MAX_LOG_N = 17
+# Headers asking for more than this are rejected rather than run: PBKDF2
+# iterations above the calibration ceiling, scrypt memory (128 * r * N)
+# above the calibration ceiling, or more scrypt lanes than SCRYPT_MAX_P
+SCRYPT_MAX_MEMORY = 128 * SCRYPT_R << SCRYPT_MAX_LOG_N
+SCRYPT_MAX_P = 16
+SALT_SIZE = 16
+NONCE_SIZE = 12
+
+# Keys of opened PIN-locked documents are kept this long while unused
+KEY_CACHE_SIZE = 16
+KEY_CACHE_IDLE_TIMEOUT = 120
+
+# Binary container: magic + version + KDF id + KDF cost + salt, followed
+# by nonce + raw ciphertext. The cost is the iteration count for PBKDF2 and
+# log2(N) << 16 | r << 8 | p for scrypt. Version 1 headers carried only the
+# salt. Blobs without the magic are the original salt + nonce + ciphertext.
+FORMAT_MAGIC = b"VNLT"
+FORMAT_VERSION = 2
+# A random data key has no KDF; its containers record a cost of 0
+KDF_DATA_KEY = 0
+KDF_PBKDF2_SHA256 = 1
+KDF_SCRYPT = 2
+DATA_KEY_SIZE = 32
+CONTAINER_HEADER = struct.Struct(f">4sBBI{SALT_SIZE}s")
+CONTAINER_HEADER_V1 = struct.Struct(f">4sB{SALT_SIZE}s")
+
+# Segmented stream (.venc v2): magic + version + salt + nonce prefix + chunk
+# size, then chunks each sealed under prefix + counter + final flag.
+STREAM_MAGIC = b"VENC"
+STREAM_VERSION = 2
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_PREFIX_SIZE = 7
+STREAM_HEADER = struct.Struct(f">4sB{SALT_SIZE}s{STREAM_PREFIX_SIZE}sI")
+TAG_SIZE = 16
+
+# Compressed payloads start with a codec byte. Compression happens before
+# encryption, so the codec byte and sizes inside are sealed with the data.
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZLIB_DICT = 2
+CODEC_LZMA = 3
+# lzma is only tried on payloads large enough to repay its cost
+LZMA_MIN_SIZE = 256 * 1024
+DICTIONARY_SIZE = 16 * 1024
+_DICTIONARY_TOKEN = re.compile(rb"\s*\S+")
+
+
+def _aesgcm(key: bytes):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(key)
 
 
 class EncryptionManager:
     """Handles AES-256-GCM encryption and decryption"""
     
     @staticmethod
-    def derive_key(password: str, salt: bytes) -> bytes:
+    def derive_key(password: str, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
         """Derive a 32-byte key from password using PBKDF2"""
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
-            iterations=100000,
+            iterations=iterations,
         )
         return kdf.derive(password.encode())
     
     @staticmethod
     def encrypt(data: str, password: str) -> str:
-        """Encrypt data with AES-256-GCM"""
+        """Encrypt data with AES-256-GCM in the original base64 format"""
         salt = os.urandom(16)
         key = EncryptionManager.derive_key(password, salt)
         
-        aesgcm = AESGCM(key)
+        aesgcm = _aesgcm(key)
         nonce = os.urandom(12)
         ciphertext = aesgcm.encrypt(nonce, data.encode(), None)
         
@@ -39,7 +111,7 @@ class EncryptionManager:
     
     @staticmethod
     def decrypt(encrypted_data: str, password: str) -> str:
-        """Decrypt data with AES-256-GCM"""
+        """Decrypt data with AES-256-GCM from the original base64 format"""
         encrypted_blob = base64.b64decode(encrypted_data)
         
         salt = encrypted_blob[:16]
@@ -47,11 +119,53 @@ class EncryptionManager:
         ciphertext = encrypted_blob[28:]
         
         key = EncryptionManager.derive_key(password, salt)
-        aesgcm = AESGCM(key)
+        aesgcm = _aesgcm(key)
         
         plaintext = aesgcm.decrypt(nonce, ciphertext, None)
         return plaintext.decode()
     
+    @staticmethod
+    def encrypt_bytes(data: bytes, password: str, kdf: "KDF" = None) -> bytes:
+        """Encrypt into the binary container with a fresh salt"""
+        vault_key = VaultKey.derive(password, kdf=kdf)
+        try:
+            return vault_key.encrypt(data, "data")
+        finally:
+            vault_key.zeroize()
+
+    @staticmethod
+    def decrypt_bytes(blob, password: str) -> bytes:
+        """Decrypt a binary container; accepts bytes, mmap or memoryview"""
+        vault_key = VaultKey.for_blob(password, blob)
+        try:
+            return vault_key.decrypt(blob, "data")
+        finally:
+            vault_key.zeroize()
+
+    @staticmethod
+    def encrypt_many(items, password: str, workers: int = None):
+        """Encrypt each bytes item into its own container, in parallel
+
+        Every container gets its own salt and key derivation, which is what
+        makes bulk work slow serially. Yields containers in input order.
+        """
+        return parallel_map(_encrypt_item, ((data, password) for data in items), workers)
+
+    @staticmethod
+    def decrypt_many(blobs, password: str, workers: int = None):
+        """Decrypt containers in parallel, yielding plaintexts in input order"""
+        return parallel_map(_decrypt_item, ((blob, password) for blob in blobs), workers)
+
+    @staticmethod
+    def armor(blob: bytes) -> str:
+        """Base64-encode a binary container for copy-paste transport"""
+        return base64.b64encode(blob).decode()
+
+    @staticmethod
+    def dearmor(text) -> bytes:
+        """Reverse armor()"""
+        return base64.b64decode(text)
+
     @staticmethod
     def hash_pin(pin: str) -> str:
         """Hash a PIN using SHA-256"""
@@ -61,3 +175,585 @@ class EncryptionManager:
     def generate_device_key() -> str:
         """Generate a random device key"""
         return base64.b64encode(os.urandom(32)).decode()
+
+
+class KDF:
+    """A password key derivation function and its cost parameters"""
+
+    NAMES = {KDF_PBKDF2_SHA256: "pbkdf2", KDF_SCRYPT: "scrypt"}
+
+    def __init__(self, kdf_id: int, cost: int):
+        if kdf_id not in self.NAMES or cost <= 0:
+            raise ValueError(f"Unsupported key derivation function {kdf_id}")
+        if kdf_id == KDF_PBKDF2_SHA256 and cost > PBKDF2_MAX_ITERATIONS:
+            raise ValueError("Unsupported PBKDF2 iteration count")
+        if kdf_id == KDF_SCRYPT:
+            log_n, r, p = cost >> 16, cost >> 8 & 0xFF, cost & 0xFF
+            if not (log_n >= 1 and r and 1 <= p <= SCRYPT_MAX_P and 128 * r << log_n <= SCRYPT_MAX_MEMORY):
+                raise ValueError("Unsupported scrypt parameters")
+        self.kdf_id = kdf_id
+        self.cost = cost
+
+    @classmethod
+    def pbkdf2(cls, iterations: int = PBKDF2_ITERATIONS) -> "KDF":
+        return cls(KDF_PBKDF2_SHA256, iterations)
+
+    @classmethod
+    def scrypt(cls, log_n: int = SCRYPT_MIN_LOG_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> "KDF":
+        return cls(KDF_SCRYPT, log_n << 16 | r << 8 | p)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KDF":
+        """Reverse to_dict()"""
+        if data["name"] == "scrypt":
+            return cls.scrypt(data["log_n"], data["r"], data["p"])
+        return cls.pbkdf2(data["iterations"])
+
+    def to_dict(self) -> dict:
+        """Readable form of the parameters, for settings files"""
+        if self.kdf_id == KDF_SCRYPT:
+            return {"name": "scrypt", "log_n": self.cost >> 16, "r": self.cost >> 8 & 0xFF, "p": self.cost & 0xFF}
+        return {"name": "pbkdf2", "iterations": self.cost}
+
+    def derive(self, password: str, salt: bytes) -> bytes:
+        """Derive a 32-byte key from password"""
+        params = self.to_dict()
+        with instrument.span(f"kdf.{params['name']}"):
+            if self.kdf_id == KDF_PBKDF2_SHA256:
+                return EncryptionManager.derive_key(password, salt, self.cost)
+            from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+            return Scrypt(salt=salt, length=32, n=2 ** params["log_n"], r=params["r"],
+                          p=params["p"]).derive(password.encode())
+
+    def __eq__(self, other):
+        return isinstance(other, KDF) and (self.kdf_id, self.cost) == (other.kdf_id, other.cost)
+
+    def __hash__(self):
+        return hash((self.kdf_id, self.cost))
+
+    def __repr__(self):
+        return f"KDF({self.to_dict()})"
+
+
+def _time_kdf(kdf: KDF) -> float:
+    start = time.perf_counter()
+    kdf.derive("calibration", os.urandom(SALT_SIZE))
+    return time.perf_counter() - start
+
+
+def calibrate_kdf(target: float = KDF_TARGET_SECONDS, algorithm: str = None) -> KDF:
+    """Benchmark this device and pick KDF parameters for an unlock of ~target s
+
+    scrypt is preferred since it is memory-hard; PBKDF2 is used where the
+    cryptography build lacks it or when asked for. Parameters are clamped
+    so that slow devices never drop below a minimum strength.
+    """
+    if algorithm in (None, "scrypt"):
+        try:
+            elapsed = _time_kdf(KDF.scrypt(SCRYPT_MIN_LOG_N))
+        except Exception:
+            if algorithm == "scrypt":
+                raise
+        else:
+            log_n = SCRYPT_MIN_LOG_N
+            while log_n < SCRYPT_MAX_LOG_N and elapsed * 2 <= target:
+                log_n += 1
+                elapsed *= 2
+            return KDF.scrypt(log_n)
+    probe = PBKDF2_MIN_ITERATIONS // 5
+    elapsed = _time_kdf(KDF.pbkdf2(probe))
+    iterations = int(probe * target / elapsed) // 1000 * 1000
+    return KDF.pbkdf2(max(PBKDF2_MIN_ITERATIONS, min(iterations, PBKDF2_MAX_ITERATIONS)))
+
+
+class VaultKey:
+    """Master key of an unlocked vault, derived once per session
+
+    The KDF runs only when the key is created. Every later encrypt or
+    decrypt uses an HKDF subkey for its purpose plus a fresh nonce, so a
+    save costs a single AES-GCM pass. Call zeroize() on lock or timeout.
+
+    A vault is encrypted under a random data key (generate()), which is
+    stored wrapped by a password-derived key (wrap() / unwrap()). Changing
+    the password only rewraps those 32 bytes.
+    """
+
+    def __init__(self, master_key: bytes, salt: bytes, idle_timeout: float = None, kdf: KDF = None):
+        self._master = bytearray(master_key)
+        self._ciphers = {}
+        self.salt = salt
+        self.kdf = kdf
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+
+    @classmethod
+    def generate(cls, idle_timeout: float = None) -> "VaultKey":
+        """Create a random data key; it has no KDF"""
+        return cls(os.urandom(DATA_KEY_SIZE), os.urandom(SALT_SIZE), idle_timeout)
+
+    @classmethod
+    def unwrap(cls, blob, password: str, idle_timeout: float = None) -> "VaultKey":
+        """Recover a data key from the blob written by wrap()"""
+        wrapping_key = cls.for_blob(password, blob)
+        try:
+            plaintext = bytearray(wrapping_key.decrypt(blob, "wrap"))
+        finally:
+            wrapping_key.zeroize()
+        data_key = cls(plaintext[SALT_SIZE:], bytes(plaintext[:SALT_SIZE]), idle_timeout)
+        plaintext[:] = bytes(len(plaintext))
+        return data_key
+
+    def wrap(self, password: str, kdf: KDF = None) -> bytes:
+        """Encrypt this data key under a key derived from password"""
+        if self.kdf is not None:
+            raise ValueError("Only data keys can be wrapped")
+        wrapping_key = VaultKey.derive(password, kdf=kdf)
+        try:
+            return wrapping_key.encrypt(self.salt + bytes(self._master), "wrap")
+        finally:
+            wrapping_key.zeroize()
+
+    @classmethod
+    def derive(cls, password: str, salt: bytes = None, idle_timeout: float = None,
+               kdf: KDF = None) -> "VaultKey":
+        """Run the KDF (PBKDF2 by default) once and hold the result as a session key"""
+        if salt is None:
+            salt = os.urandom(SALT_SIZE)
+        if kdf is None:
+            kdf = KDF.pbkdf2()
+        return cls(kdf.derive(password, salt), salt, idle_timeout, kdf)
+
+    @classmethod
+    def for_blob(cls, password: str, blob, idle_timeout: float = None) -> "VaultKey":
+        """Derive the key matching the KDF parameters in a container header"""
+        header = cls.read_header(blob)
+        if header is None:
+            raise ValueError("Not a versioned container")
+        salt, kdf, _ = header
+        if kdf is None:
+            raise ValueError("Container is encrypted with a data key, not a password")
+        return cls.derive(password, salt, idle_timeout, kdf)
+
+    @property
+    def active(self) -> bool:
+        return any(self._master)
+
+    @property
+    def expired(self) -> bool:
+        """True once the key is zeroized or idle for longer than idle_timeout"""
+        if not self.active:
+            return True
+        if self.idle_timeout is None:
+            return False
+        return time.monotonic() - self.last_used > self.idle_timeout
+
+    def touch(self):
+        """Reset the idle timer"""
+        self.last_used = time.monotonic()
+
+    def subkey(self, purpose: str) -> bytes:
+        """Derive a 32-byte subkey bound to a purpose label with HKDF"""
+        if not self.active:
+            raise ValueError("Vault key has been zeroized")
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=self.salt,
+            info=b"vaultnote/" + purpose.encode(),
+        )
+        return hkdf.derive(bytes(self._master))
+
+    def _cipher(self, purpose: str):
+        cipher = self._ciphers.get(purpose)
+        if cipher is None:
+            cipher = _aesgcm(self.subkey(purpose))
+            self._ciphers[purpose] = cipher
+        self.touch()
+        return cipher
+
+    def header(self) -> bytes:
+        kdf_id, cost = (KDF_DATA_KEY, 0) if self.kdf is None else (self.kdf.kdf_id, self.kdf.cost)
+        return CONTAINER_HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, kdf_id, cost, self.salt)
+
+    def encrypt(self, data: bytes, purpose: str = "vault") -> bytes:
+        """Encrypt into the versioned container using the session key"""
+        header = self.header()
+        nonce = os.urandom(NONCE_SIZE)
+        with instrument.span("aead.encrypt", len(data)):
+            return header + nonce + self._cipher(purpose).encrypt(nonce, data, header)
+
+    def decrypt(self, blob, purpose: str = "vault") -> bytes:
+        """Decrypt a versioned container written with this session's salt
+
+        blob may be bytes, an mmap or a memoryview; the ciphertext is passed
+        to AES-GCM as a view, without an intermediate copy.
+        """
+        header = self.read_header(blob)
+        if header is None or (header[0], header[1]) != (self.salt, self.kdf):
+            raise ValueError("Container was not written with this vault key")
+        view = memoryview(blob)
+        size = header[2]
+        nonce = view[size:size + NONCE_SIZE]
+        with instrument.span("aead.decrypt", len(view)):
+            return self._cipher(purpose).decrypt(nonce, view[size + NONCE_SIZE:], view[:size])
+
+    def encrypt_record(self, data: bytes, aad: bytes, purpose: str) -> bytes:
+        """Seal a record as nonce + ciphertext, bound to aad"""
+        nonce = os.urandom(NONCE_SIZE)
+        with instrument.span("aead.seal_record", len(data)):
+            return nonce + self._cipher(purpose).encrypt(nonce, data, aad)
+
+    def decrypt_record(self, sealed: bytes, aad: bytes, purpose: str) -> bytes:
+        """Open a record sealed by encrypt_record"""
+        with instrument.span("aead.open_record", len(sealed)):
+            return self._cipher(purpose).decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], aad)
+
+    def zeroize(self):
+        """Wipe the master key and drop every cached cipher"""
+        for i in range(len(self._master)):
+            self._master[i] = 0
+        self._ciphers.clear()
+
+    @staticmethod
+    def read_header(blob):
+        """Parse a container header into (salt, KDF, header size)
+
+        The KDF is None for containers written with a data key. Returns
+        None for a legacy blob without the magic.
+        """
+        if bytes(blob[:len(FORMAT_MAGIC)]) != FORMAT_MAGIC or len(blob) < CONTAINER_HEADER_V1.size:
+            return None
+        version = blob[len(FORMAT_MAGIC)]
+        if version == 1:
+            _, _, salt = CONTAINER_HEADER_V1.unpack_from(blob)
+            return salt, KDF.pbkdf2(), CONTAINER_HEADER_V1.size
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported container version {version}")
+        _, _, kdf_id, cost, salt = CONTAINER_HEADER.unpack_from(blob)
+        if (kdf_id, cost) == (KDF_DATA_KEY, 0):
+            return salt, None, CONTAINER_HEADER.size
+        return salt, KDF(kdf_id, cost), CONTAINER_HEADER.size
+
+    @staticmethod
+    def read_salt(blob):
+        """Return the salt of a versioned container, or None for a legacy blob"""
+        header = VaultKey.read_header(blob)
+        return None if header is None else header[0]
+
+
+class RecordOpener:
+    """Opens records sealed by VaultKey.encrypt_record() for one purpose
+
+    It holds only the HKDF subkey of that purpose, so worker processes can
+    check records without being handed the vault's data key.
+    """
+
+    def __init__(self, subkey: bytes):
+        self._cipher = _aesgcm(subkey)
+
+    def open(self, sealed, aad: bytes) -> bytes:
+        return self._cipher.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], aad)
+
+
+class KeyCache:
+    """Bounded LRU of derived document keys that expire when idle
+
+    Keys are VaultKeys with the cache's idle timeout. A key that expires,
+    is evicted or is cleared gets zeroized. get() only returns a key for
+    the PIN it was derived from, checked by an HMAC under a random secret
+    held for the life of the cache, so no PIN or PIN hash is kept.
+    """
+
+    def __init__(self, capacity: int = KEY_CACHE_SIZE, idle_timeout: float = KEY_CACHE_IDLE_TIMEOUT):
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _tag(self, pin: str) -> bytes:
+        return hmac.new(self._secret, pin.encode(), hashlib.sha256).digest()
+
+    def get(self, name: str, pin: str):
+        """Return the cached key for name if pin matches, else None"""
+        self.evict_expired()
+        entry = self._entries.get(name)
+        if entry is None or not hmac.compare_digest(entry[1], self._tag(pin)):
+            return None
+        self._entries.move_to_end(name)
+        entry[0].touch()
+        return entry[0]
+
+    def put(self, name: str, key: "VaultKey", pin: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None and entry[0] is not key:
+            entry[0].zeroize()
+        key.idle_timeout = self.idle_timeout
+        key.touch()
+        self._entries[name] = (key, self._tag(pin))
+        while len(self._entries) > self.capacity:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            evicted.zeroize()
+
+    def discard(self, name: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            entry[0].zeroize()
+
+    def evict_expired(self):
+        """Zeroize and drop every key idle for longer than the timeout"""
+        for name in [name for name, (key, _) in self._entries.items() if key.expired]:
+            self.discard(name)
+
+    def clear(self):
+        for key, _ in self._entries.values():
+            key.zeroize()
+        self._entries.clear()
+
+
+class StreamEncryptor:
+    """Encrypt a byte stream into fixed-size chunks with constant memory
+
+    Each chunk is sealed with AES-GCM under a nonce built from a random
+    prefix, the chunk counter and a final-chunk flag, so reordering,
+    dropping or truncating chunks fails authentication.
+    """
+
+    def __init__(self, dst, password: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        salt = os.urandom(SALT_SIZE)
+        self._prefix = os.urandom(STREAM_PREFIX_SIZE)
+        self._header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, salt, self._prefix, chunk_size)
+        self._key = VaultKey.derive(password, salt)
+        self._cipher = _aesgcm(self._key.subkey("stream"))
+        self._dst = dst
+        self._buffer = bytearray()
+        self._counter = 0
+        self.chunk_size = chunk_size
+        dst.write(self._header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._key.zeroize()
+
+    def write(self, data: bytes):
+        """Buffer data and emit every full chunk except the last one"""
+        self._buffer += data
+        while len(self._buffer) > self.chunk_size:
+            self._seal(bytes(self._buffer[:self.chunk_size]), final=False)
+            del self._buffer[:self.chunk_size]
+
+    def close(self):
+        """Seal the remaining bytes as the final chunk"""
+        self._seal(bytes(self._buffer), final=True)
+        self._buffer.clear()
+        self._key.zeroize()
+
+    def _seal(self, chunk: bytes, final: bool):
+        nonce = _stream_nonce(self._prefix, self._counter, final)
+        self._dst.write(self._cipher.encrypt(nonce, chunk, self._header))
+        self._counter += 1
+
+
+def _stream_nonce(prefix: bytes, counter: int, final: bool) -> bytes:
+    if counter >= 2 ** 32:
+        raise ValueError("Stream has too many chunks")
+    return prefix + struct.pack(">IB", counter, 1 if final else 0)
+
+
+def is_stream(header: bytes) -> bool:
+    """True if the bytes start with a segmented stream header"""
+    return header[:len(STREAM_MAGIC)] == STREAM_MAGIC and header[len(STREAM_MAGIC):len(STREAM_MAGIC) + 1] == bytes([STREAM_VERSION])
+
+
+def iter_decrypt_stream(src, password: str):
+    """Yield plaintext chunks of a segmented stream read from src
+
+    A chunk is only yielded once its tag verifies. A truncated stream raises
+    on the last chunk read, so callers must discard partial output on error.
+    """
+    header = src.read(STREAM_HEADER.size)
+    if not is_stream(header) or len(header) != STREAM_HEADER.size:
+        raise ValueError("Not a segmented stream")
+    _, _, salt, prefix, chunk_size = STREAM_HEADER.unpack(header)
+    key = VaultKey.derive(password, salt)
+    try:
+        cipher = _aesgcm(key.subkey("stream"))
+    finally:
+        key.zeroize()
+    counter = 0
+    chunk = src.read(chunk_size + TAG_SIZE)
+    while True:
+        following = src.read(chunk_size + TAG_SIZE)
+        final = not following
+        yield cipher.decrypt(_stream_nonce(prefix, counter, final), chunk, header)
+        if final:
+            return
+        chunk = following
+        counter += 1
+
+
+def scan_stream(src, password: str):
+    """Check the tag of every chunk of a segmented stream read from src
+
+    Unlike iter_decrypt_stream(), a bad chunk does not stop the scan.
+    Returns (chunks, damaged), where damaged lists (chunk number, byte
+    offset, length) of each chunk that fails. The header is bound to every
+    chunk, so a damaged header (or a wrong password) fails them all.
+    """
+    header = src.read(STREAM_HEADER.size)
+    if not is_stream(header) or len(header) != STREAM_HEADER.size:
+        raise ValueError("Not a segmented stream")
+    _, _, salt, prefix, chunk_size = STREAM_HEADER.unpack(header)
+    key = VaultKey.derive(password, salt)
+    try:
+        cipher = _aesgcm(key.subkey("stream"))
+    finally:
+        key.zeroize()
+    damaged = []
+    counter = 0
+    offset = STREAM_HEADER.size
+    chunk = src.read(chunk_size + TAG_SIZE)
+    while True:
+        following = src.read(chunk_size + TAG_SIZE)
+        final = not following
+        try:
+            cipher.decrypt(_stream_nonce(prefix, counter, final), chunk, header)
+        except Exception:
+            damaged.append((counter, offset, len(chunk)))
+        if final:
+            return counter + 1, damaged
+        offset += len(chunk)
+        chunk = following
+        counter += 1
+
+
+def encrypt_stream(src, dst, password: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Encrypt everything readable from src into dst"""
+    with StreamEncryptor(dst, password, chunk_size) as encryptor:
+        while True:
+            data = src.read(chunk_size)
+            if not data:
+                break
+            encryptor.write(data)
+
+
+def decrypt_stream(src, dst, password: str):
+    """Decrypt a segmented stream from src into dst"""
+    for chunk in iter_decrypt_stream(src, password):
+        dst.write(chunk)
+
+
+def _encrypt_item(args) -> bytes:
+    return EncryptionManager.encrypt_bytes(*args)
+
+
+def _decrypt_item(args) -> bytes:
+    return EncryptionManager.decrypt_bytes(*args)
+
+
+def parallel_map(fn, items, workers: int = None):
+    """Yield fn(item) for every item, in order, using worker processes
+
+    Only a few items per worker are in flight at once, so results stream
+    out while later items are still being produced. Threads are used where
+    processes are unavailable (Android has no sem_open), and with a single
+    worker everything runs inline. fn must be a module-level function.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    try:
+        executor = ProcessPoolExecutor(workers)
+    except (ImportError, NotImplementedError, OSError):
+        executor = ThreadPoolExecutor(workers)
+    with executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def compress_payload(data: bytes, dictionary: bytes = None, dictionary_id: int = 0,
+                     level: int = zlib.Z_DEFAULT_COMPRESSION) -> bytes:
+    """Compress data behind a codec byte, or store it raw if that is smaller
+
+    With a dictionary, zlib is primed with it and the dictionary id is
+    stored after the codec byte so the reader can pick the same one.
+    """
+    data = bytes(data)
+    with instrument.span("compress", len(data)):
+        return _compress_payload(data, dictionary, dictionary_id, level)
+
+
+def _compress_payload(data: bytes, dictionary: bytes, dictionary_id: int, level: int) -> bytes:
+    best = bytes([CODEC_RAW]) + data
+    if dictionary:
+        compressor = zlib.compressobj(level, zdict=dictionary)
+        candidate = bytes([CODEC_ZLIB_DICT, dictionary_id]) + compressor.compress(data) + compressor.flush()
+    else:
+        candidate = bytes([CODEC_ZLIB]) + zlib.compress(data, level)
+    if len(candidate) < len(best):
+        best = candidate
+    if len(data) >= LZMA_MIN_SIZE:
+        import lzma
+        candidate = bytes([CODEC_LZMA]) + lzma.compress(data, preset=2)
+        if len(candidate) < len(best):
+            best = candidate
+    return best
+
+
+def decompress_payload(payload, dictionaries: list = ()) -> bytes:
+    """Reverse compress_payload()"""
+    with instrument.span("decompress", len(payload)):
+        return _decompress_payload(payload, dictionaries)
+
+
+def _decompress_payload(payload, dictionaries: list) -> bytes:
+    codec = payload[0]
+    if codec == CODEC_RAW:
+        return bytes(payload[1:])
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload[1:])
+    if codec == CODEC_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=dictionaries[payload[1]])
+        return decompressor.decompress(payload[2:]) + decompressor.flush()
+    if codec == CODEC_LZMA:
+        import lzma
+        return lzma.decompress(payload[1:])
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+def train_dictionary(samples: list, size: int = DICTIONARY_SIZE) -> bytes:
+    """Build a zlib preset dictionary from sample payloads
+
+    Words (with their leading whitespace) that recur across samples are
+    kept, weighted by how many samples contain them and by length. The
+    most valuable ones go last, where zlib reaches them with the shortest
+    distances.
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(_DICTIONARY_TOKEN.findall(sample)))
+    picked = []
+    total = 0
+    for token, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        if total + len(token) <= size:
+            picked.append(token)
+            total += len(token)
+    return b"".join(reversed(picked))
@@ -0,0 +1,206 @@
+"""
+VaultNote Instrumentation
+Timing spans and counters for the crypto, vault and UI layers (no GUI dependencies)
+
+Recording is off until enable() is given a sink. While it is off, span()
+hands back one shared no-op context manager and count() returns at once,
+so instrumented hot paths pay a function call and nothing else.
+
+Each event is a dict: {"name", "seconds", "bytes"} for a span and
+{"name", "count"} for a counter, plus "time" (epoch seconds). summarize()
+turns a list of events into per-operation latency percentiles and byte
+totals.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+RING_BUFFER_EVENTS = 10000
+PERCENTILES = (50, 90, 99)
+
+_sink = None
+
+
+class _NullSpan:
+    """Span used while recording is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, nbytes: int):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times a block and reports it to the sink on exit"""
+
+    def __init__(self, sink, name: str, nbytes: int):
+        self._sink = sink
+        self.name = name
+        self.nbytes = nbytes
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self._sink.emit({"name": self.name, "seconds": elapsed, "bytes": self.nbytes, "time": time.time()})
+        return False
+
+    def add(self, nbytes: int):
+        """Count bytes only known once the work is done"""
+        self.nbytes += nbytes
+
+
+def enable(sink):
+    """Start sending events to sink"""
+    global _sink
+    _sink = sink
+
+
+def disable():
+    """Stop recording; the previous sink is returned and left open"""
+    global _sink
+    sink, _sink = _sink, None
+    return sink
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+def span(name: str, nbytes: int = 0):
+    """Context manager timing the enclosed block as one operation"""
+    sink = _sink
+    if sink is None:
+        return _NULL_SPAN
+    return Span(sink, name, nbytes)
+
+
+def count(name: str, value: int = 1):
+    """Record a counter increment, such as a cache hit"""
+    sink = _sink
+    if sink is not None:
+        sink.emit({"name": name, "count": value, "time": time.time()})
+
+
+class RingBufferSink:
+    """Keeps the most recent events in memory"""
+
+    def __init__(self, capacity: int = RING_BUFFER_EVENTS):
+        self._events = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, event: dict):
+        with self._lock:
+            self._events.append(event)
+
+    def events(self) -> list:
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+class JsonLinesSink:
+    """Appends one JSON object per event to a file, for field reports"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, event: dict):
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+class LogSink:
+    """Writes events through logging; on Android, Kivy routes this to logcat"""
+
+    def __init__(self, logger: str = "vaultnote.perf"):
+        import logging
+        self._logger = logging.getLogger(logger)
+
+    def emit(self, event: dict):
+        if "seconds" in event:
+            self._logger.info("%s %.3f ms %d bytes", event["name"], event["seconds"] * 1000, event["bytes"])
+        else:
+            self._logger.info("%s +%d", event["name"], event["count"])
+
+
+def read_events(path: str) -> list:
+    """Load the events of a JsonLinesSink file, skipping a torn last line"""
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def _percentile(ordered: list, percent: int) -> float:
+    rank = max(0, -(-percent * len(ordered) // 100) - 1)
+    return ordered[rank]
+
+
+def summarize(events: list) -> dict:
+    """Aggregate events per name
+
+    Spans give count, p50/p90/p99/max and total seconds, and total bytes;
+    counters give their total.
+    """
+    timings = {}
+    totals = {}
+    for event in events:
+        if "seconds" in event:
+            entry = timings.setdefault(event["name"], ([], [0]))
+            entry[0].append(event["seconds"])
+            entry[1][0] += event.get("bytes", 0)
+        else:
+            totals[event["name"]] = totals.get(event["name"], 0) + event["count"]
+    summary = {}
+    for name, (seconds, nbytes) in timings.items():
+        seconds.sort()
+        summary[name] = {"count": len(seconds), "total": sum(seconds), "max": seconds[-1], "bytes": nbytes[0]}
+        for percent in PERCENTILES:
+            summary[name][f"p{percent}"] = _percentile(seconds, percent)
+    for name, total in totals.items():
+        summary[name] = {"count": total}
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """Render a summarize() result as a table, slowest operations first"""
+    spans = sorted((item for item in summary.items() if "total" in item[1]),
+                   key=lambda item: item[1]["total"], reverse=True)
+    lines = [f"{'operation':28} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'bytes':>12}"]
+    for name, entry in spans:
+        lines.append(
+            f"{name:28} {entry['count']:7} {entry['p50'] * 1000:9.2f} {entry['p90'] * 1000:9.2f} "
+            f"{entry['p99'] * 1000:9.2f} {entry['max'] * 1000:9.2f} {entry['bytes']:12}"
+        )
+    counters = sorted((name, entry["count"]) for name, entry in summary.items() if "total" not in entry)
+    if counters:
+        lines.append("")
+        lines.extend(f"{name:28} {total:7}" for name, total in counters)
+    return "\n".join(lines)
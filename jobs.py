@@ -0,0 +1,143 @@
+"""
+VaultNote Background Jobs
+Thread pool for key derivation, encryption and file I/O (no GUI dependencies)
+
+Work runs on worker threads and its results are handed back through a
+dispatch function, which the app sets to Kivy's Clock.schedule_once so
+callbacks always run on the UI thread. Jobs that share a serial key (the
+vault directory) go through a single writer thread, so saves run strictly
+in submission order and never interleave. Low-priority jobs (such as an
+integrity scrub) run one at a time on a thread with the lowest CPU
+priority the OS allows, so they only use time the app leaves idle.
+"""
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+
+def _lower_priority():
+    """Drop the calling thread to the lowest CPU priority, where the OS allows it"""
+    try:
+        # On Linux and Android, a thread id given as PRIO_PROCESS affects that thread only
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that noticed its cancellation"""
+
+
+class Job:
+    """Handle for one submitted job"""
+
+    def __init__(self, runner: "JobRunner", on_progress=None):
+        self.future = None
+        self._runner = runner
+        self._on_progress = on_progress
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the job to stop; a job that has not started never runs"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Raise JobCancelled if the job was cancelled; call between steps"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, fraction: float):
+        """Report progress in [0, 1] to the UI thread"""
+        if self._on_progress is not None:
+            self._runner.dispatch(lambda: self._on_progress(fraction))
+
+
+class JobRunner:
+    """Thread pool that returns futures and delivers results via dispatch"""
+
+    def __init__(self, max_workers: int = 2, dispatch=None, on_busy=None):
+        self.dispatch = dispatch or (lambda callback: callback())
+        self.on_busy = on_busy
+        self.pending = 0
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="vaultnote")
+        self._lock = threading.Lock()
+        self._writers = {}
+        self._idle = None
+        self._jobs = set()
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, serial=None,
+               low_priority: bool = False) -> Job:
+        """Run fn(job, *args) on a worker thread
+
+        on_done(result) or on_error(exception) is dispatched when it
+        finishes; neither is called for a cancelled job. Jobs submitted with
+        the same serial key run one after another in submission order.
+        low_priority jobs run one after another on a low-priority thread.
+        """
+        job = Job(self, on_progress)
+        with self._lock:
+            executor = self._idle_executor() if low_priority else self._executor(serial)
+            job.future = executor.submit(self._run, job, fn, args)
+            self._jobs.add(job)
+            self.pending += 1
+        self._notify_busy()
+        job.future.add_done_callback(lambda future: self._finish(job, on_done, on_error))
+        return job
+
+    def cancel_all(self):
+        """Cancel every job that is queued or running"""
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs; queued writes still run unless cancelled"""
+        for executor in [self._pool, *self._writers.values(), *filter(None, [self._idle])]:
+            executor.shutdown(wait=wait)
+
+    def _executor(self, serial):
+        if serial is None:
+            return self._pool
+        writer = self._writers.get(serial)
+        if writer is None:
+            writer = ThreadPoolExecutor(1, thread_name_prefix="vaultnote-writer")
+            self._writers[serial] = writer
+        return writer
+
+    def _idle_executor(self):
+        if self._idle is None:
+            # The thread is lowered once: raising it back would need privileges
+            self._idle = ThreadPoolExecutor(1, thread_name_prefix="vaultnote-idle", initializer=_lower_priority)
+        return self._idle
+
+    def _run(self, job: Job, fn, args):
+        job.check()
+        return fn(job, *args)
+
+    def _finish(self, job: Job, on_done, on_error):
+        with self._lock:
+            self._jobs.discard(job)
+            self.pending -= 1
+        self._notify_busy()
+        try:
+            result = job.future.result()
+        except (CancelledError, JobCancelled):
+            return
+        except Exception as e:
+            if on_error is not None:
+                self.dispatch(lambda error=e: on_error(error))
+            return
+        if on_done is not None:
+            self.dispatch(lambda: on_done(result))
+
+    def _notify_busy(self):
+        if self.on_busy is not None:
+            pending = self.pending
+            self.dispatch(lambda: self.on_busy(pending))
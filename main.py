@@ -1,65 +1,37 @@
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
+from kivy.uix.progressbar import ProgressBar
+from kivy.uix.spinner import Spinner
 from kivy.uix.filechooser import FileChooserListView
-import hashlib
-import json
 import os
-import base64
 from datetime import datetime
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import instrument
+import scrub
+import vault
+from catalog import PAGE_SIZE, Catalog
+from jobs import JobRunner
+from search import SearchIndex, note_stamp
+from settings import SettingsError, change_vault_pin, check_pin, device_kdf, diagnostics_sink, settings_store
 # PDF/DOCX support removed for Android compatibility
 # import PyPDF2
 # from docx import Document
 
-VAULT_PATH = "vault_data.enc"
-SETTINGS_PATH = "vault_settings.json"
-
-class EncryptionManager:
-    @staticmethod
-    def derive_key(password, salt):
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        return kdf.derive(password.encode())
-    
-    @staticmethod
-    def encrypt_data(data, password):
-        salt = os.urandom(16)
-        key = EncryptionManager.derive_key(password, salt)
-        aesgcm = AESGCM(key)
-        nonce = os.urandom(12)
-        ciphertext = aesgcm.encrypt(nonce, data.encode(), None)
-        encrypted_package = salt + nonce + ciphertext
-        return base64.b64encode(encrypted_package).decode()
-    
-    @staticmethod
-    def decrypt_data(encrypted_data, password):
-        try:
-            encrypted_package = base64.b64decode(encrypted_data.encode())
-            salt = encrypted_package[:16]
-            nonce = encrypted_package[16:28]
-            ciphertext = encrypted_package[28:]
-            key = EncryptionManager.derive_key(password, salt)
-            aesgcm = AESGCM(key)
-            plaintext = aesgcm.decrypt(nonce, ciphertext, None)
-            return plaintext.decode()
-        except Exception:
-            return None
-
-def hash_pin(pin):
-    return hashlib.sha256(pin.encode()).hexdigest()
+VAULT_IDLE_TIMEOUT = 300
+# Saves within this many seconds share one index write
+VAULT_COMMIT_DELAY = 2
+# Note list sort choices: label -> (catalog order, reversed)
+SORT_CHOICES = {'Added': ('added', False), 'Title': ('title', False),
+                'Newest': ('timestamp', True), 'Oldest': ('timestamp', False)}
+FILTER_CHOICES = {'All': None, 'Locked': True, 'Unlocked': False}
 
 def show_popup(title, message):
     layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
@@ -85,54 +57,52 @@ def show_pin_prompt(callback, title="Enter PIN"):
     popup = Popup(title=title, content=box, size_hint=(0.75, 0.4))
     popup.open()
 
-def load_settings():
-    if not os.path.exists(SETTINGS_PATH):
-        device_key = base64.b64encode(os.urandom(32)).decode()
-        settings = {
-            "vault_locked": False,
-            "vault_pin_hash": None,
-            "device_key": device_key
-        }
-        save_settings(settings)
-        return settings
-    try:
-        with open(SETTINGS_PATH, "r") as f:
-            settings = json.load(f)
-            if "device_key" not in settings:
-                settings["device_key"] = base64.b64encode(os.urandom(32)).decode()
-                save_settings(settings)
-            return settings
-    except:
-        device_key = base64.b64encode(os.urandom(32)).decode()
-        return {"vault_locked": False, "vault_pin_hash": None, "device_key": device_key}
-
-def save_settings(settings):
-    with open(SETTINGS_PATH, "w") as f:
-        json.dump(settings, f)
-
-def load_vault(password):
-    if not os.path.exists(VAULT_PATH):
-        return [], True
-    try:
-        with open(VAULT_PATH, "r") as f:
-            encrypted_data = f.read()
-        decrypted = EncryptionManager.decrypt_data(encrypted_data, password)
-        if decrypted:
-            return json.loads(decrypted), True
-        return [], False
-    except:
-        return [], False
-
-def save_vault(notes, password):
-    data = json.dumps(notes)
-    encrypted_data = EncryptionManager.encrypt_data(data, password)
-    with open(VAULT_PATH, "w") as f:
-        f.write(encrypted_data)
+def open_vault(password):
+    # Runs on a worker thread, so first-launch KDF calibration doesn't block the UI
+    kdf = device_kdf(settings_store().snapshot())
+    return vault.open_vault(password, idle_timeout=VAULT_IDLE_TIMEOUT, lazy=True,
+                            commit_delay=VAULT_COMMIT_DELAY, kdf=kdf)
+
+class NoteRow(RecycleDataViewBehavior, Button):
+    index = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.note_list = rv
+        return super().refresh_view_attrs(rv, index, data)
+
+    def on_press(self):
+        self.note_list.select_row(self.index)
+
+class NoteList(RecycleView):
+    """Recycled note list: only rows in view get widgets, and pages load as it scrolls to the end"""
+    def __init__(self, select_row, load_more, **kwargs):
+        super().__init__(**kwargs)
+        self.select_row = select_row
+        self.load_more = load_more
+        self.bind(scroll_y=lambda instance, value: value <= 0 and self.load_more())
+        self.viewclass = NoteRow
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, 40),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+            spacing=10
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+
+    @staticmethod
+    def row(note):
+        label = note['title']
+        if note.get('locked'):
+            label += " 🔒"
+        return {'text': label, 'note_id': note['id']}
 
 class UnlockScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.settings = load_settings()
+        self.settings = settings_store()
         
         layout = BoxLayout(orientation='vertical', padding=20, spacing=20)
         layout.add_widget(Label(text='VaultNote', font_size=32))
@@ -151,7 +121,7 @@ class UnlockScreen(Screen):
         layout.add_widget(unlock_btn)
         
         self.add_widget(layout)
-    
+
     def unlock_vault(self, instance):
         if not self.settings.get("vault_locked"):
             self.manager.vault_password = self.settings["device_key"]
@@ -159,7 +129,7 @@ class UnlockScreen(Screen):
             return
         
         entered_pin = self.pin_input.text
-        if hash_pin(entered_pin) == self.settings.get("vault_pin_hash"):
+        if check_pin(self.settings, entered_pin):
             self.manager.vault_password = entered_pin
             self.manager.current = 'vault'
         else:
@@ -169,8 +139,14 @@ class UnlockScreen(Screen):
 class VaultScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.notes = []
-        self.selected_index = None
+        self.catalog = Catalog()
+        self.page_cursor = None
+        self.selected_id = None
+        self.idle_event = None
+        self.export_job = None
+        self.scrub_job = None
+        self.search_index = None
+        self.opened_note = None
 
         self.layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
@@ -178,13 +154,28 @@ class VaultScreen(Screen):
         settings_btn = Button(text='Vault Settings', size_hint_x=0.7)
         settings_btn.bind(on_press=self.open_vault_settings)
         top_bar.add_widget(settings_btn)
+        self.busy_label = Label(text='', size_hint_x=0.3)
+        top_bar.add_widget(self.busy_label)
         self.layout.add_widget(top_bar)
+
+        self.progress_bar = ProgressBar(max=1, value=0, size_hint_y=None, height=10, opacity=0)
+        self.layout.add_widget(self.progress_bar)
         
-        self.scroll = ScrollView(size_hint=(1, 0.3))
-        self.note_list = GridLayout(cols=1, size_hint_y=None, spacing=10)
-        self.note_list.bind(minimum_height=self.note_list.setter('height'))
-        self.scroll.add_widget(self.note_list)
-        self.layout.add_widget(self.scroll)
+        self.search_input = TextInput(hint_text="Search", multiline=False, size_hint_y=None, height=40)
+        self.search_input.bind(text=lambda instance, text: self.apply_search())
+        self.layout.add_widget(self.search_input)
+
+        view_bar = BoxLayout(size_hint_y=None, height=40, spacing=10)
+        self.sort_spinner = Spinner(text='Added', values=list(SORT_CHOICES))
+        self.filter_spinner = Spinner(text='All', values=list(FILTER_CHOICES))
+        self.sort_spinner.bind(text=lambda instance, text: self.apply_search())
+        self.filter_spinner.bind(text=lambda instance, text: self.apply_search())
+        view_bar.add_widget(self.sort_spinner)
+        view_bar.add_widget(self.filter_spinner)
+        self.layout.add_widget(view_bar)
+
+        self.note_list = NoteList(self.select_row, self.next_page, size_hint=(1, 0.3))
+        self.layout.add_widget(self.note_list)
 
         self.title_input = TextInput(hint_text="Title", multiline=False, size_hint_y=None, height=50)
         self.content_input = TextInput(hint_text="Content", multiline=True, size_hint_y=0.25)
@@ -200,63 +191,232 @@ class VaultScreen(Screen):
         new_btn = Button(text="New")
         import_btn = Button(text="Import")
         export_btn = Button(text="Export")
+        history_btn = Button(text="History")
 
         save_btn.bind(on_press=self.save_note)
         delete_btn.bind(on_press=self.delete_note)
         new_btn.bind(on_press=self.new_note)
         import_btn.bind(on_press=self.import_file)
         export_btn.bind(on_press=self.export_document)
+        history_btn.bind(on_press=self.show_history)
 
         btn_layout.add_widget(save_btn)
         btn_layout.add_widget(delete_btn)
         btn_layout.add_widget(new_btn)
         btn_layout.add_widget(import_btn)
         btn_layout.add_widget(export_btn)
+        btn_layout.add_widget(history_btn)
 
         self.layout.add_widget(btn_layout)
         self.add_widget(self.layout)
 
     def on_enter(self):
+        self.idle_event = Clock.schedule_interval(self.check_idle, 15)
+        store = getattr(self.manager, 'vault_store', None)
+        if store is not None and not store.key.expired:
+            return
+
         vault_password = getattr(self.manager, 'vault_password', None)
         if not vault_password:
-            settings = load_settings()
-            vault_password = settings["device_key"]
+            vault_password = settings_store()["device_key"]
             self.manager.vault_password = vault_password
         
-        notes, success = load_vault(vault_password)
+        self.manager.jobs.submit(
+            lambda job: open_vault(vault_password),
+            on_done=self.on_vault_opened,
+            on_error=lambda e: self.on_vault_opened((None, [], False)),
+        )
+
+    def on_vault_opened(self, result):
+        store, notes, success = result
+        self.manager.vault_store = store
         if success:
-            self.notes = notes
+            self.catalog = Catalog(notes)
             self.refresh_note_list()
+            self.reindex_search()
         else:
             show_popup("Error", "Failed to load vault. Wrong password or corrupted data.")
-            self.notes = []
+            self.catalog = Catalog()
             self.refresh_note_list()
 
-    def refresh_note_list(self):
-        self.note_list.clear_widgets()
-        for i, note in enumerate(self.notes):
-            label = note['title']
-            if note.get('locked'):
-                label += " 🔒"
-            btn = Button(text=label, size_hint_y=None, height=40)
-            btn.bind(on_press=lambda instance, idx=i: self.select_note(idx))
-            self.note_list.add_widget(btn)
-
-    def select_note(self, index):
-        note = self.notes[index]
+    def on_busy(self, pending):
+        self.busy_label.text = 'Working...' if pending else ''
+        if not pending:
+            self.progress_bar.opacity = 0
+
+    def on_progress(self, fraction):
+        self.progress_bar.opacity = 1
+        self.progress_bar.value = fraction
+
+    def on_leave(self):
+        if self.idle_event is not None:
+            self.idle_event.cancel()
+            self.idle_event = None
+
+    def check_idle(self, dt):
+        store = getattr(self.manager, 'vault_store', None)
+        if store is not None and store.key.expired:
+            self.lock_vault()
+        else:
+            if store is not None:
+                store.document_keys.evict_expired()
+                self.pick_up_changes(store)
+            self.flush_search_index()
+
+    def pick_up_changes(self, store):
+        """Reload the note list if another process (cli.py, a sync script) saved to the vault"""
+        def refreshed(changed):
+            if changed and store is self.manager.vault_store:
+                self.catalog = Catalog(store.summary(note_id) for note_id in store.order)
+                self.refresh_note_list(keep_loaded=True)
+                self.reindex_search()
+
+        self.manager.jobs.submit(lambda job: store.refresh(), on_done=refreshed, serial=store.directory)
+
+    def reindex_search(self):
+        """Load the stored search index and catch it up with the vault"""
+        store = self.manager.vault_store
+        index = self.search_index
+
+        def build(job):
+            search_index = index or SearchIndex.load(store.key, store.directory)
+            search_index.reconcile(store, job)
+            return search_index
+
+        def built(search_index):
+            self.search_index = search_index
+            self.apply_search()
+            self.flush_search_index()
+
+        self.manager.jobs.submit(build, on_done=built, serial=store.directory)
+
+    def flush_search_index(self):
+        store = getattr(self.manager, 'vault_store', None)
+        index = self.search_index
+        if store is not None and index is not None and index.dirty:
+            self.manager.jobs.submit(lambda job: index.save(store.key, store.directory), serial=store.directory)
+
+    def apply_search(self):
+        """Show the notes matching the search box, best match first, or every note if empty"""
+        query = self.search_input.text.strip()
+        if not query or self.search_index is None:
+            self.refresh_note_list()
+            return
+        if not query.endswith("*"):
+            query += "*"
+        locked = FILTER_CHOICES[self.filter_spinner.text]
+        matches = (self.catalog.get(note_id) for note_id in self.search_index.search(query, limit=len(self.catalog) or 1))
+        self.page_cursor = None
+        self.note_list.data = [NoteList.row(note) for note in matches
+                               if note is not None and (locked is None or bool(note.get("locked")) == locked)]
+
+    def open_store(self):
+        """Return the open vault store, or None after telling the user it is not open
+
+        The store is None while the vault is still being opened, and after
+        opening it failed.
+        """
+        store = getattr(self.manager, 'vault_store', None)
+        if store is None:
+            show_popup("Error", "The vault is not open.")
+        return store
+
+    def select_row(self, row):
+        self.select_note(self.note_list.data[row]['note_id'])
+
+    def lock_vault(self):
+        """Zeroize the session key and drop decrypted notes from memory"""
+        if self.export_job is not None:
+            self.export_job.cancel()
+            self.export_job = None
+        if self.scrub_job is not None:
+            self.scrub_job.cancel()
+            self.scrub_job = None
+        self.flush_search_index()
+        store = getattr(self.manager, 'vault_store', None)
+        if store is not None:
+            self.manager.jobs.submit(lambda job: store.close(), serial=store.directory)
+        self.manager.vault_store = None
+        self.search_index = None
+        self.catalog = Catalog()
+        self.selected_id = None
+        self.clear_inputs()
+        self.refresh_note_list()
+        if settings_store().get("vault_locked"):
+            self.manager.vault_password = None
+        self.manager.current = 'unlock'
+
+    def refresh_note_list(self, keep_loaded=False):
+        """Show the first page of the catalog in the chosen order and filter
+
+        With keep_loaded, as many rows as are already shown are reloaded,
+        so an edit does not scroll the list back to the first page.
+        """
+        with instrument.span("ui.refresh_note_list"):
+            limit = max(len(self.note_list.data), PAGE_SIZE) if keep_loaded else PAGE_SIZE
+            order, reverse = SORT_CHOICES[self.sort_spinner.text]
+            notes, self.page_cursor = self.catalog.page(
+                order, FILTER_CHOICES[self.filter_spinner.text], limit=limit, reverse=reverse)
+            self.note_list.data = [NoteList.row(note) for note in notes]
+
+    def next_page(self):
+        """Append the next page of the catalog once the list is scrolled to its end"""
+        if self.page_cursor is None:
+            return
+        order, reverse = SORT_CHOICES[self.sort_spinner.text]
+        notes, self.page_cursor = self.catalog.page(
+            order, FILTER_CHOICES[self.filter_spinner.text], self.page_cursor, reverse=reverse)
+        self.note_list.data.extend(NoteList.row(note) for note in notes)
+
+    def show_changes(self, note_ids):
+        """Redisplay the list after these notes were added, changed or removed
+
+        Only their rows change: a row is dropped, and put back where the
+        catalog now orders the note if that is within the rows loaded.
+        """
+        if self.search_input.text.strip():
+            self.apply_search()
+            return
+        with instrument.span("ui.show_changes"):
+            order, reverse = SORT_CHOICES[self.sort_spinner.text]
+            locked = FILTER_CHOICES[self.filter_spinner.text]
+            data = self.note_list.data
+            for note_id in note_ids:
+                row = next((i for i, entry in enumerate(data) if entry['note_id'] == note_id), None)
+                position = self.catalog.position(note_id, order, locked, reverse)
+                if position is not None and position == row:
+                    data[row] = NoteList.row(self.catalog.get(note_id))
+                    continue
+                if row is not None:
+                    data.pop(row)
+                # Past the loaded rows, the next page picks the note up
+                if position is not None and (position < len(data) or self.page_cursor is None):
+                    data.insert(position, NoteList.row(self.catalog.get(note_id)))
+
+    def select_note(self, note_id):
+        store = self.open_store()
+        if store is None:
+            return
+        note = self.catalog.get(note_id)
         if note.get("locked"):
-            def check_pin(entered_pin):
-                if hash_pin(entered_pin) == note.get("pin_hash"):
-                    self.load_note(index)
-                else:
-                    show_popup("Access Denied", "Incorrect PIN.")
-            show_pin_prompt(check_pin, "Enter Document PIN")
+
+            # The first open of a note runs its KDF, so it goes to a worker
+            def unlock(entered_pin):
+                self.manager.jobs.submit(
+                    lambda job: store.unlock_note(note_id, entered_pin),
+                    on_done=lambda opened: self.load_note(note_id, opened),
+                    on_error=lambda e: show_popup("Access Denied", "Incorrect PIN."),
+                    serial=store.directory,
+                )
+            show_pin_prompt(unlock, "Enter Document PIN")
         else:
-            self.load_note(index)
+            self.load_note(note_id)
 
-    def load_note(self, index):
-        note = self.notes[index]
-        self.selected_index = index
+    def load_note(self, note_id, note=None):
+        if note is None:
+            note = self.manager.vault_store.get(note_id)
+        self.opened_note = note
+        self.selected_id = note_id
         self.title_input.text = note["title"]
         self.content_input.text = note["content"]
         self.pin_input.text = ""
@@ -266,52 +426,135 @@ class VaultScreen(Screen):
         content = self.content_input.text.strip()
         pin = self.pin_input.text.strip()
         locked = bool(pin)
-        pin_hash = hash_pin(pin) if locked else None
 
         if not title or not content:
             show_popup("Error", "Title and content cannot be empty.")
             return
+        store = self.open_store()
+        if store is None:
+            return
 
         new_note = {
             "title": title,
             "content": content,
             "locked": locked,
-            "pin_hash": pin_hash,
+            "pin_hash": None,
             "timestamp": datetime.now().isoformat()
         }
 
-        if self.selected_index is not None:
-            self.notes[self.selected_index] = new_note
-        else:
-            self.notes.append(new_note)
+        search_index = self.search_index
+        if self.selected_id is not None:
+            new_note["id"] = self.selected_id
+
+        def write(job):
+            # A document PIN seals the content under a key derived from it
+            note_id = store.put(new_note, pin or None)
+            if search_index is not None:
+                # Sealed content is never indexed, so the index holds no copy of it
+                with_content = not locked
+                search_index.add(note_id, title, content if with_content else None,
+                                 note_stamp(store.summary(note_id), with_content))
+            return note_id
+
+        def saved(note_id):
+            self.catalog.put(store.summary(note_id))
+            self.show_changes([note_id])
+            self.clear_inputs()
+            show_popup("Saved", "Document saved successfully.")
 
-        vault_password = self.manager.vault_password
-        save_vault(self.notes, vault_password)
-        self.clear_inputs()
-        self.refresh_note_list()
-        show_popup("Saved", "Document saved successfully.")
+        self.manager.jobs.submit(
+            write,
+            on_done=saved,
+            on_error=lambda e: show_popup("Error", f"Failed to save: {str(e)}"),
+            serial=store.directory,
+        )
 
     def delete_note(self, instance):
-        if self.selected_index is not None:
-            del self.notes[self.selected_index]
-            vault_password = self.manager.vault_password
-            save_vault(self.notes, vault_password)
+        if self.selected_id is not None:
+            store = self.open_store()
+            if store is None:
+                return
+            note_id = self.selected_id
+            self.catalog.remove(note_id)
+            self.show_changes([note_id])
+            self.selected_id = None
+            search_index = self.search_index
             self.clear_inputs()
-            self.refresh_note_list()
-            show_popup("Deleted", "Document deleted.")
+
+            def remove(job):
+                store.delete(note_id)
+                if search_index is not None:
+                    search_index.remove(note_id)
+
+            self.manager.jobs.submit(
+                remove,
+                on_done=lambda result: show_popup("Deleted", "Document deleted."),
+                on_error=lambda e: show_popup("Error", f"Failed to delete: {str(e)}"),
+                serial=store.directory,
+            )
+
+    def show_history(self, instance):
+        """List earlier versions of the open note, each with a Restore button"""
+        if self.selected_id is None:
+            show_popup("Error", "Open a document first.")
+            return
+        store = self.open_store()
+        if store is None:
+            return
+        note_id = self.selected_id
+        revisions = store.revisions(note_id)
+        if not revisions:
+            show_popup("History", "This document has no earlier versions.")
+            return
+
+        box = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        popup = Popup(title='History', content=box, size_hint=(0.8, 0.8))
+
+        def restore(revision):
+            popup.dismiss()
+
+            def restored(result):
+                self.catalog.put(store.summary(note_id))
+                self.show_changes([note_id])
+                self.select_note(note_id)
+                self.reindex_search()
+                show_popup("Restored", f"Revision {revision} restored.")
+
+            self.manager.jobs.submit(
+                lambda job: store.restore(note_id, revision),
+                on_done=restored,
+                on_error=lambda e: show_popup("Error", f"Failed to restore: {str(e)}"),
+                serial=store.directory,
+            )
+
+        for revision in reversed(revisions[-10:]):
+            row = BoxLayout(size_hint_y=None, height=40, spacing=10)
+            row.add_widget(Label(text=f"#{revision['revision']}  {(revision['timestamp'] or '')[:16]}"))
+            restore_btn = Button(text='Restore', size_hint_x=0.3)
+            restore_btn.bind(on_press=lambda instance, number=revision['revision']: restore(number))
+            row.add_widget(restore_btn)
+            box.add_widget(row)
+        close_btn = Button(text='Close', size_hint_y=None, height=40)
+        close_btn.bind(on_press=popup.dismiss)
+        box.add_widget(close_btn)
+        popup.open()
 
     def new_note(self, instance):
-        self.selected_index = None
+        self.selected_id = None
         self.clear_inputs()
 
     def clear_inputs(self):
+        """Empty the editor; nothing is opened or selected afterwards"""
+        self.opened_note = None
+        self.selected_id = None
         self.title_input.text = ""
         self.content_input.text = ""
         self.pin_input.text = ""
 
     def import_file(self, instance):
         content = BoxLayout(orientation='vertical')
-        filechooser = FileChooserListView(filters=['*.txt'])
+        # Several files or whole folders are imported straight into the vault
+        filechooser = FileChooserListView(filters=['*.txt', '*.venc'], multiselect=True, dirselect=True)
         content.add_widget(filechooser)
         
         btn_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
@@ -321,9 +564,12 @@ class VaultScreen(Screen):
         popup = Popup(title='Import File', content=content, size_hint=(0.9, 0.9))
         
         def select_file(instance):
-            if filechooser.selection:
-                file_path = filechooser.selection[0]
-                self.process_import(file_path)
+            selection = filechooser.selection
+            if len(selection) == 1 and not os.path.isdir(selection[0]):
+                self.process_import(selection[0])
+                popup.dismiss()
+            elif selection:
+                self.bulk_import(list(selection))
                 popup.dismiss()
         
         def cancel(instance):
@@ -344,10 +590,13 @@ class VaultScreen(Screen):
             file_ext = os.path.splitext(file_path)[1].lower()
             
             if file_ext == '.txt':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                # Same encoding detection and size limit as a bulk import
+                content = vault.read_text_file(file_path)
+            elif file_ext == '.venc':
+                show_pin_prompt(lambda pin: self.process_encrypted_import(file_path, pin), "Enter Export PIN")
+                return
             else:
-                show_popup("Error", f"Only .txt files are supported. PDF/DOCX removed for Android compatibility.")
+                show_popup("Error", f"Only .txt and .venc files are supported. PDF/DOCX removed for Android compatibility.")
                 return
             
             self.title_input.text = os.path.basename(file_path)
@@ -356,38 +605,164 @@ class VaultScreen(Screen):
         except Exception as e:
             show_popup("Import Error", f"Failed to import file: {str(e)}")
     
+    def process_encrypted_import(self, file_path, pin):
+        def loaded(documents):
+            if len(documents) != 1:
+                self.import_archive(documents)
+                return
+            document = documents[0]
+            self.title_input.text = document["title"]
+            self.content_input.text = document["content"]
+            show_popup("Success", "File imported successfully. Add a PIN if needed and click Save.")
+
+        self.manager.jobs.submit(
+            lambda job: list(vault.read_export_notes(file_path, pin)),
+            on_done=loaded,
+            on_error=lambda e: show_popup("Import Error", "Wrong PIN or corrupted export file."),
+        )
+    
+    def bulk_import(self, selection):
+        """Import every selected file and folder into the vault with one commit"""
+        store = self.open_store()
+        if store is None:
+            return
+        paths = vault.expand_import_paths(selection)
+        if not paths:
+            show_popup("Import", "No .txt or .venc files in the selection.")
+            return
+
+        def imported(result):
+            note_ids, failed = result
+            for note_id in note_ids:
+                self.catalog.put(store.summary(note_id))
+            self.show_changes(note_ids)
+            self.reindex_search()
+            message = f"Imported {len(note_ids)} notes from {len(paths) - len(failed)} of {len(paths)} files."
+            for path, error in list(failed.items())[:5]:
+                message += f"\n{os.path.basename(path)}: {error}"
+            if len(failed) > 5:
+                message += f"\n... and {len(failed) - 5} more failed"
+            show_popup("Import", message)
+
+        def run_import(pin):
+            self.manager.jobs.submit(
+                lambda job: vault.import_files(store, paths, pin, progress=job.progress),
+                on_done=imported,
+                on_error=lambda e: show_popup("Import Error", f"Failed to import: {str(e)}"),
+                on_progress=self.on_progress,
+                serial=store.directory,
+            )
+
+        if any(path.lower().endswith('.venc') for path in paths):
+            show_pin_prompt(run_import, "Enter Export PIN")
+        else:
+            run_import(None)
+
+    def import_archive(self, documents):
+        """Add every note of an archive to the vault in one commit"""
+        store = self.open_store()
+        if store is None:
+            return
+
+        def imported(note_ids):
+            for note_id in note_ids:
+                self.catalog.put(store.summary(note_id))
+            self.show_changes(note_ids)
+            self.reindex_search()
+            show_popup("Success", f"Imported {len(note_ids)} documents.")
+
+        self.manager.jobs.submit(
+            lambda job: store.put_many(map(vault.imported_note, documents)),
+            on_done=imported,
+            on_error=lambda e: show_popup("Import Error", f"Failed to import: {str(e)}"),
+            serial=store.directory,
+        )
+
     def export_document(self, instance):
-        if self.selected_index is None:
+        if self.selected_id is None:
             show_popup("Error", "Please select a document to export.")
             return
         
-        note = self.notes[self.selected_index]
+        store = self.open_store()
+        if store is None:
+            return
+        
+        # A locked note can only be exported as opened with its PIN
+        note = self.opened_note
+        if note is None and not self.catalog.get(self.selected_id).get("locked"):
+            note = store.get(self.selected_id)
+        if note is None or note.get("content") is None:
+            show_popup("Error", "Open the document with its PIN before exporting it.")
+            return
         
         def do_export(export_pin):
-            try:
-                export_data = {
-                    "title": note["title"],
-                    "content": note["content"],
-                    "timestamp": note.get("timestamp", datetime.now().isoformat())
-                }
-                
-                encrypted_export = EncryptionManager.encrypt_data(
-                    json.dumps(export_data),
-                    export_pin
-                )
-                
-                filename = f"{note['title'].replace(' ', '_')}.venc"
-                with open(filename, 'w') as f:
-                    f.write(encrypted_export)
-                
-                show_popup("Success", f"Document exported as '{filename}'")
-            except Exception as e:
-                show_popup("Export Error", f"Failed to export: {str(e)}")
+            export_data = {
+                "title": note["title"],
+                "content": note["content"],
+                "timestamp": note.get("timestamp", datetime.now().isoformat())
+            }
+            filename = f"{note['title'].replace(' ', '_')}.venc"
+
+            def run_export(job):
+                def progress(fraction):
+                    job.check()
+                    job.progress(fraction)
+                vault.export_note(export_data, filename, export_pin, progress=progress)
+
+            self.export_job = self.manager.jobs.submit(
+                run_export,
+                on_done=lambda result: show_popup("Success", f"Document exported as '{filename}'"),
+                on_error=lambda e: show_popup("Export Error", f"Failed to export: {str(e)}"),
+                on_progress=self.on_progress,
+            )
         
         show_pin_prompt(do_export, "Enter PIN for Export Encryption")
     
+    def check_integrity(self):
+        """Scrub every record of the vault in the background and report damage"""
+        store = self.open_store()
+        if store is None or self.scrub_job is not None:
+            return
+
+        def run_scrub(job):
+            # A single worker on the low-priority lane, so the scrub only takes idle time
+            return scrub.scrub_store(store, workers=1, job=job, progress=job.progress)
+
+        def checked(report):
+            self.scrub_job = None
+            summary = f"{report['records']} records, {report['bytes'] // 1024} KB at {report['mb_per_second']} MB/s."
+            if not report["damaged"]:
+                show_popup("Integrity Check", f"No damage found.\n{summary}")
+                return
+            titles = [self.catalog.get(note_id)["title"] for note_id in report["damaged_notes"]
+                      if note_id in self.catalog]
+            message = f"{len(report['damaged'])} damaged records.\n{summary}"
+            if titles:
+                message += "\nUnreadable: " + ", ".join(titles[:5]) + (" ..." if len(titles) > 5 else "")
+            show_popup("Integrity Check", message + "\nRun 'cli.py recover' to copy readable notes to a new vault.")
+
+        def failed(error):
+            self.scrub_job = None
+            show_popup("Integrity Check", f"Check failed: {str(error)}")
+
+        self.scrub_job = self.manager.jobs.submit(
+            run_scrub,
+            on_done=checked,
+            on_error=failed,
+            on_progress=self.on_progress,
+            low_priority=True,
+        )
+
+    def on_settings_changed(self, changed, settings):
+        """Apply settings saved through the settings store, from any screen or thread"""
+        if "diagnostics" in changed:
+            instrument.disable()
+            sink = diagnostics_sink(settings)
+            if sink is not None:
+                instrument.enable(sink)
+
     def open_vault_settings(self, instance):
-        settings = load_settings()
+        settings = settings_store().snapshot()
         
         box = BoxLayout(orientation='vertical', padding=10, spacing=10)
         box.add_widget(Label(text='Vault Settings', font_size=20, size_hint_y=None, height=40))
@@ -400,44 +775,50 @@ class VaultScreen(Screen):
             height=50
         )
         box.add_widget(pin_input)
+
         
         btn_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
         save_btn = Button(text='Save')
+        check_btn = Button(text='Check Integrity')
         cancel_btn = Button(text='Cancel')
         
         popup = Popup(title='Vault Settings', content=box, size_hint=(0.8, 0.5))
         
         def save_settings_callback(instance):
             new_pin = pin_input.text.strip()
+            store = self.open_store()
+            if store is None:
+                return
             old_password = self.manager.vault_password
+            message = "Vault PIN set successfully." if new_pin else "Vault PIN removed."
+
+            def rewrapped(new_password):
+                self.manager.vault_password = new_password
+                show_popup("Success", message)
             
-            if new_pin:
-                new_password = new_pin
-                settings["vault_locked"] = True
-                settings["vault_pin_hash"] = hash_pin(new_pin)
-                show_popup("Success", "Vault PIN set successfully.")
-            else:
-                new_password = settings["device_key"]
-                settings["vault_locked"] = False
-                settings["vault_pin_hash"] = None
-                show_popup("Success", "Vault PIN removed.")
-            
-            notes, success = load_vault(old_password)
-            if success:
-                save_vault(notes, new_password)
-                self.notes = notes
-            
-            self.manager.vault_password = new_password
-            save_settings(settings)
+            # Only the wrapped data key changes; notes and the search index stay as they are.
+            # Settings are saved in the same job, so a PIN hash never lags behind the key wrap
+            self.manager.jobs.submit(
+                lambda job: change_vault_pin(store, settings, new_pin, old_password),
+                on_done=rewrapped,
+                on_error=lambda e: show_popup("Error", f"Failed to change PIN: {str(e)}"),
+                serial=store.directory,
+            )
             popup.dismiss()
         
+        def check_callback(instance):
+            popup.dismiss()
+            self.check_integrity()
+
         def cancel_callback(instance):
             popup.dismiss()
         
         save_btn.bind(on_press=save_settings_callback)
+        check_btn.bind(on_press=check_callback)
         cancel_btn.bind(on_press=cancel_callback)
         
         btn_layout.add_widget(save_btn)
+        btn_layout.add_widget(check_btn)
         btn_layout.add_widget(cancel_btn)
         box.add_widget(btn_layout)
         
@@ -446,8 +827,17 @@ class VaultScreen(Screen):
 class VaultApp(App):
     def build(self):
         sm = ScreenManager()
-        settings = load_settings()
+        try:
+            settings = settings_store().snapshot()
+        except SettingsError as e:
+            # Never replace a device key the vault may still need
+            return Label(text=f"Cannot start: {e}", halign='center', padding=(20, 20))
+        sm.jobs = JobRunner(dispatch=lambda callback: Clock.schedule_once(lambda dt: callback()))
+        sink = diagnostics_sink(settings)
+        if sink is not None:
+            instrument.enable(sink)
         sm.vault_password = settings["device_key"]
+        sm.vault_store = None
         
         if settings.get("vault_locked"):
             sm.add_widget(UnlockScreen(name='unlock'))
@@ -458,7 +848,20 @@ class VaultApp(App):
             sm.add_widget(VaultScreen(name='vault'))
             sm.current = 'vault'
         
+        vault_screen = sm.get_screen('vault')
+        sm.jobs.on_busy = vault_screen.on_busy
+        # Changes can be written from worker threads; listeners run on the UI thread
+        settings_store().subscribe(lambda changed, values: Clock.schedule_once(
+            lambda dt: vault_screen.on_settings_changed(changed, values)))
         return sm
 
+    def on_stop(self):
+        if not isinstance(self.root, ScreenManager):
+            return
+        if self.root.vault_store is not None:
+            store = self.root.vault_store
+            self.root.jobs.submit(lambda job: store.close(), serial=store.directory)
+        self.root.jobs.shutdown()
+
 if __name__ == '__main__':
     VaultApp().run()
@@ -0,0 +1,217 @@
+"""
+VaultNote Note Records
+Compact in-memory notes and their binary record encoding (no GUI dependencies)
+
+A Note keeps its fields in __slots__: the timestamp as integer microseconds
+since the epoch, the lock flag as a bool, and the content as a UTF-8 buffer
+that is decoded only when read. Notes also answer note["title"] and
+note.get("locked") like the dicts they replace, so callers that index
+notes by field name keep working.
+
+Records are encoded as a fixed header followed by the id, title, PIN hash
+and content bytes, which is several times faster to write and read than
+JSON. Records written as JSON (they start with "{") still decode.
+
+A sealed note holds its content encrypted under a key derived from its
+own PIN (see seal()). Its content is not readable until unseal() is given
+that key, so sealed notes have no "content" field.
+
+A large note can be stored by reference: its record lists the ids of the
+chunks its content was split into (see chunks.py) instead of holding the
+content, and the vault fills the content back in with assembled().
+"""
+import json
+import struct
+from datetime import datetime
+
+from chunks import CHUNK_ID_SIZE
+
+NOTE_FORMAT = 1
+# format, flags, stamp, then the byte lengths of id, title, pin hash and content
+_HEADER = struct.Struct("<BBqBIBI")
+_LOCKED = 0x01
+_HAS_PIN_HASH = 0x02
+_HAS_STAMP = 0x04
+_SEALED = 0x08
+_CHUNKED = 0x10
+
+MICROSECONDS = 10 ** 6
+
+
+def stamp_from_iso(value) -> int:
+    """Convert an ISO timestamp to epoch microseconds, or None"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return int(moment.replace(microsecond=0).timestamp()) * MICROSECONDS + moment.microsecond
+
+
+def iso_from_stamp(stamp: int) -> str:
+    """Convert epoch microseconds to a local ISO timestamp, or None"""
+    if stamp is None:
+        return None
+    return datetime.fromtimestamp(stamp // MICROSECONDS).replace(microsecond=stamp % MICROSECONDS).isoformat()
+
+
+def now_stamp() -> int:
+    return stamp_from_iso(datetime.now().isoformat())
+
+
+class Note:
+    """One note, or with no content, its manifest summary"""
+
+    __slots__ = ("id", "title", "locked", "pin_hash", "stamp", "size", "sealed", "chunks", "_content")
+
+    def __init__(self, title: str, content=None, locked: bool = False, pin_hash: str = None,
+                 stamp: int = None, id: str = None, size: int = None, sealed: bool = False, chunks: list = None):
+        self.id = id
+        self.title = title
+        self.locked = bool(locked)
+        self.pin_hash = pin_hash
+        self.stamp = stamp
+        self.size = size
+        self.sealed = bool(sealed)
+        self.chunks = chunks
+        self._content = content.encode() if isinstance(content, str) else content
+
+    @classmethod
+    def from_dict(cls, data: dict, id: str = None) -> "Note":
+        """Build a note from its dict form, e.g. a decoded JSON record"""
+        return cls(data["title"], data.get("content"), data.get("locked", False), data.get("pin_hash"),
+                   stamp_from_iso(data.get("timestamp")), data.get("id", id), data.get("size"))
+
+    @classmethod
+    def from_row(cls, note_id: str, row: list) -> "Note":
+        """Build a summary from its index manifest row"""
+        # Rows written before sealed notes existed have five fields
+        title, locked, pin_hash, stamp, size, *sealed = row
+        return cls(title, None, locked, pin_hash, stamp, note_id, size, sealed[0] if sealed else False)
+
+    @classmethod
+    def decode(cls, data) -> "Note":
+        """Decode a record written by encode(), or a JSON record"""
+        if data[:1] == b"{":
+            return cls.from_dict(json.loads(bytes(data)))
+        view = memoryview(data)
+        fmt, flags, stamp, id_size, title_size, pin_size, content_size = _HEADER.unpack_from(view)
+        if fmt != NOTE_FORMAT:
+            raise ValueError(f"Unsupported note format {fmt}")
+        offset = _HEADER.size
+        note_id = str(view[offset:offset + id_size], "utf-8")
+        offset += id_size
+        title = str(view[offset:offset + title_size], "utf-8")
+        offset += title_size
+        pin_hash = str(view[offset:offset + pin_size], "ascii") if flags & _HAS_PIN_HASH else None
+        offset += pin_size
+        content = bytes(view[offset:offset + content_size])
+        if len(content) != content_size:
+            raise ValueError("Truncated note record")
+        chunks = None
+        if flags & _CHUNKED:
+            chunks = [content[i:i + CHUNK_ID_SIZE].hex() for i in range(0, len(content), CHUNK_ID_SIZE)]
+            content = None
+        return cls(title, content, flags & _LOCKED, pin_hash, stamp if flags & _HAS_STAMP else None,
+                   note_id or None, sealed=flags & _SEALED, chunks=chunks)
+
+    def encode(self) -> bytes:
+        """Serialize the note (including content) as a binary record"""
+        note_id = (self.id or "").encode()
+        title = self.title.encode()
+        pin_hash = (self.pin_hash or "").encode()
+        if self.chunks is not None:
+            content = b"".join(map(bytes.fromhex, self.chunks))
+        else:
+            content = self._content or b""
+        flags = ((_LOCKED if self.locked else 0) | (_HAS_PIN_HASH if self.pin_hash is not None else 0)
+                 | (_HAS_STAMP if self.stamp is not None else 0) | (_SEALED if self.sealed else 0)
+                 | (_CHUNKED if self.chunks is not None else 0))
+        header = _HEADER.pack(NOTE_FORMAT, flags, self.stamp or 0, len(note_id), len(title), len(pin_hash), len(content))
+        return b"".join((header, note_id, title, pin_hash, content))
+
+    def summary(self, size: int) -> "Note":
+        """This note without its content, as kept in the manifest"""
+        return Note(self.title, None, self.locked, self.pin_hash, self.stamp, self.id, size, self.sealed)
+
+    def row(self) -> list:
+        """Manifest row stored in the index"""
+        return [self.title, self.locked, self.pin_hash, self.stamp, self.size, self.sealed]
+
+    def seal(self, key) -> "Note":
+        """Copy of this note with the content encrypted under a document key
+
+        key is a VaultKey derived from the note's PIN; the PIN hash is
+        dropped, since opening the content is the PIN check.
+        """
+        return Note(self.title, key.encrypt(self._content, "document"), True, None, self.stamp, self.id,
+                    sealed=True)
+
+    def unseal(self, key) -> "Note":
+        """Copy of a sealed note with its content decrypted by key"""
+        return Note(self.title, key.decrypt(self._content, "document"), True, None, self.stamp, self.id)
+
+    def chunked(self, chunk_ids: list) -> "Note":
+        """Copy of this note that refers to its content by chunk ids"""
+        return Note(self.title, None, self.locked, self.pin_hash, self.stamp, self.id, sealed=self.sealed,
+                    chunks=list(chunk_ids))
+
+    def assembled(self, content: bytes) -> "Note":
+        """Copy of a chunked note with its content filled back in"""
+        return Note(self.title, content, self.locked, self.pin_hash, self.stamp, self.id, sealed=self.sealed)
+
+    @property
+    def content_bytes(self) -> bytes:
+        """The content as stored: UTF-8, or ciphertext for a sealed note"""
+        return self._content
+
+    @property
+    def sealed_content(self) -> bytes:
+        return self._content if self.sealed else None
+
+    @property
+    def content(self) -> str:
+        if self.sealed:
+            raise ValueError("Note content is encrypted with its document PIN")
+        return None if self._content is None else self._content.decode()
+
+    @content.setter
+    def content(self, value: str):
+        self._content = None if value is None else value.encode()
+
+    @property
+    def timestamp(self) -> str:
+        return iso_from_stamp(self.stamp)
+
+    def keys(self) -> list:
+        fields = ["id", "title", "locked", "pin_hash", "timestamp", "sealed"]
+        if self._content is None:
+            fields.append("size")
+        elif not self.sealed:
+            fields.append("content")
+        return fields
+
+    def __getitem__(self, key: str):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.keys() else default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys()
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, Note):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Note(id={self.id!r}, title={self.title!r})"
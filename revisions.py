@@ -0,0 +1,123 @@
+"""
+VaultNote Revisions
+Binary deltas between note versions (no GUI dependencies)
+
+A delta rebuilds a target from a source as a list of operations: copy a
+range of the source, or insert new bytes. Deltas are computed line by
+line, then word by word inside changed lines, so their size follows the
+size of the edit rather than of the note.
+
+The vault keeps older versions of a note as reverse deltas: each one
+rebuilds a revision from the next newer one, so the current note is always
+stored whole, and pruning drops the oldest entries without touching the
+rest. Every SNAPSHOT_INTERVAL entries a full snapshot is stored instead,
+so no revision is more than that many deltas away from a whole copy.
+"""
+import difflib
+import re
+import struct
+
+SNAPSHOT_INTERVAL = 16
+# Changed regions larger than this are stored whole instead of word-diffed
+WORD_DIFF_LIMIT = 512 * 1024
+
+_DELTA_HEADER = struct.Struct(">II")
+_COPY = struct.Struct(">cII")
+_INSERT = struct.Struct(">cI")
+_LINE = re.compile(rb"[^\n]*\n|[^\n]+")
+_WORD = re.compile(rb"\S+\s*|\s+")
+
+
+def _diff(source: bytes, target: bytes, source_start: int, ops: list, pattern):
+    """Append copy/insert ops turning source into target to ops
+
+    Copy offsets are relative to the whole source, which starts at
+    source_start. Changed line ranges are diffed again word by word.
+    """
+    a, b = pattern.findall(source), pattern.findall(target)
+    a_offsets = [0]
+    for token in a:
+        a_offsets.append(a_offsets[-1] + len(token))
+    b_offsets = [0]
+    for token in b:
+        b_offsets.append(b_offsets[-1] + len(token))
+    matcher = difflib.SequenceMatcher(None, a, b)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(("copy", source_start + a_offsets[i1], a_offsets[i2] - a_offsets[i1]))
+            continue
+        old = source[a_offsets[i1]:a_offsets[i2]]
+        new = target[b_offsets[j1]:b_offsets[j2]]
+        if pattern is _LINE and old and new and len(old) + len(new) <= WORD_DIFF_LIMIT:
+            _diff(old, new, source_start + a_offsets[i1], ops, _WORD)
+        elif new:
+            ops.append(("insert", new))
+
+
+def _common_prefix(a: memoryview, b: memoryview) -> int:
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def make_delta(source: bytes, target: bytes) -> bytes:
+    """Encode target as a delta against source
+
+    The common prefix and suffix are copied as they are, so only the
+    edited middle goes through the diff.
+    """
+    a, b = memoryview(source), memoryview(target)
+    prefix = _common_prefix(a, b)
+    suffix = _common_prefix(a[prefix:][::-1], b[prefix:][::-1])
+    ops = [("copy", 0, prefix)]
+    _diff(source[prefix:len(source) - suffix], target[prefix:len(target) - suffix], prefix, ops, _LINE)
+    ops.append(("copy", len(source) - suffix, suffix))
+    parts = [_DELTA_HEADER.pack(len(source), len(target))]
+    pending = None
+    for op in ops:
+        if op[0] == "copy":
+            if op[2] == 0:
+                continue
+            if pending is not None and pending[0] + pending[1] == op[1]:
+                pending = (pending[0], pending[1] + op[2])
+                continue
+            if pending is not None:
+                parts.append(_COPY.pack(b"C", *pending))
+            pending = (op[1], op[2])
+        else:
+            if pending is not None:
+                parts.append(_COPY.pack(b"C", *pending))
+                pending = None
+            parts.append(_INSERT.pack(b"I", len(op[1])))
+            parts.append(op[1])
+    if pending is not None:
+        parts.append(_COPY.pack(b"C", *pending))
+    return b"".join(parts)
+
+
+def apply_delta(source: bytes, delta: bytes) -> bytes:
+    """Rebuild the target of a delta from its source"""
+    source_size, target_size = _DELTA_HEADER.unpack_from(delta)
+    if len(source) != source_size:
+        raise ValueError("Delta does not apply to this source")
+    parts = []
+    offset = _DELTA_HEADER.size
+    while offset < len(delta):
+        if delta[offset:offset + 1] == b"C":
+            _, start, length = _COPY.unpack_from(delta, offset)
+            parts.append(source[start:start + length])
+            offset += _COPY.size
+        else:
+            _, length = _INSERT.unpack_from(delta, offset)
+            offset += _INSERT.size
+            parts.append(delta[offset:offset + length])
+            offset += length
+    target = b"".join(parts)
+    if len(target) != target_size:
+        raise ValueError("Delta is damaged")
+    return target
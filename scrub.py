@@ -0,0 +1,489 @@
+"""
+VaultNote Integrity Scrubber
+Checks vault records and .venc exports, and salvages readable notes (no GUI dependencies)
+
+A scrub reads every live record of the vault (notes, revisions and
+chunks) and checks its length and id fields against the index, its AEAD
+tag, that it decompresses, and that a note decodes or a chunk matches its
+keyed id. Records are checked in batches across worker processes, which
+are only given the HKDF subkeys of the record purposes, never the data
+key. Every damaged record is reported with its file, byte offset and
+length, and the notes that can no longer be read are listed.
+
+If the index itself does not open, the segments are walked record by
+record instead. Records that open as a note or a chunk are verified;
+well-formed records that do not (revisions, whose authenticated data
+lives in the index) are counted as unverified. After a damaged length
+field the walk skips ahead to the next record that opens, and reports
+the bytes in between as one damaged region.
+
+.venc exports are streams of independently tagged chunks (see
+encryption.py), so a scrub reports which chunks of a file are damaged
+rather than stopping at the first one.
+
+recover_vault() copies every readable note into a fresh vault, falling
+back to the newest revision that still opens when a note's current
+record is damaged.
+"""
+import glob
+import io
+import json
+import os
+import time
+import zlib
+
+from chunks import chunk_id
+from encryption import (
+    CODEC_ZLIB_DICT, NONCE_SIZE, TAG_SIZE, EncryptionManager, RecordOpener, VaultKey, decompress_payload,
+    is_stream, parallel_map, scan_stream,
+)
+from notes import Note
+from vault import (
+    KEY_NAME, LEGACY_VAULT_NAME, NOTE_ID_SIZE, RECORD_LENGTH, REVISION_AAD, SEGMENT_HEADER, VaultStore,
+    open_vault, read_legacy_vault,
+)
+
+PURPOSES = {"note": "record", "revision": "revision", "chunk": "chunk"}
+# Records are handed to workers in batches of about this many bytes or records
+BATCH_BYTES = 4 * 1024 * 1024
+BATCH_RECORDS = 1024
+_RECORD_HEAD = RECORD_LENGTH.size + NOTE_ID_SIZE
+_MIN_SEALED = NONCE_SIZE + TAG_SIZE
+
+
+def _unpack(payload, dictionaries: list) -> bytes:
+    """Decompress a record payload, trying each candidate dictionary"""
+    # Records written before compression are bare JSON
+    if payload[:1] == b"{":
+        return bytes(payload)
+    if payload[0] != CODEC_ZLIB_DICT or len(dictionaries) <= 1:
+        return decompress_payload(payload, dictionaries[:1])
+    for dictionary in dictionaries:
+        try:
+            return decompress_payload(payload, [dictionary])
+        except zlib.error:
+            continue
+    raise ValueError("Record was compressed with a dictionary that is missing")
+
+
+def _check_record(record, kind: str, record_id: str, revision, snapshot, openers: dict, dictionaries: list) -> str:
+    """Return why a record read at its indexed location is damaged, or None"""
+    if len(record) < _RECORD_HEAD + _MIN_SEALED:
+        return "Record is truncated"
+    (length,) = RECORD_LENGTH.unpack_from(record)
+    if _RECORD_HEAD + length != len(record):
+        return "Record length field does not match the index"
+    aad = bytes.fromhex(record_id)
+    if record[RECORD_LENGTH.size:_RECORD_HEAD] != aad:
+        return "Record id does not match the index"
+    if kind == "revision":
+        aad += REVISION_AAD.pack(revision, snapshot)
+    try:
+        payload = openers[PURPOSES[kind]].open(record[_RECORD_HEAD:], aad)
+    except Exception:
+        return "Authentication tag does not verify"
+    try:
+        plaintext = _unpack(payload, dictionaries)
+    except Exception as e:
+        return f"Payload does not decompress: {e}"
+    try:
+        if kind == "chunk":
+            if chunk_id(openers["chunk-id"], plaintext) != record_id:
+                return "Chunk content does not match its id"
+        elif kind == "note" or snapshot:
+            Note.decode(plaintext)
+    except Exception as e:
+        return f"Record does not decode: {e}"
+    return None
+
+
+def _check_batch(args):
+    """Check one batch of records; runs in a worker process
+
+    Returns (bytes checked, [(position in the batch, error)]).
+    """
+    path, subkeys, dictionary, items = args
+    openers = {purpose: RecordOpener(subkey) for purpose, subkey in subkeys.items()}
+    openers["chunk-id"] = subkeys["chunk"]
+    dictionaries = [dictionary] if dictionary else []
+    damaged = []
+    size = 0
+    with open(path, "rb") as f:
+        for position, (kind, record_id, revision, snapshot, offset, length) in enumerate(items):
+            f.seek(offset)
+            record = f.read(length)
+            size += len(record)
+            error = _check_record(record, kind, record_id, revision, snapshot, openers, dictionaries)
+            if error is not None:
+                damaged.append((position, error))
+    return size, damaged
+
+
+def _batches(records: list):
+    """Group records, in file order, into batches of about BATCH_BYTES"""
+    batch = []
+    size = 0
+    for record in sorted(records, key=lambda record: record[4]):
+        batch.append(record)
+        size += record[5]
+        if size >= BATCH_BYTES or len(batch) >= BATCH_RECORDS:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def _rate(size: int, seconds: float) -> float:
+    return round(size / (1024 * 1024) / seconds, 1) if seconds > 0 else 0.0
+
+
+def _damage(path: str, offset: int, length: int, kind: str, error: str, **fields) -> dict:
+    return dict(file=os.path.basename(path), offset=offset, length=length, kind=kind, error=error, **fields)
+
+
+def scrub_store(store: VaultStore, workers: int = None, job=None, progress=None) -> dict:
+    """Check every live record of an open vault
+
+    Runs without holding the store's lock, so the vault stays usable; if
+    a compaction replaces the segment meanwhile, the scrub starts over on
+    the new one. job.check() is called between batches and
+    progress(fraction) after each. Returns a report dict with the records
+    and bytes checked, the time taken, throughput in MB/s, the damaged
+    records and the ids of notes that no longer read.
+    """
+    subkeys = {purpose: store.key.subkey(purpose) for purpose in PURPOSES.values()}
+    while True:
+        path, dictionary, records, chunk_owners = store.record_map()
+        try:
+            return _scrub_segment(path, subkeys, dictionary, records, chunk_owners, workers, job, progress)
+        except FileNotFoundError:
+            # Compacted meanwhile, possibly by another process
+            store.refresh()
+            if path == store.segment_path:
+                raise
+
+
+def _scrub_segment(path, subkeys, dictionary, records, chunk_owners, workers, job, progress) -> dict:
+    start = time.perf_counter()
+    damaged = []
+    with open(path, "rb") as f:
+        header = f.read(len(SEGMENT_HEADER))
+    if header != SEGMENT_HEADER:
+        damaged.append(_damage(path, 0, len(SEGMENT_HEADER), "header", "Not a vault segment header"))
+    batches = list(_batches(records))
+    total = sum(record[5] for record in records) or 1
+    checked = 0
+    results = parallel_map(_check_batch, ((path, subkeys, dictionary, batch) for batch in batches), workers)
+    for batch, (size, errors) in zip(batches, results):
+        if job is not None:
+            job.check()
+        checked += size
+        for position, error in errors:
+            kind, record_id, revision, _, offset, length = batch[position]
+            fields = {"id": record_id} if revision is None else {"id": record_id, "revision": revision}
+            damaged.append(_damage(path, offset, length, kind, error, **fields))
+        if progress is not None:
+            progress(checked / total)
+    seconds = time.perf_counter() - start
+    lost = set()
+    for entry in damaged:
+        if entry["kind"] == "note":
+            lost.add(entry["id"])
+        elif entry["kind"] == "chunk":
+            lost.update(chunk_owners.get(entry["id"], ()))
+    return {
+        "index": "ok",
+        "records": len(records),
+        "bytes": checked,
+        "seconds": round(seconds, 3),
+        "mb_per_second": _rate(checked, seconds),
+        "damaged": damaged,
+        "damaged_notes": sorted(lost),
+    }
+
+
+def _unlock(directory: str, password: str) -> VaultKey:
+    key_path = os.path.join(directory, KEY_NAME)
+    if os.path.exists(key_path):
+        with open(key_path, "rb") as f:
+            wrapped = f.read()
+        try:
+            return VaultKey.unwrap(wrapped, password)
+        except Exception:
+            raise ValueError(f"{KEY_NAME} does not open: wrong PIN or a damaged key file") from None
+    if VaultStore.exists(directory):
+        return VaultStore.unlock(password, directory)
+    raise FileNotFoundError(f"No vault in {directory}")
+
+
+def _segment_paths(directory: str) -> list:
+    """Every segment file in the directory, oldest first"""
+    paths = glob.glob(os.path.join(directory, "vault_data.*.seg"))
+    return sorted(paths, key=lambda path: int(os.path.basename(path).split(".")[1]))
+
+
+def _dictionaries(key: VaultKey, directory: str) -> list:
+    """Every compression dictionary that still decrypts"""
+    dictionaries = []
+    for path in sorted(glob.glob(os.path.join(directory, "vault_dict.*.enc"))):
+        try:
+            with open(path, "rb") as f:
+                dictionaries.append(key.decrypt(f.read(), "dictionary"))
+        except Exception:
+            continue
+    return dictionaries
+
+
+def _open_walked(data, offset: int, end: int, openers: dict, dictionaries: list):
+    """Open a record found without the index as a note or a chunk
+
+    Returns ("note", Note), ("chunk", plaintext) or None.
+    """
+    record_id = bytes(data[offset + RECORD_LENGTH.size:offset + _RECORD_HEAD])
+    sealed = data[offset + _RECORD_HEAD:end]
+    for kind, purpose in (("note", "record"), ("chunk", "chunk")):
+        try:
+            plaintext = _unpack(openers[purpose].open(sealed, record_id), dictionaries)
+            if kind == "note":
+                return kind, Note.decode(plaintext)
+            if chunk_id(openers["chunk-id"], plaintext) == record_id.hex():
+                return kind, plaintext
+        except Exception:
+            continue
+    return None
+
+
+def walk_segment(path: str, openers: dict, dictionaries: list):
+    """Yield what a segment holds, parsed from its record framing alone
+
+    Yields (kind, offset, length, value): ("note", ..., Note),
+    ("chunk", ..., (chunk id, plaintext)), ("unverified", ..., None) for a
+    well-formed record that opens as neither, and ("damaged", ..., error)
+    for bytes that hold no record.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = len(SEGMENT_HEADER)
+    if data[:offset] != SEGMENT_HEADER:
+        yield "damaged", 0, offset, "Not a vault segment header"
+    bad = None
+    while offset < len(data):
+        end = None
+        if offset + _RECORD_HEAD + _MIN_SEALED <= len(data):
+            (length,) = RECORD_LENGTH.unpack_from(data, offset)
+            if length >= _MIN_SEALED and offset + _RECORD_HEAD + length <= len(data):
+                end = offset + _RECORD_HEAD + length
+        opened = None if end is None else _open_walked(data, offset, end, openers, dictionaries)
+        # While skipping over damage, only a record that opens marks where good data resumes
+        if opened is None and (end is None or bad is not None):
+            if bad is None:
+                bad = offset
+            offset += 1
+            continue
+        if bad is not None:
+            yield "damaged", bad, offset - bad, "Unreadable bytes between records"
+            bad = None
+        if opened is None:
+            yield "unverified", offset, end - offset, None
+        elif opened[0] == "note":
+            yield "note", offset, end - offset, opened[1]
+        else:
+            record_id = data[offset + RECORD_LENGTH.size:offset + _RECORD_HEAD].hex()
+            yield "chunk", offset, end - offset, (record_id, opened[1])
+        offset = end
+    if bad is not None:
+        yield "damaged", bad, len(data) - bad, "Unreadable bytes at the end of the segment"
+
+
+def _walk_openers(key: VaultKey) -> dict:
+    openers = {purpose: RecordOpener(key.subkey(purpose)) for purpose in ("record", "chunk")}
+    openers["chunk-id"] = key.subkey("chunk")
+    return openers
+
+
+def _scrub_walk(key: VaultKey, directory: str, job=None) -> dict:
+    """Check the segments of a vault whose index does not open"""
+    start = time.perf_counter()
+    openers = _walk_openers(key)
+    dictionaries = _dictionaries(key, directory)
+    records = unverified = checked = 0
+    damaged = []
+    for path in _segment_paths(directory):
+        for kind, offset, length, value in walk_segment(path, openers, dictionaries):
+            if job is not None:
+                job.check()
+            checked += length
+            if kind == "damaged":
+                damaged.append(_damage(path, offset, length, "unknown", value))
+                continue
+            records += 1
+            unverified += kind == "unverified"
+    seconds = time.perf_counter() - start
+    return {
+        "records": records,
+        "unverified": unverified,
+        "bytes": checked,
+        "seconds": round(seconds, 3),
+        "mb_per_second": _rate(checked, seconds),
+        "damaged": damaged,
+        "damaged_notes": [],
+    }
+
+
+def scrub_vault(directory: str, password: str, workers: int = None, job=None, progress=None) -> dict:
+    """Check the vault in a directory without loading it into the app
+
+    Uses the index when it opens (see scrub_store()); otherwise its error
+    is reported under "index" and the segments are walked. A vault still
+    in the single-file format before segments is only checked as a whole.
+    """
+    if (not os.path.exists(os.path.join(directory, KEY_NAME)) and not VaultStore.exists(directory)
+            and os.path.exists(os.path.join(directory, LEGACY_VAULT_NAME))):
+        return _scrub_legacy(directory, password)
+    key = _unlock(directory, password)
+    store = VaultStore(key, directory)
+    try:
+        try:
+            store.open_index()
+        except Exception as e:
+            report = _scrub_walk(key, directory, job)
+            report["index"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            return report
+        return scrub_store(store, workers, job, progress)
+    finally:
+        store.close()
+
+
+def _scrub_legacy(directory: str, password: str) -> dict:
+    path = os.path.join(directory, LEGACY_VAULT_NAME)
+    start = time.perf_counter()
+    size = os.path.getsize(path)
+    damaged = []
+    try:
+        read_legacy_vault(password, directory)
+    except Exception:
+        damaged.append(_damage(path, 0, size, "vault", "Single-file vault does not decrypt (wrong PIN or damage)"))
+    seconds = time.perf_counter() - start
+    return {"index": "none", "records": 1, "bytes": size, "seconds": round(seconds, 3),
+            "mb_per_second": _rate(size, seconds), "damaged": damaged, "damaged_notes": []}
+
+
+def scrub_export(path: str, pin: str) -> dict:
+    """Check every chunk tag of a .venc export or archive
+
+    Offsets of an armored (base64) file are those of its decoded bytes.
+    A v1 export has no chunks and is only checked as a whole.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        blob = f.read()
+    if not is_stream(blob[:5]):
+        try:
+            decoded = EncryptionManager.dearmor(blob)
+        except Exception:
+            decoded = b""
+        if not is_stream(decoded[:5]):
+            damaged = []
+            try:
+                json.loads(EncryptionManager.decrypt(blob.decode(), pin))
+            except Exception:
+                damaged.append(_damage(path, 0, len(blob), "export", "Export does not decrypt (wrong PIN or damage)"))
+            seconds = time.perf_counter() - start
+            return {"file": os.path.basename(path), "chunks": 1, "bytes": len(blob), "seconds": round(seconds, 3),
+                    "mb_per_second": _rate(len(blob), seconds), "damaged": damaged}
+        blob = decoded
+    chunks, bad = scan_stream(io.BytesIO(blob), pin)
+    seconds = time.perf_counter() - start
+    damaged = [_damage(path, offset, length, "chunk", "Authentication tag does not verify", chunk=number)
+               for number, offset, length in bad]
+    return {"file": os.path.basename(path), "chunks": chunks, "bytes": len(blob), "seconds": round(seconds, 3),
+            "mb_per_second": _rate(len(blob), seconds), "damaged": damaged}
+
+
+def _salvage_indexed(store: VaultStore):
+    """Yield (note id, title, note or None, revision used or None) for an open store"""
+    for note_id in list(store.order):
+        title = store.summary(note_id)["title"]
+        try:
+            yield note_id, title, store.get(note_id), None
+            continue
+        except Exception:
+            pass
+        for entry in reversed(store.revisions(note_id)):
+            try:
+                yield note_id, title, store.revision(note_id, entry["revision"]), entry["revision"]
+                break
+            except Exception:
+                continue
+        else:
+            yield note_id, title, None, None
+
+
+def _salvage_walked(key: VaultKey, directory: str):
+    """Yield salvaged notes like _salvage_indexed(), from the segments alone
+
+    The last readable version of each note wins, so notes deleted since
+    the last compaction may come back.
+    """
+    openers = _walk_openers(key)
+    dictionaries = _dictionaries(key, directory)
+    notes = {}
+    chunks = {}
+    for path in _segment_paths(directory):
+        for kind, _, _, value in walk_segment(path, openers, dictionaries):
+            if kind == "note":
+                notes.pop(value.id, None)
+                notes[value.id] = value
+            elif kind == "chunk":
+                chunks[value[0]] = value[1]
+    for note_id, note in notes.items():
+        if note.chunks is None:
+            yield note_id, note.title, note, None
+        elif all(chunk in chunks for chunk in note.chunks):
+            yield note_id, note.title, note.assembled(b"".join(chunks[chunk] for chunk in note.chunks)), None
+        else:
+            yield note_id, note.title, None, None
+
+
+def recover_vault(directory: str, password: str, target: str, kdf=None) -> dict:
+    """Copy every readable note of a damaged vault into a fresh vault at target
+
+    The new vault is wrapped under the same password, so the same PIN
+    (or device key) opens it. Sealed notes stay sealed under their own
+    document PIN. Returns lists of the recovered note ids, the notes
+    rebuilt from a revision ({id, title, revision}), and the notes that
+    were lost ({id, title}).
+    """
+    if os.path.exists(os.path.join(target, KEY_NAME)) or VaultStore.exists(target):
+        raise FileExistsError(f"{target} already holds a vault")
+    key = _unlock(directory, password)
+    source = VaultStore(key, directory)
+    try:
+        try:
+            source.open_index()
+            salvaged = list(_salvage_indexed(source))
+        except Exception:
+            salvaged = list(_salvage_walked(key, directory))
+    finally:
+        source.close()
+    os.makedirs(target, exist_ok=True)
+    store, _, success = open_vault(password, target, kdf=kdf)
+    if not success:
+        raise ValueError(f"Could not create a vault in {target}")
+    report = {"recovered": [], "from_revision": [], "lost": []}
+    notes = []
+    for note_id, title, note, revision in salvaged:
+        if note is None:
+            report["lost"].append({"id": note_id, "title": title})
+            continue
+        note.id = note_id
+        notes.append(note)
+        report["recovered"].append(note_id)
+        if revision is not None:
+            report["from_revision"].append({"id": note_id, "title": title, "revision": revision})
+    try:
+        store.put_many(notes)
+    finally:
+        store.close()
+    return report
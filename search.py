@@ -0,0 +1,196 @@
+"""
+VaultNote Search Module
+Encrypted inverted index over note titles and bodies (no GUI dependencies)
+
+The index is updated note by note on save and delete and stored encrypted
+next to the vault. Queries match whole terms, or prefixes when a term ends
+with "*", and rank notes with BM25. Notes with a document PIN are indexed
+by title only; their content is never indexed, since it is sealed under
+the PIN and the index is only encrypted under the vault key.
+"""
+import bisect
+import json
+import math
+import os
+import re
+import threading
+
+from vault import write_atomic
+
+SEARCH_INDEX_NAME = "vault_search.enc"
+SEARCH_INDEX_VERSION = 1
+
+# Title terms count for more than body terms when ranking
+TITLE_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_QUERY_TOKEN = re.compile(r"\w+\*?")
+
+
+def tokenize(text: str) -> list:
+    """Split text into case-folded word terms"""
+    return _TOKEN.findall(text.casefold())
+
+
+def note_stamp(summary: dict, content_indexed: bool) -> list:
+    """Identify the note version an index entry was built from"""
+    return [summary.get("timestamp"), summary.get("size"), content_indexed]
+
+
+class SearchIndex:
+    """Incrementally maintained inverted index with prefix lookups"""
+
+    def __init__(self):
+        self.dirty = False
+        self._postings = {}
+        self._docs = {}
+        self._lengths = {}
+        self._terms = []
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def stamp(self, note_id: str):
+        entry = self._docs.get(note_id)
+        return None if entry is None else entry[0]
+
+    def add(self, note_id: str, title: str, content: str = None, stamp: list = None):
+        """Index a note, replacing any earlier version of it"""
+        weights = {}
+        for term in tokenize(title):
+            weights[term] = weights.get(term, 0) + TITLE_WEIGHT
+        if content is not None:
+            for term in tokenize(content):
+                weights[term] = weights.get(term, 0) + 1
+        with self._lock:
+            self._remove(note_id)
+            self._insert(note_id, stamp, weights)
+            self.dirty = True
+
+    def remove(self, note_id: str):
+        with self._lock:
+            self._remove(note_id)
+            self.dirty = True
+
+    def search(self, query: str, limit: int = 50) -> list:
+        """Return note ids matching every query term, best match first"""
+        words = _QUERY_TOKEN.findall(query.casefold())
+        if not words:
+            return []
+        with self._lock:
+            scores = None
+            for word in words:
+                term_scores = {}
+                for term in self._expand(word):
+                    self._score_term(term, term_scores)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        note_id: score + term_scores[note_id]
+                        for note_id, score in scores.items()
+                        if note_id in term_scores
+                    }
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [note_id for note_id, _ in ranked[:limit]]
+
+    def reconcile(self, store, job=None) -> int:
+        """Bring the index in line with the vault manifest
+
+        Notes whose stamp changed since they were indexed are re-read from
+        the store; notes no longer in the vault are dropped. Locked notes
+        are indexed by title only. Returns the number of notes re-indexed.
+        """
+        live = set(store.order)
+        for note_id in [note_id for note_id in self._docs if note_id not in live]:
+            self.remove(note_id)
+        reindexed = 0
+        for note_id in list(store.order):
+            if job is not None:
+                job.check()
+            summary = store.summary(note_id)
+            # Locked notes are sealed under their PIN, so the index must not hold their content
+            with_content = not summary.get("locked")
+            stamp = note_stamp(summary, with_content)
+            if self.stamp(note_id) == stamp:
+                continue
+            content = store.get(note_id)["content"] if with_content else None
+            self.add(note_id, summary["title"], content, stamp)
+            reindexed += 1
+        return reindexed
+
+    def save(self, vault_key, directory: str = "."):
+        """Encrypt the index and write it next to the vault"""
+        with self._lock:
+            data = json.dumps({
+                "version": SEARCH_INDEX_VERSION,
+                "docs": {note_id: [stamp, weights] for note_id, (stamp, weights) in self._docs.items()},
+            }).encode()
+            self.dirty = False
+        write_atomic(os.path.join(directory, SEARCH_INDEX_NAME), vault_key.encrypt(data, "search"))
+
+    @classmethod
+    def load(cls, vault_key, directory: str = ".") -> "SearchIndex":
+        """Read the stored index, or start an empty one if it is missing or stale"""
+        index = cls()
+        path = os.path.join(directory, SEARCH_INDEX_NAME)
+        if not os.path.exists(path):
+            return index
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(vault_key.decrypt(f.read(), "search"))
+        except Exception:
+            # The index only holds derived data; reconcile() rebuilds it
+            return index
+        if data.get("version") != SEARCH_INDEX_VERSION:
+            return index
+        for note_id, (stamp, weights) in data["docs"].items():
+            index._insert(note_id, stamp, weights)
+        return index
+
+    def _insert(self, note_id: str, stamp: list, weights: dict):
+        self._docs[note_id] = (stamp, weights)
+        self._lengths[note_id] = sum(weights.values())
+        self._total_length += self._lengths[note_id]
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[note_id] = weight
+
+    def _remove(self, note_id: str):
+        entry = self._docs.pop(note_id, None)
+        if entry is None:
+            return
+        weights = entry[1]
+        self._total_length -= self._lengths.pop(note_id)
+        for term in weights:
+            postings = self._postings[term]
+            del postings[note_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, word: str) -> list:
+        if not word.endswith("*"):
+            return [word] if word in self._postings else []
+        prefix = word[:-1]
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff")
+        return self._terms[start:end]
+
+    def _score_term(self, term: str, scores: dict):
+        postings = self._postings[term]
+        count = len(self._docs)
+        average = self._total_length / count
+        idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for note_id, weight in postings.items():
+            norm = weight + BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[note_id] / average)
+            scores[note_id] = scores.get(note_id, 0) + idf * weight * (BM25_K1 + 1) / norm
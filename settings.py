@@ -0,0 +1,316 @@
+"""
+VaultNote Settings Module
+Reads and writes vault_settings.json (no GUI dependencies)
+
+Settings hold the random device key, which unlocks the vault while no
+vault PIN is set, the hash of the vault PIN once one is, and the KDF
+parameters calibrated for this device. Setting "diagnostics" to "log" or
+"trace" turns on instrumentation in the app (see diagnostics_sink).
+
+Each directory's settings are served by one Settings object (see
+settings_store()), which reads the file once and keeps it in memory. It
+checks the file's size and modification time before answering, so a
+change made by another process (such as cli.py) is picked up without
+parsing the file again otherwise. Changes are validated against SCHEMA,
+written through atomically, and passed to listeners.
+
+Every write also refreshes a backup copy. A damaged settings file is
+restored from it; if both are unreadable while a vault exists, loading
+raises SettingsError rather than making up a device key that could not
+unlock that vault. load_settings() and save_settings() work on copies of
+the cached settings.
+"""
+import copy
+import json
+import os
+import threading
+
+import instrument
+from encryption import KDF, EncryptionManager, calibrate_kdf
+from vault import INDEX_NAME, KEY_NAME, LEGACY_VAULT_NAME, write_atomic
+
+SETTINGS_NAME = "vault_settings.json"
+SETTINGS_BACKUP_NAME = "vault_settings.bak.json"
+TRACE_NAME = "vault_trace.jsonl"
+# Allowed types of each known setting; other keys are kept as they are
+SCHEMA = {
+    "vault_locked": (bool,),
+    "vault_pin_hash": (str, type(None)),
+    "device_key": (str,),
+    "kdf": (dict,),
+    "diagnostics": (str, type(None)),
+}
+REQUIRED = ("vault_locked", "vault_pin_hash", "device_key")
+DIAGNOSTICS_MODES = (None, "log", "trace")
+
+
+class SettingsError(ValueError):
+    """Settings that fail validation, or that cannot be read for an existing vault"""
+
+
+def settings_path(directory: str = ".") -> str:
+    return os.path.join(directory, SETTINGS_NAME)
+
+
+def default_settings() -> dict:
+    return {
+        "vault_locked": False,
+        "vault_pin_hash": None,
+        "device_key": EncryptionManager.generate_device_key(),
+    }
+
+
+def validate_settings(settings: dict) -> dict:
+    """Check settings against SCHEMA and return them; raises SettingsError"""
+    if not isinstance(settings, dict):
+        raise SettingsError("Settings must be a JSON object")
+    for key in REQUIRED:
+        if key not in settings:
+            raise SettingsError(f"Setting {key!r} is missing")
+    for key, types in SCHEMA.items():
+        if key in settings and not isinstance(settings[key], types):
+            raise SettingsError(f"Setting {key!r} has the wrong type")
+    if not settings["device_key"]:
+        raise SettingsError("Setting 'device_key' is empty")
+    if settings["vault_locked"] and not settings["vault_pin_hash"]:
+        raise SettingsError("Vault is locked but no PIN hash is set")
+    if settings.get("diagnostics") not in DIAGNOSTICS_MODES:
+        raise SettingsError(f"Setting 'diagnostics' must be one of {DIAGNOSTICS_MODES}")
+    if "kdf" in settings:
+        try:
+            KDF.from_dict(settings["kdf"])
+        except Exception:
+            raise SettingsError("Setting 'kdf' is not a valid KDF") from None
+    return settings
+
+
+def _vault_exists(directory: str) -> bool:
+    return any(os.path.exists(os.path.join(directory, name)) for name in (KEY_NAME, INDEX_NAME, LEGACY_VAULT_NAME))
+
+
+class Settings:
+    """The settings of one directory, loaded once and written through"""
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+        self._data = None
+        self._stamp = None
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    @property
+    def path(self) -> str:
+        return settings_path(self.directory)
+
+    @property
+    def backup_path(self) -> str:
+        return os.path.join(self.directory, SETTINGS_BACKUP_NAME)
+
+    def snapshot(self) -> dict:
+        """A copy of the current settings, safe to change before replace()"""
+        with self._lock:
+            return copy.deepcopy(self._current())
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            return copy.deepcopy(self._current().get(key, default))
+
+    def __getitem__(self, key: str):
+        with self._lock:
+            return copy.deepcopy(self._current()[key])
+
+    def update(self, changes: dict = None, **values):
+        """Change some settings, then persist and notify listeners"""
+        with self._lock:
+            settings = copy.deepcopy(self._current())
+            settings.update(changes or {}, **values)
+            changed = self._commit(settings)
+        self._notify(changed, settings)
+
+    def replace(self, settings: dict):
+        """Make settings the whole new settings, then persist and notify listeners"""
+        settings = copy.deepcopy(settings)
+        with self._lock:
+            changed = self._commit(settings)
+        self._notify(changed, settings)
+
+    def subscribe(self, listener):
+        """Call listener(changed keys, settings) after every change; returns listener"""
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _commit(self, settings: dict) -> set:
+        """Validate and write settings; returns the keys that changed"""
+        validate_settings(settings)
+        previous = self._current()
+        changed = {key for key in previous.keys() | settings.keys() if previous.get(key) != settings.get(key)}
+        if changed:
+            self._write(settings)
+        return changed
+
+    def _notify(self, changed: set, settings: dict):
+        # Listeners run outside the lock, so they may read or change settings themselves
+        if changed:
+            for listener in list(self._listeners):
+                listener(changed, copy.deepcopy(settings))
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _current(self) -> dict:
+        if self._data is None or self._file_stamp() != self._stamp:
+            self._data = self._load()
+        return self._data
+
+    def _read(self, path: str) -> dict:
+        with open(path, "rb") as f:
+            return validate_settings(json.loads(f.read()))
+
+    def _load(self) -> dict:
+        """Read the settings file, falling back to the backup, or create them"""
+        error = None
+        for path in (self.path, self.backup_path):
+            try:
+                settings = self._read(path)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                error = error or e
+                continue
+            if path != self.path or not os.path.exists(self.backup_path):
+                self._write(settings)
+            else:
+                self._stamp = self._file_stamp()
+            return settings
+        if _vault_exists(self.directory):
+            reason = f"is damaged ({error})" if error is not None else "is missing"
+            raise SettingsError(f"{SETTINGS_NAME} {reason} and has no usable backup; "
+                                f"its device key cannot be recovered")
+        settings = default_settings()
+        self._write(settings)
+        return settings
+
+    def _write(self, settings: dict):
+        data = json.dumps(settings).encode()
+        write_atomic(self.path, data)
+        write_atomic(self.backup_path, data)
+        self._data = settings
+        self._stamp = self._file_stamp()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def settings_store(directory: str = ".") -> Settings:
+    """The shared Settings of a directory"""
+    key = os.path.abspath(directory)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = Settings(directory)
+        return store
+
+
+def load_settings(directory: str = ".") -> dict:
+    """Return a copy of the settings, creating them with a new device key on first use"""
+    return settings_store(directory).snapshot()
+
+
+def save_settings(settings: dict, directory: str = "."):
+    """Validate and persist settings as the directory's new settings"""
+    settings_store(directory).replace(settings)
+
+
+def device_kdf(settings: dict, directory: str = ".") -> KDF:
+    """Return the KDF calibrated for this device, calibrating on first use
+
+    Calibration benchmarks the KDF once (well under a second) and stores
+    the result, so unlock time is about the same on every device.
+    """
+    if "kdf" not in settings:
+        settings["kdf"] = calibrate_kdf().to_dict()
+        settings_store(directory).update(kdf=settings["kdf"])
+    return KDF.from_dict(settings["kdf"])
+
+
+def diagnostics_sink(settings: dict, directory: str = "."):
+    """Return the instrumentation sink the settings ask for, or None
+
+    "log" writes each span through logging, which reaches logcat on
+    Android; "trace" appends JSON lines to vault_trace.jsonl, which
+    "cli.py diagnostics" summarizes.
+    """
+    mode = settings.get("diagnostics")
+    if mode == "log":
+        return instrument.LogSink()
+    if mode == "trace":
+        return instrument.JsonLinesSink(os.path.join(directory, TRACE_NAME))
+    return None
+
+
+def check_pin(settings: dict, pin: str) -> bool:
+    """True if pin is the vault PIN"""
+    return EncryptionManager.hash_pin(pin) == settings.get("vault_pin_hash")
+
+
+def vault_password(settings: dict, pin: str = None) -> str:
+    """Return the password that unwraps the vault key
+
+    That is the device key while no vault PIN is set, otherwise the PIN,
+    which must match the stored hash.
+    """
+    if not settings.get("vault_locked"):
+        return settings["device_key"]
+    if pin is None or not check_pin(settings, pin):
+        raise ValueError("Incorrect vault PIN")
+    return pin
+
+
+def set_vault_pin(settings: dict, pin: str = None) -> str:
+    """Set or (with no pin) remove the vault PIN and return the new password
+
+    Only the settings dict is updated; change_vault_pin() also rewraps
+    the vault key and saves the settings.
+    """
+    if pin:
+        settings["vault_locked"] = True
+        settings["vault_pin_hash"] = EncryptionManager.hash_pin(pin)
+        return pin
+    settings["vault_locked"] = False
+    settings["vault_pin_hash"] = None
+    return settings["device_key"]
+
+
+def change_vault_pin(store, settings: dict, pin: str = None, old_password: str = None, directory: str = ".") -> str:
+    """Set or remove the vault PIN, rewrapping the vault key and saving settings together
+
+    The new settings are validated before the key is rewrapped and saved
+    right after it, so the stored PIN hash never lags behind the key
+    wrap. If they cannot be saved, the key is wrapped back under
+    old_password. settings is updated in place; returns the new password.
+    """
+    kdf = device_kdf(settings, directory)
+    changed = copy.deepcopy(settings)
+    password = set_vault_pin(changed, pin)
+    validate_settings(changed)
+    store.rewrap(password, kdf)
+    try:
+        settings_store(directory).replace(changed)
+    except BaseException:
+        if old_password is not None:
+            store.rewrap(old_password, kdf)
+        raise
+    settings.clear()
+    settings.update(changed)
+    return password
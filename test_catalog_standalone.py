@@ -0,0 +1,104 @@
+"""
+VaultNote Catalog Tests (Standalone - No GUI Dependencies)
+Tests the sorted, paginated note catalog without Kivy
+"""
+import random
+
+from catalog import Catalog, SortedKeys
+from notes import Note
+
+
+def make_summaries(count, seed=5):
+    rng = random.Random(seed)
+    return [Note(rng.choice(["alpha", "Beta", "gamma", "Delta"]) + str(i), None, i % 3 == 0, None,
+                 rng.randrange(10 ** 12), f"{i:032x}", 10) for i in range(count)]
+
+
+def read_all(catalog, *args, cursor=None, **kwargs):
+    notes, cursor = catalog.page(*args, cursor=cursor, limit=7, **kwargs)
+    while cursor is not None:
+        page, cursor = catalog.page(*args, cursor=cursor, limit=7, **kwargs)
+        notes.extend(page)
+    return notes
+
+
+def test_sorted_pages():
+    """Test that pages walk each order and filter completely"""
+    notes = make_summaries(300)
+    catalog = Catalog(notes)
+    assert read_all(catalog) == notes, "Vault order not kept"
+    by_title = read_all(catalog, "title")
+    assert [n.title for n in by_title] == sorted((n.title for n in notes), key=str.casefold), "Title order wrong"
+    newest = read_all(catalog, "timestamp", reverse=True)
+    assert [n.stamp for n in newest] == sorted((n.stamp for n in notes), reverse=True), "Newest first order wrong"
+    locked = read_all(catalog, "title", True)
+    assert locked and all(n.locked for n in locked) and len(locked) == catalog.count(True), "Lock filter wrong"
+    print("✓ Sorted pages test passed")
+
+
+def test_incremental_updates():
+    """Test that edits keep every index in order and cursors stay valid"""
+    notes = make_summaries(200)
+    catalog = Catalog(notes[:100])
+    for note in notes[100:]:
+        catalog.put(note)
+    first, cursor = catalog.page("title", limit=10)
+    renamed = Note("zzz renamed", None, True, None, 1, notes[5].id, 10)
+    catalog.put(renamed)
+    catalog.remove(notes[7].id)
+    rest = read_all(catalog, "title", cursor=cursor)
+    assert rest[-1] is renamed and notes[7] not in rest, "Page after an edit misses the change"
+    assert [n.title for n in rest] == sorted([n.title for n in rest], key=str.casefold), "Order broken by edits"
+    assert catalog.count() == 199 and catalog.count(True) + catalog.count(False) == 199, "Counts wrong after edits"
+    assert read_all(catalog)[5] is renamed, "An update should keep the note's place in vault order"
+    for args in [("title",), ("timestamp", None, True), ("added", True), ("title", False, True)]:
+        order, locked, reverse = (args + (None, False))[:3]
+        listed = read_all(catalog, order, locked, reverse=reverse)
+        assert all(catalog.position(n.id, order, locked, reverse) == i for i, n in enumerate(listed)), args
+    assert catalog.position(notes[7].id) is None and catalog.position(renamed.id, locked=False) is None
+    print("✓ Incremental catalog update test passed")
+
+
+def test_sorted_keys():
+    """Test the split sorted list against a plain sorted list"""
+    rng = random.Random(9)
+    keys = SortedKeys()
+    reference = set()
+    for _ in range(20000):
+        key = (rng.randrange(3000),)
+        if key in reference:
+            keys.remove(key)
+            reference.discard(key)
+        else:
+            keys.add(key)
+            reference.add(key)
+    ordered = sorted(reference)
+    assert list(keys) == ordered and len(keys) == len(ordered), "Keys out of order"
+    assert list(keys.after((1500,))) == [k for k in ordered if k > (1500,)], "after() wrong"
+    assert list(keys.before((1500,))) == [k for k in reversed(ordered) if k < (1500,)], "before() wrong"
+    assert all(keys.index(ordered[i]) == i for i in range(0, len(ordered), 97)), "index() wrong"
+    try:
+        keys.remove((-1,))
+        assert False, "Removing a missing key should raise KeyError"
+    except KeyError:
+        pass
+    print("✓ Sorted keys test passed")
+
+
+def run_all_tests():
+    """Run all catalog tests"""
+    print("\n" + "="*60)
+    print("VaultNote Catalog Tests")
+    print("="*60 + "\n")
+
+    test_sorted_pages()
+    test_incremental_updates()
+    test_sorted_keys()
+
+    print("\n" + "="*60)
+    print("✅ All catalog tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,62 @@
+"""
+VaultNote Content Chunking Tests (Standalone - No GUI Dependencies)
+Tests content-defined chunk boundaries and chunk addresses without Kivy
+"""
+import random
+
+from chunks import MAX_CHUNK, MIN_CHUNK, chunk_boundaries, chunk_id, split_chunks
+
+
+def make_text(size, seed=3):
+    rng = random.Random(seed)
+    words = [bytes(rng.choice(b"abcdefgh ") for _ in range(rng.randint(2, 9))) for _ in range(500)]
+    parts = []
+    total = 0
+    while total < size:
+        parts.append(rng.choice(words) + (b"\n" if rng.random() < 0.1 else b" "))
+        total += len(parts[-1])
+    return b"".join(parts)
+
+
+def test_chunk_boundaries():
+    """Test that chunks cover the data within the size limits"""
+    data = make_text(500_000)
+    chunks = split_chunks(data)
+    assert b"".join(chunks) == data, "Chunks do not rebuild the data"
+    assert all(len(chunk) <= MAX_CHUNK for chunk in chunks), "Chunk over the maximum size"
+    assert all(len(chunk) >= MIN_CHUNK for chunk in chunks[:-1]), "Chunk under the minimum size"
+    assert split_chunks(b"") == [] and chunk_boundaries(b"short") == [5], "Small inputs misread"
+    assert len(split_chunks(bytes(200_000))) == 4, "Data with no cut points should split at the maximum"
+    print("✓ Chunk boundaries test passed")
+
+
+def test_chunks_follow_content():
+    """Test that an edit only changes the chunks around it"""
+    data = make_text(500_000)
+    edited = data[:250_000] + b"a few inserted words " + data[250_000:]
+    before = set(split_chunks(data))
+    changed = [chunk for chunk in split_chunks(edited) if chunk not in before]
+    assert 1 <= len(changed) <= 2, f"Insert changed {len(changed)} chunks"
+
+    key, other = b"k" * 32, b"o" * 32
+    assert chunk_id(key, b"chunk") == chunk_id(key, b"chunk"), "Chunk ids should be stable"
+    assert chunk_id(key, b"chunk") != chunk_id(other, b"chunk"), "Chunk ids should depend on the key"
+    print("✓ Content-defined chunking test passed")
+
+
+def run_all_tests():
+    """Run all chunking tests"""
+    print("\n" + "="*60)
+    print("VaultNote Content Chunking Tests")
+    print("="*60 + "\n")
+
+    test_chunk_boundaries()
+    test_chunks_follow_content()
+
+    print("\n" + "="*60)
+    print("✅ All chunking tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,242 @@
+"""
+VaultNote Command Line Tests (Standalone - No GUI Dependencies)
+Tests the settings module and CLI commands without Kivy
+"""
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import cli
+import vault
+from settings import (
+    SETTINGS_BACKUP_NAME, SETTINGS_NAME, Settings, SettingsError, change_vault_pin, check_pin, load_settings,
+    set_vault_pin, settings_store, vault_password,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_settings_pin_handling():
+    """Test that the vault password follows the PIN setting"""
+    with tempfile.TemporaryDirectory() as directory:
+        settings = load_settings(directory)
+        assert load_settings(directory)["device_key"] == settings["device_key"], "Device key not persisted"
+        assert vault_password(settings) == settings["device_key"], "Unlocked vault should use the device key"
+
+        assert set_vault_pin(settings, "2468") == "2468", "New password should be the PIN"
+        assert check_pin(settings, "2468") and vault_password(settings, "2468") == "2468", "PIN not accepted"
+        try:
+            vault_password(settings, "1111")
+            assert False, "Wrong PIN should be rejected"
+        except ValueError:
+            pass
+        assert set_vault_pin(settings, None) == settings["device_key"], "Removing the PIN should restore the device key"
+        print("✓ Settings PIN handling test passed")
+
+
+def test_settings_store():
+    """Test that settings are read once, validated, written through and restored from backup"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = settings_store(directory)
+        device_key = store["device_key"]
+        reads = []
+        read = Settings._read
+        Settings._read = lambda self, path: (reads.append(path), read(self, path))[1]
+        try:
+            for _ in range(5):
+                assert load_settings(directory)["device_key"] == device_key, "Device key changed"
+            assert reads == [], f"Cached settings were read again: {reads}"
+
+            changes = []
+            store.subscribe(lambda changed, values: changes.append((changed, values["diagnostics"])))
+            store.update(diagnostics="trace")
+            store.update(diagnostics="trace")
+            assert changes == [({"diagnostics"}, "trace")], f"Listeners not notified once: {changes}"
+            try:
+                store.update(vault_locked="yes")
+                assert False, "Invalid setting should be rejected"
+            except SettingsError:
+                pass
+            assert store.get("vault_locked") is False, "Rejected change was applied"
+
+            # Another process writing the file is noticed without re-reading otherwise
+            other = Settings(directory)
+            other.update(diagnostics="log")
+            assert store.get("diagnostics") == "log" and len(reads) == 2, "External change not picked up"
+        finally:
+            Settings._read = read
+
+        with open(os.path.join(directory, SETTINGS_NAME), "w") as f:
+            f.write("{ damaged")
+        assert Settings(directory)["device_key"] == device_key, "Damaged settings not restored from backup"
+        with open(os.path.join(directory, SETTINGS_NAME)) as f:
+            assert "device_key" in f.read(), "Restored settings not written back"
+
+        with open(os.path.join(directory, vault.KEY_NAME), "wb") as f:
+            f.write(b"wrapped key")
+        for name in (SETTINGS_NAME, SETTINGS_BACKUP_NAME):
+            with open(os.path.join(directory, name), "w") as f:
+                f.write("{ damaged")
+        try:
+            Settings(directory).snapshot()
+            assert False, "A new device key must not replace one an existing vault needs"
+        except SettingsError:
+            pass
+        os.remove(os.path.join(directory, vault.KEY_NAME))
+        assert Settings(directory)["device_key"] != device_key, "New directory should get a fresh device key"
+        print("✓ Settings store test passed")
+
+
+def test_change_vault_pin():
+    """Test that the key wrap and the saved PIN hash change together, or not at all"""
+    with tempfile.TemporaryDirectory() as directory:
+        settings = load_settings(directory)
+        store, _, _ = vault.open_vault(settings["device_key"], directory)
+        assert change_vault_pin(store, settings, "2468", settings["device_key"], directory) == "2468"
+        saved = load_settings(directory)
+        assert saved["vault_locked"] and check_pin(saved, "2468"), "PIN hash not saved with the rewrap"
+        assert vault.open_vault("2468", directory)[2], "Vault key not wrapped under the new PIN"
+
+        write = Settings._write
+        Settings._write = lambda self, values: (_ for _ in ()).throw(OSError("disk full"))
+        try:
+            change_vault_pin(store, settings, "1357", "2468", directory)
+            assert False, "A failed settings write should be reported"
+        except OSError:
+            pass
+        finally:
+            Settings._write = write
+        assert check_pin(load_settings(directory), "2468") and check_pin(settings, "2468"), "Settings changed"
+        assert vault.open_vault("2468", directory)[2], "Key not wrapped back under the old PIN"
+        print("✓ Vault PIN change test passed")
+
+
+def test_cli_bulk_roundtrip():
+    """Test import, list, export, rekey and verify through the CLI"""
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "plan.txt")
+        with open(text_path, "w") as f:
+            f.write("step one")
+        exports = os.path.join(directory, "exports")
+
+        assert cli.main(["--directory", directory, "import", text_path]) == 0, "Import failed"
+        assert cli.main(["--directory", directory, "export", "--output", exports, "--export-pin", "x"]) == 0, "Export failed"
+        assert cli.main(["--directory", directory, "rekey", "--new-pin", "1357"]) == 0, "Rekey failed"
+        assert cli.main(["--directory", directory, "--pin", "0000", "verify"]) == 2, "Wrong PIN should fail"
+        assert cli.main(["--directory", directory, "--pin", "1357", "import",
+                         os.path.join(exports, "plan.txt.venc"), "--export-pin", "x"]) == 0, "Export re-import failed"
+        assert cli.main(["--directory", directory, "--pin", "1357", "verify"]) == 0, "Verify failed"
+
+        _, notes, success = vault.open_vault("1357", directory)
+        assert success and [note["content"] for note in notes] == ["step one", "step one"], "Notes not imported"
+        print("✓ CLI bulk roundtrip test passed")
+
+
+def test_cli_history():
+    """Test listing, showing, restoring and pruning revisions through the CLI"""
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "plan.txt")
+        with open(text_path, "w") as f:
+            f.write("draft 0")
+        assert cli.main(["--directory", directory, "import", text_path]) == 0, "Import failed"
+        store, notes, _ = vault.open_vault(vault_password(load_settings(directory)), directory)
+        for n in range(1, 4):
+            store.put({"id": notes[0]["id"], "title": "plan.txt", "content": f"draft {n}"})
+        store.close()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            assert cli.main(["--directory", directory, "history", "plan.txt"]) == 0, "History listing failed"
+            assert cli.main(["--directory", directory, "history", "plan.txt", "--show", "2"]) == 0, "Show failed"
+        lines = output.getvalue().splitlines()
+        assert len(lines) == 4 and lines[-1] == "draft 1", f"Unexpected history output {lines}"
+        assert cli.main(["--directory", directory, "history", "plan.txt", "--restore", "1"]) == 0, "Restore failed"
+        assert cli.main(["--directory", directory, "prune", "--keep", "1"]) == 0, "Prune failed"
+
+        store, notes, _ = vault.open_vault(vault_password(load_settings(directory)), directory)
+        assert notes[0]["content"] == "draft 0", "Revision not restored"
+        assert [r["revision"] for r in store.revisions(notes[0]["id"])] == [4], "Prune kept the wrong revisions"
+        print("✓ CLI history test passed")
+
+
+def test_cli_scrub_and_recover():
+    """Test that scrub reports a damaged record and recover salvages the rest"""
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "vault")
+        target = os.path.join(directory, "recovered")
+        os.makedirs(source)
+        store, _, _ = vault.open_vault(vault_password(load_settings(source)), source)
+        note_ids = [store.put({"title": f"Note {i}", "content": f"Content {i}"}) for i in range(3)]
+        offset, length = store.records[note_ids[1]]
+        path = store.segment_path
+        store.close()
+        assert cli.main(["--directory", source, "scrub"]) == 0, "Clean vault should scrub cleanly"
+        with open(path, "r+b") as f:
+            f.seek(offset + length - 1)
+            value = f.read(1)[0]
+            f.seek(offset + length - 1)
+            f.write(bytes([value ^ 1]))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            assert cli.main(["--directory", source, "scrub"]) == 1, "Damage should fail the scrub"
+            assert cli.main(["--directory", source, "recover", target]) == 1, "A lost note should be reported"
+        assert f"offset {offset} length {length}" in output.getvalue(), f"Damage not located: {output.getvalue()}"
+        _, notes, success = vault.open_vault(vault_password(load_settings(target)), target)
+        assert success and [note["title"] for note in notes] == ["Note 0", "Note 2"], "Recovered vault wrong"
+        print("✓ CLI scrub and recover test passed")
+
+
+def test_cli_diagnostics():
+    """Test that a traced command can be summarized by diagnostics"""
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "plan.txt")
+        with open(text_path, "w") as f:
+            f.write("step one")
+        trace = os.path.join(directory, "trace.jsonl")
+
+        assert cli.main(["--directory", directory, "--trace", trace, "import", text_path]) == 0, "Traced import failed"
+        assert cli.main(["--directory", directory, "diagnostics", "--json"]) == 0, "Vault profile failed"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            assert cli.main(["--directory", directory, "diagnostics", trace]) == 0, "Trace summary failed"
+        assert "vault.unlock" in output.getvalue() and "p99 ms" in output.getvalue(), "Summary missing spans"
+        print("✓ CLI diagnostics test passed")
+
+
+def test_cli_cold_start():
+    """Test that the CLI starts without the GUI or crypto libraries"""
+    probe = "import sys, cli; print(sorted(m for m in ('kivy', 'cryptography') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=HERE, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]", f"CLI import loaded {result.stdout.strip()}"
+
+    result = subprocess.run([sys.executable, "cli.py", "--help"], cwd=HERE, capture_output=True, text=True)
+    assert result.returncode == 0 and "verify" in result.stdout, "CLI help failed"
+    print("✓ CLI cold start test passed")
+
+
+def run_all_tests():
+    """Run all command line tests"""
+    print("\n" + "="*60)
+    print("VaultNote Command Line Tests")
+    print("="*60 + "\n")
+
+    test_settings_pin_handling()
+    test_settings_store()
+    test_change_vault_pin()
+    test_cli_bulk_roundtrip()
+    test_cli_history()
+    test_cli_scrub_and_recover()
+    test_cli_diagnostics()
+    test_cli_cold_start()
+
+    print("\n" + "="*60)
+    print("✅ All command line tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
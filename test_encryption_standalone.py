@@ -2,7 +2,28 @@
 VaultNote Encryption Tests (Standalone - No GUI Dependencies)
 Tests core encryption functionality without Kivy
 """
-from encryption import EncryptionManager
+import io
+import os
+
+from cryptography.exceptions import InvalidTag
+
+from encryption import (
+    CODEC_RAW,
+    CODEC_ZLIB_DICT,
+    CONTAINER_HEADER,
+    FORMAT_MAGIC,
+    FORMAT_VERSION,
+    KDF,
+    EncryptionManager,
+    KeyCache,
+    VaultKey,
+    calibrate_kdf,
+    compress_payload,
+    decompress_payload,
+    decrypt_stream,
+    encrypt_stream,
+    train_dictionary,
+)
 
 
 def test_encryption_decryption():
@@ -90,6 +111,178 @@ def test_vault_password_change():
     print("✓ Vault password change test passed")
 
 
+def test_vault_key_session():
+    """Test that a session key encrypts repeatedly without re-deriving"""
+    vault_key = VaultKey.derive("session_pass")
+    first = vault_key.encrypt(b"first save")
+    second = vault_key.encrypt(b"second save")
+    
+    assert first != second, "Each save needs a fresh nonce"
+    assert VaultKey.read_salt(first) == vault_key.salt, "Salt must be stored in the header"
+    
+    reopened = VaultKey.derive("session_pass", VaultKey.read_salt(second))
+    assert reopened.decrypt(second) == b"second save", "Reopened session failed to decrypt"
+    print("✓ Vault session key test passed")
+
+
+def test_vault_key_zeroize():
+    """Test that a zeroized session key can no longer be used"""
+    vault_key = VaultKey.derive("session_pass")
+    blob = vault_key.encrypt(b"data")
+    vault_key.zeroize()
+    
+    assert vault_key.expired, "Zeroized key should report expired"
+    try:
+        vault_key.decrypt(blob)
+        assert False, "Zeroized key should not decrypt"
+    except ValueError:
+        print("✓ Vault key zeroization test passed")
+
+
+def test_key_cache():
+    """Test that cached document keys need their PIN and are zeroized when dropped"""
+    cache = KeyCache(capacity=2, idle_timeout=60)
+    first, second, third = VaultKey.generate(), VaultKey.generate(), VaultKey.generate()
+    cache.put("a", first, "1111")
+    cache.put("b", second, "2222")
+    assert cache.get("a", "1111") is first, "Cached key not returned"
+    assert cache.get("a", "2222") is None, "Key returned for the wrong PIN"
+
+    cache.put("c", third, "3333")
+    assert len(cache) == 2 and second.expired and not first.expired, "Least recently used key not evicted"
+
+    first.last_used -= 61
+    assert cache.get("a", "1111") is None and first.expired, "Idle key not expired"
+    cache.clear()
+    assert len(cache) == 0 and third.expired, "Clear should zeroize every key"
+    print("✓ Document key cache test passed")
+
+
+def test_legacy_blob_detection():
+    """Test that legacy blobs are told apart from versioned containers"""
+    import base64
+    legacy = base64.b64decode(EncryptionManager.encrypt("old vault", "pass"))
+    
+    assert VaultKey.read_salt(legacy) is None, "Legacy blob misread as versioned"
+    print("✓ Legacy format detection test passed")
+
+
+def test_stream_roundtrip():
+    """Test chunked stream encryption across chunk boundaries"""
+    for size in (0, 1, 4096, 4097, 20000):
+        data = os.urandom(size)
+        encrypted = io.BytesIO()
+        encrypt_stream(io.BytesIO(data), encrypted, "stream_pass", chunk_size=4096)
+        
+        decrypted = io.BytesIO()
+        decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, "stream_pass")
+        assert decrypted.getvalue() == data, f"Stream roundtrip failed for {size} bytes"
+    print("✓ Stream encryption roundtrip test passed")
+
+
+def test_stream_truncation_rejected():
+    """Test that dropping the final chunk fails authentication"""
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(10000)), encrypted, "stream_pass", chunk_size=4096)
+    truncated = encrypted.getvalue()[:-(10000 - 8192 + 16)]
+    
+    try:
+        decrypt_stream(io.BytesIO(truncated), io.BytesIO(), "stream_pass")
+        assert False, "Truncated stream should not decrypt"
+    except InvalidTag:
+        print("✓ Stream truncation rejection test passed")
+
+
+def test_binary_container():
+    """Test the binary container header and zero-copy decryption"""
+    data = b"binary vault payload"
+    blob = EncryptionManager.encrypt_bytes(data, "binary_pass")
+    
+    salt, kdf, size = VaultKey.read_header(blob)
+    assert kdf == KDF.pbkdf2(100000) and len(salt) == 16, "KDF parameters missing from header"
+    assert blob[size:].find(data) == -1, "Payload should not be stored in clear"
+    decrypted = EncryptionManager.decrypt_bytes(memoryview(bytearray(blob)), "binary_pass")
+    assert decrypted == data, "Binary container roundtrip failed"
+    print("✓ Binary container test passed")
+
+
+def test_data_key_wrapping():
+    """Test wrapping a random data key under a password"""
+    data_key = VaultKey.generate()
+    blob = data_key.encrypt(b"record")
+    wrapped = data_key.wrap("wrap_pass")
+
+    unwrapped = VaultKey.unwrap(wrapped, "wrap_pass")
+    assert unwrapped.decrypt(blob) == b"record", "Unwrapped key should decrypt data"
+    try:
+        VaultKey.unwrap(wrapped, "wrong_pass")
+        assert False, "Wrong password should not unwrap the key"
+    except InvalidTag:
+        pass
+    try:
+        VaultKey.for_blob("wrap_pass", blob)
+        assert False, "Data key blobs should not be opened with a password"
+    except ValueError:
+        pass
+    print("✓ Data key wrapping test passed")
+
+
+def test_compression_codecs():
+    """Test codec choice, dictionary priming and the raw fallback"""
+    samples = [f'{{"title": "Entry {i}", "content": "server restarted after update"}}'.encode() for i in range(20)]
+    dictionary = train_dictionary(samples)
+    short = b'{"title": "Entry 99", "content": "server restarted after update"}'
+
+    primed = compress_payload(short, dictionary)
+    assert primed[0] == CODEC_ZLIB_DICT, "Dictionary should pay off on a short note"
+    assert len(primed) < len(compress_payload(short)), "Dictionary should beat plain zlib"
+    assert decompress_payload(primed, [dictionary]) == short, "Dictionary roundtrip failed"
+
+    noise = os.urandom(4096)
+    stored = compress_payload(noise, dictionary)
+    assert stored[0] == CODEC_RAW and decompress_payload(stored) == noise, "Incompressible data should be stored raw"
+    print("✓ Compression codec test passed")
+
+
+def test_parallel_batch():
+    """Test that batch encryption keeps order and each item has its own salt"""
+    items = [f"document {i}".encode() for i in range(6)]
+    blobs = list(EncryptionManager.encrypt_many(items, "batch_pass", workers=2))
+
+    assert len({VaultKey.read_salt(blob) for blob in blobs}) == 6, "Each container needs its own salt"
+    decrypted = list(EncryptionManager.decrypt_many(blobs, "batch_pass", workers=2))
+    assert decrypted == items, "Batch roundtrip lost order or data"
+    print("✓ Parallel batch test passed")
+
+
+def test_kdf_calibration_and_header():
+    """Test calibration bounds and that KDF parameters travel in the header"""
+    assert calibrate_kdf(target=0) == KDF.scrypt(14), "Calibration should never go below the minimum"
+    pbkdf2 = calibrate_kdf(target=0, algorithm="pbkdf2")
+    assert pbkdf2 == KDF.pbkdf2(50000), f"Unexpected PBKDF2 floor {pbkdf2}"
+    assert KDF.from_dict(KDF.scrypt(15).to_dict()) == KDF.scrypt(15), "Settings form should roundtrip"
+
+    blob = EncryptionManager.encrypt_bytes(b"calibrated", "kdf_pass", KDF.scrypt(14))
+    assert VaultKey.read_header(blob)[1] == KDF.scrypt(14), "scrypt parameters missing from header"
+    assert EncryptionManager.decrypt_bytes(blob, "kdf_pass") == b"calibrated", "Header parameters not used"
+
+    # The header is read before anything is authenticated, so costs from it are bounded
+    wrapped = VaultKey.generate().wrap("kdf_pass", KDF.pbkdf2(50000))
+    tampered = [(1, 10 ** 9), (1, 0), (2, 30 << 16 | 8 << 8 | 1), (2, 0 << 16 | 8 << 8 | 1),
+                (2, 14 << 16 | 0 << 8 | 1), (2, 14 << 16 | 8 << 8 | 0), (2, 20 << 16 | 255 << 8 | 255),
+                # Each field oversized alone: memory through N, memory through r, and lanes
+                (2, 18 << 16 | 8 << 8 | 1), (2, 14 << 16 | 255 << 8 | 1), (2, 14 << 16 | 8 << 8 | 17)]
+    assert KDF.scrypt(17) and KDF.scrypt(14, 8, 16), "Parameters within the bounds should be accepted"
+    for kdf_id, cost in tampered:
+        header = CONTAINER_HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, kdf_id, cost, os.urandom(16))
+        try:
+            VaultKey.unwrap(header + wrapped[CONTAINER_HEADER.size:], "kdf_pass")
+            assert False, f"KDF {kdf_id} with cost {cost:#x} should be rejected"
+        except ValueError:
+            pass
+    print("✓ KDF calibration and header test passed")
+
+
 def run_all_tests():
     """Run all encryption tests"""
     print("\n" + "="*60)
@@ -102,6 +295,17 @@ def run_all_tests():
     test_device_key_generation()
     test_export_format()
     test_vault_password_change()
+    test_vault_key_session()
+    test_vault_key_zeroize()
+    test_key_cache()
+    test_legacy_blob_detection()
+    test_stream_roundtrip()
+    test_stream_truncation_rejected()
+    test_binary_container()
+    test_data_key_wrapping()
+    test_compression_codecs()
+    test_parallel_batch()
+    test_kdf_calibration_and_header()
     
     print("\n" + "="*60)
     print("✅ All encryption tests passed successfully!")
@@ -114,6 +318,8 @@ def run_all_tests():
     print("  • Random device key generation")
     print("  • Export/import encryption")
     print("  • Vault password re-encryption")
+    print("  • Session key reuse and zeroization")
+    print("  • Chunked stream encryption")
     print("\nNote: GUI tests require APK build on mobile device")
     print("="*60 + "\n")
 
@@ -0,0 +1,100 @@
+"""
+VaultNote Instrumentation Tests (Standalone - No GUI Dependencies)
+Tests spans, counters, sinks and summaries without Kivy
+"""
+import os
+import tempfile
+
+import instrument
+import vault
+
+
+def test_disabled_is_noop():
+    """Test that spans and counters record nothing while disabled"""
+    assert not instrument.enabled(), "Instrumentation should start disabled"
+    assert instrument.span("a") is instrument.span("b"), "Disabled spans should share one no-op"
+    with instrument.span("a") as span:
+        span.add(10)
+    instrument.count("a")
+    print("✓ Disabled instrumentation test passed")
+
+
+def test_vault_spans_and_counters():
+    """Test that vault operations report spans, bytes and cache counters"""
+    sink = instrument.RingBufferSink()
+    instrument.enable(sink)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store, _, success = vault.open_vault("vault_pass", directory)
+            assert success, "Vault failed to open"
+            note_id = store.put({"title": "Traced", "content": "x" * 1000})
+            store.cache.clear()
+            store.get(note_id)
+            store.get(note_id)
+            store.close()
+    finally:
+        instrument.disable()
+
+    summary = instrument.summarize(sink.events())
+    for name in ("vault.unlock", "vault.put", "vault.index.write", "vault.get", "aead.seal_record",
+                 "aead.open_record", "compress", "note.encode", "note.decode", "io.write_atomic"):
+        assert name in summary, f"No {name} span recorded"
+    assert summary["note.encode"]["bytes"] >= 1000, "Serialized bytes not counted"
+    assert summary["cache.miss"]["count"] == 1 and summary["cache.hit"]["count"] == 1, "Cache counters wrong"
+    assert summary["vault.get"]["p50"] <= summary["vault.get"]["max"], "Percentiles out of order"
+    print("✓ Vault spans and counters test passed")
+
+
+def test_summary_percentiles():
+    """Test nearest-rank percentiles and counter totals"""
+    events = [{"name": "op", "seconds": i / 100, "bytes": 2} for i in range(1, 101)]
+    events += [{"name": "hits", "count": 3}, {"name": "hits", "count": 4}]
+    summary = instrument.summarize(events)
+    assert summary["op"]["count"] == 100 and summary["op"]["bytes"] == 200, "Span totals wrong"
+    assert (summary["op"]["p50"], summary["op"]["p90"], summary["op"]["p99"]) == (0.5, 0.9, 0.99), "Percentiles wrong"
+    assert summary["hits"] == {"count": 7}, "Counter total wrong"
+    table = instrument.format_summary(summary)
+    assert "op" in table and "hits" in table, "Summary table incomplete"
+    print("✓ Summary percentiles test passed")
+
+
+def test_json_lines_sink():
+    """Test that a trace file round-trips and a torn last line is skipped"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.jsonl")
+        sink = instrument.JsonLinesSink(path)
+        instrument.enable(sink)
+        try:
+            with instrument.span("write", 64):
+                pass
+            instrument.count("retry")
+        finally:
+            instrument.disable()
+            sink.close()
+        with open(path, "a") as f:
+            f.write('{"name": "torn", "sec')
+
+        events = instrument.read_events(path)
+        assert [event["name"] for event in events] == ["write", "retry"], "Trace events wrong"
+        assert events[0]["bytes"] == 64, "Span bytes not written"
+        print("✓ JSON lines sink test passed")
+
+
+def run_all_tests():
+    """Run all instrumentation tests"""
+    print("\n" + "="*60)
+    print("VaultNote Instrumentation Tests")
+    print("="*60 + "\n")
+
+    test_disabled_is_noop()
+    test_vault_spans_and_counters()
+    test_summary_percentiles()
+    test_json_lines_sink()
+
+    print("\n" + "="*60)
+    print("✅ All instrumentation tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
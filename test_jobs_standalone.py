@@ -0,0 +1,126 @@
+"""
+VaultNote Background Job Tests (Standalone - No GUI Dependencies)
+Tests the worker pool without Kivy
+"""
+import os
+import threading
+import time
+
+from jobs import JobRunner
+
+
+def test_results_delivered():
+    """Test that results and errors reach their callbacks"""
+    runner = JobRunner()
+    results = []
+    done = threading.Event()
+
+    def fail(job):
+        raise ValueError("boom")
+
+    runner.submit(lambda job, x: x * 2, 21, on_done=results.append)
+    runner.submit(fail, on_error=lambda e: (results.append(str(e)), done.set()))
+    done.wait(5)
+    runner.shutdown()
+
+    assert sorted(map(str, results)) == ["42", "boom"], f"Unexpected results {results}"
+    print("✓ Job result delivery test passed")
+
+
+def test_serial_jobs_in_order():
+    """Test that jobs sharing a serial key never interleave"""
+    runner = JobRunner(max_workers=4)
+    events = []
+
+    def write(job, n):
+        events.append(("start", n))
+        time.sleep(0.01)
+        events.append(("end", n))
+
+    for n in range(5):
+        runner.submit(write, n, serial="vault")
+    runner.shutdown()
+
+    expected = [(kind, n) for n in range(5) for kind in ("start", "end")]
+    assert events == expected, f"Serial jobs interleaved: {events}"
+    print("✓ Serial job ordering test passed")
+
+
+def test_cancellation():
+    """Test that a cancelled job stops and reports nothing"""
+    runner = JobRunner()
+    started = threading.Event()
+    results = []
+
+    def long_job(job):
+        started.set()
+        while True:
+            job.check()
+            time.sleep(0.001)
+
+    job = runner.submit(long_job, on_done=results.append, on_error=results.append)
+    started.wait(5)
+    job.cancel()
+    runner.shutdown()
+
+    assert job.cancelled and results == [], "Cancelled job should not report a result"
+    print("✓ Job cancellation test passed")
+
+
+def test_busy_and_progress():
+    """Test busy count and progress notifications"""
+    busy = []
+    progress = []
+    runner = JobRunner(on_busy=busy.append)
+
+    def work(job):
+        job.progress(0.5)
+        job.progress(1.0)
+
+    runner.submit(work, on_progress=progress.append)
+    runner.shutdown()
+
+    assert busy[0] == 1 and busy[-1] == 0, f"Busy indicator not updated: {busy}"
+    assert progress == [0.5, 1.0], f"Progress not reported: {progress}"
+    print("✓ Busy and progress test passed")
+
+
+def test_low_priority_jobs():
+    """Test that low-priority jobs run one at a time on a lowered thread"""
+    runner = JobRunner(max_workers=4)
+    names = []
+    niceness = []
+
+    def work(job):
+        names.append(threading.current_thread().name)
+        if hasattr(os, "getpriority"):
+            niceness.append(os.getpriority(os.PRIO_PROCESS, threading.get_native_id()))
+
+    for _ in range(3):
+        runner.submit(work, low_priority=True)
+    runner.shutdown()
+
+    assert len(set(names)) == 1 and names[0].startswith("vaultnote-idle"), f"Ran on {names}"
+    assert all(value == 19 for value in niceness), f"Thread priority not lowered: {niceness}"
+    print("✓ Low-priority job test passed")
+
+
+def run_all_tests():
+    """Run all background job tests"""
+    print("\n" + "="*60)
+    print("VaultNote Background Job Tests")
+    print("="*60 + "\n")
+
+    test_results_delivered()
+    test_serial_jobs_in_order()
+    test_cancellation()
+    test_busy_and_progress()
+    test_low_priority_jobs()
+
+    print("\n" + "="*60)
+    print("✅ All background job tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
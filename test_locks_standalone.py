@@ -0,0 +1,200 @@
+"""
+VaultNote Concurrency Tests (Standalone - No GUI Dependencies)
+Tests the vault file lock, generation checks and concurrent writer processes without Kivy
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+
+import instrument
+import vault
+from encryption import KDF
+from locks import VaultLock
+
+WRITERS = 8
+COMMITS_PER_WRITER = 20
+
+
+def test_vault_lock():
+    """Test that the lock is reentrant and keeps the generation in its header"""
+    with tempfile.TemporaryDirectory() as directory:
+        lock = VaultLock(os.path.join(directory, vault.LOCK_NAME))
+        assert lock.generation() == 0, "A new lock file should start at generation 0"
+        try:
+            lock.set_generation(1)
+            assert False, "Setting the generation without the lock should fail"
+        except RuntimeError:
+            pass
+        with lock:
+            with lock:
+                lock.set_generation(41)
+            assert lock.depth == 1, "Inner release should keep the lock"
+            lock.set_generation(42)
+        assert lock.depth == 0 and VaultLock(lock.path).generation() == 42, "Generation not kept"
+        lock.close()
+        print("✓ Vault lock test passed")
+
+
+def test_stale_store_catches_up():
+    """Test that a store behind another process's commits reloads and merges before writing"""
+    with tempfile.TemporaryDirectory() as directory:
+        first, _, _ = vault.open_vault("vault_pass", directory)
+        shared = first.put({"title": "Shared", "content": "Version 1"})
+        second, _, _ = vault.open_vault("vault_pass", directory, lazy=True)
+        assert second.get(shared).content == "Version 1", "Second store could not read the vault"
+
+        own = first.put({"title": "First", "content": "From the first store"})
+        first.put({"title": "Shared", "content": "Version 2", "id": shared})
+        sink = instrument.RingBufferSink()
+        instrument.enable(sink)
+        try:
+            other = second.put({"title": "Second", "content": "From the second store"})
+            second.put({"title": "Shared", "content": "Version 3", "id": shared})
+        finally:
+            instrument.disable()
+        assert any(event["name"] == "vault.stale" for event in sink.events()), "Stale view not detected"
+        assert second.get(own).content == "From the first store", "Other store's note missing"
+
+        # The first store is now behind: a full-list sync keeps the note it never saw
+        first.sync([first.get(note_id) for note_id in first.order])
+        _, notes, _ = vault.open_vault("vault_pass", directory)
+        contents = {note["id"]: note["content"] for note in notes}
+        assert contents == {shared: "Version 3", own: "From the first store", other: "From the second store"}, contents
+        revisions = [first.revision(shared, entry["revision"]).content for entry in first.revisions(shared)]
+        assert revisions == ["Version 1", "Version 2"], f"Replaced versions not kept: {revisions}"
+        assert first.generation == second.generation + 1, "Generation should count every commit"
+        print("✓ Stale store catch-up test passed")
+
+
+def test_journaled_writers():
+    """Test that a journaled save survives another process committing first"""
+    with tempfile.TemporaryDirectory() as directory:
+        first, _, _ = vault.open_vault("vault_pass", directory, commit_delay=60)
+        second, _, _ = vault.open_vault("vault_pass", directory, lazy=True)
+        journaled = first.put({"title": "Journaled", "content": "Not committed yet"})
+        assert os.path.exists(first.journal_path), "Save should be journaled"
+        committed = second.put({"title": "Committed", "content": "Straight to the index"})
+        assert not os.path.exists(first.journal_path), "Journal should be folded into the commit"
+        first.flush()
+        assert first.refresh() is False, "Store should be up to date after its own flush"
+        _, notes, _ = vault.open_vault("vault_pass", directory)
+        assert {note["id"] for note in notes} == {journaled, committed}, "A save was lost"
+        print("✓ Journaled writers test passed")
+
+
+def test_readers_follow_compaction():
+    """Test that get, revision, verify and scrub reads catch up after another process compacts"""
+    import scrub
+
+    with tempfile.TemporaryDirectory() as directory:
+        first, _, _ = vault.open_vault("vault_pass", directory)
+        note_id = first.put({"title": "Draft", "content": "Version 1"})
+        first.put({"title": "Draft", "content": "Version 2", "id": note_id})
+        second, _, _ = vault.open_vault("vault_pass", directory, lazy=True)
+        old_segment = second.segment_path
+
+        first.compact()
+        assert not os.path.exists(old_segment), "Compaction should retire the old segment"
+        assert second.revision(note_id, 1).content == "Version 1", "Revision read from a retired segment"
+        assert second.segment_path == first.segment_path, "Reader did not catch up"
+
+        first.compact()
+        assert second.verify() == [], "Verify read from a retired segment"
+        first.compact()
+        report = scrub.scrub_store(second, workers=1)
+        assert report["damaged"] == [] and report["records"] == 2, f"Scrub did not follow compaction: {report}"
+
+        # A compaction between the staleness check and the read is retried on the new segment
+        second.cache.clear()
+        first.compact()
+        check = second._catch_up_if_stale
+        second._catch_up_if_stale = lambda: None
+        try:
+            assert second.get(note_id).content == "Version 2", "Read not retried on the new segment"
+        finally:
+            second._catch_up_if_stale = check
+        print("✓ Readers follow compaction test passed")
+
+
+def test_kdf_upgrade_keeps_concurrent_rekey():
+    """Test that a KDF upgrade on open does not undo a rekey made since the key file was read"""
+    with tempfile.TemporaryDirectory() as directory:
+        first, _, _ = vault.open_vault("old_pin", directory, kdf=KDF.pbkdf2(50000))
+        with open(first.key_path, "rb") as f:
+            wrapped = f.read()
+        second, _, _ = vault.open_vault("old_pin", directory)
+        assert second.rewrap("new_pin", KDF.pbkdf2(60000)), "Rekey not written"
+
+        # The first process read the key file before the rekey and upgrades its KDF now
+        assert not first.rewrap("old_pin", KDF.pbkdf2(70000), expected=wrapped), "Stale upgrade written"
+        assert vault.open_vault("new_pin", directory)[2], "Concurrent rekey was undone"
+        assert not vault.open_vault("old_pin", directory)[2], "Old PIN should no longer open the vault"
+        print("✓ KDF upgrade with concurrent rekey test passed")
+
+
+def _writer(directory, writer, commit_delay):
+    """Save and then edit this writer's notes one commit at a time"""
+    store, _, success = vault.open_vault("vault_pass", directory, lazy=True, commit_delay=commit_delay)
+    assert success
+    generations = []
+    note_ids = []
+    for i in range(COMMITS_PER_WRITER):
+        if i % 2 == 0:
+            note_ids.append(store.put({"title": f"Writer {writer} note {i}", "content": f"{writer}/{i} draft"}))
+        else:
+            note_id = note_ids[-1]
+            store.put({"title": f"Writer {writer} note {i - 1}", "content": f"{writer}/{i - 1} final",
+                       "id": note_id})
+        generations.append(store.generation)
+    store.close()
+    return note_ids, generations
+
+
+def test_concurrent_writer_processes():
+    """Test that many writer processes lose no saves, and report commit throughput"""
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.close()
+        start = time.perf_counter()
+        with context.Pool(WRITERS) as pool:
+            results = pool.starmap(_writer, [(directory, writer, 0.05 * (writer % 2))
+                                             for writer in range(WRITERS)])
+        seconds = time.perf_counter() - start
+
+        store, notes, success = vault.open_vault("vault_pass", directory)
+        assert success, "Vault failed to open after concurrent writes"
+        contents = {note["id"]: note["content"] for note in notes}
+        for writer, (note_ids, generations) in enumerate(results):
+            assert generations == sorted(set(generations)), f"Writer {writer} saw generations go back"
+            for i, note_id in enumerate(note_ids):
+                assert contents.get(note_id) == f"{writer}/{2 * i} final", f"Writer {writer} lost note {i}"
+                assert len(store.revisions(note_id)) == 1, f"Writer {writer} lost a revision of note {i}"
+        commits = WRITERS * COMMITS_PER_WRITER
+        assert len(notes) == commits // 2, f"Expected {commits // 2} notes, found {len(notes)}"
+        assert store.generation >= commits, "Not every commit was counted"
+        print(f"✓ Concurrent writers test passed ({WRITERS} processes, {commits / seconds:.0f} commits/s)")
+
+
+def run_all_tests():
+    """Run all concurrency tests"""
+    print("\n" + "="*60)
+    print("VaultNote Concurrency Tests")
+    print("="*60 + "\n")
+
+    test_vault_lock()
+    test_stale_store_catches_up()
+    test_journaled_writers()
+    test_readers_follow_compaction()
+    test_kdf_upgrade_keeps_concurrent_rekey()
+    test_concurrent_writer_processes()
+
+    print("\n" + "="*60)
+    print("✅ All concurrency tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
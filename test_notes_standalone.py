@@ -0,0 +1,73 @@
+"""
+VaultNote Note Record Tests (Standalone - No GUI Dependencies)
+Tests the compact note record and its binary encoding without Kivy
+"""
+import json
+
+from notes import Note, iso_from_stamp, stamp_from_iso
+
+
+def test_encode_roundtrip():
+    """Test that a note survives encode and decode with every field"""
+    note = Note("Groceries", "milk, bread – ünïcode", True, "ab" * 32,
+                stamp_from_iso("2024-05-06T07:08:09.123456"), "0f" * 16)
+    decoded = Note.decode(note.encode())
+    assert decoded == note, "Roundtrip changed the note"
+    assert decoded.content == "milk, bread – ünïcode", "Content not decoded"
+    assert decoded.timestamp == "2024-05-06T07:08:09.123456", "Timestamp not preserved"
+
+    chunked = Note.decode(note.chunked(["00" * 16, "ff" * 16]).encode())
+    assert chunked.chunks == ["00" * 16, "ff" * 16] and chunked.assembled(b"body").content == "body", \
+        "Chunked record roundtrip failed"
+
+    bare = Note.decode(Note("Empty", "").encode())
+    assert bare.id is None and bare.pin_hash is None and bare.stamp is None, "Missing fields should stay None"
+    print("✓ Note encode roundtrip test passed")
+
+
+def test_dict_accessors():
+    """Test that notes answer the dict-style lookups the UI uses"""
+    note = Note.from_dict({"id": "aa", "title": "T", "content": "C", "locked": 0,
+                           "pin_hash": None, "timestamp": "2024-01-01T00:00:00"})
+    assert note["title"] == "T" and note["content"] == "C" and note["id"] == "aa", "Field lookup failed"
+    assert note.get("locked") is False and note.get("missing", 7) == 7, "get() failed"
+    assert note["timestamp"] == "2024-01-01T00:00:00", "Timestamp not rendered as ISO"
+
+    summary = note.summary(42)
+    assert summary["size"] == 42 and "content" not in summary, "Summary should carry size, not content"
+    assert Note.from_row("aa", summary.row()) == summary, "Manifest row roundtrip failed"
+    try:
+        summary["content"]
+        assert False, "Summary content lookup should raise KeyError"
+    except KeyError:
+        pass
+    print("✓ Note dict accessors test passed")
+
+
+def test_json_records():
+    """Test that records written as JSON still decode"""
+    record = json.dumps({"id": "bb", "title": "Old", "content": "v3", "timestamp": "2023-02-03T04:05:06"})
+    note = Note.decode(record.encode())
+    assert (note.id, note.title, note.content) == ("bb", "Old", "v3"), "JSON record misread"
+    assert iso_from_stamp(note.stamp) == "2023-02-03T04:05:06", "JSON timestamp misread"
+    assert stamp_from_iso("not a date") is None, "Bad timestamp should become None"
+    print("✓ JSON record compatibility test passed")
+
+
+def run_all_tests():
+    """Run all note record tests"""
+    print("\n" + "="*60)
+    print("VaultNote Note Record Tests")
+    print("="*60 + "\n")
+
+    test_encode_roundtrip()
+    test_dict_accessors()
+    test_json_records()
+
+    print("\n" + "="*60)
+    print("✅ All note record tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
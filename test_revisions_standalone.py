@@ -0,0 +1,61 @@
+"""
+VaultNote Revision Delta Tests (Standalone - No GUI Dependencies)
+Tests binary deltas between note versions without Kivy
+"""
+import os
+import random
+
+from revisions import apply_delta, make_delta
+
+
+def test_delta_roundtrip():
+    """Test that deltas rebuild their target for edits of every kind"""
+    rng = random.Random(7)
+    words = [b"alpha ", b"beta ", b"gamma\n", b"delta ", b"\xc3\xa9t\xc3\xa9 ", b"\n"]
+    source = b"".join(rng.choice(words) for _ in range(2000))
+    cases = [
+        b"",
+        source,
+        source[:500] + b"inserted text" + source[500:],
+        source[:300] + source[900:],
+        source.replace(b"beta", b"BETA", 5),
+        os.urandom(300),
+    ]
+    for target in cases:
+        assert apply_delta(source, make_delta(source, target)) == target, "Delta did not rebuild the target"
+    assert apply_delta(b"", make_delta(b"", b"new")) == b"new", "Delta from empty source failed"
+    print("✓ Delta roundtrip test passed")
+
+
+def test_delta_size_follows_edit():
+    """Test that a small edit to a large note gives a small delta"""
+    source = b"".join(b"line %d of a long note\n" % i for i in range(5000))
+    paragraph = b"".join(b"word%d " % i for i in range(5000))
+    edited = source.replace(b"line 2500 of", b"line 2500 (edited) of")
+    assert len(make_delta(source, edited)) < 100, "Line edit delta too large"
+    edited_paragraph = paragraph.replace(b"word2500 ", b"word2500 new words ")
+    assert len(make_delta(paragraph, edited_paragraph)) < 100, "Word edit in one long line gave a large delta"
+    try:
+        apply_delta(source[:-1], make_delta(source, edited))
+        assert False, "Delta applied to the wrong source"
+    except ValueError:
+        pass
+    print("✓ Delta size test passed")
+
+
+def run_all_tests():
+    """Run all revision delta tests"""
+    print("\n" + "="*60)
+    print("VaultNote Revision Delta Tests")
+    print("="*60 + "\n")
+
+    test_delta_roundtrip()
+    test_delta_size_follows_edit()
+
+    print("\n" + "="*60)
+    print("✅ All revision delta tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,78 @@
+"""
+VaultNote Search Tests (Standalone - No GUI Dependencies)
+Tests the encrypted search index without Kivy
+"""
+import os
+import tempfile
+
+import vault
+from search import SEARCH_INDEX_NAME, SearchIndex, note_stamp
+
+
+def test_term_and_prefix_queries():
+    """Test exact terms, prefixes and ranking"""
+    index = SearchIndex()
+    index.add("a", "Shopping list", "milk eggs bread")
+    index.add("b", "Bread recipe", "flour water bread yeast")
+    index.add("c", "Travel", "passport tickets")
+
+    assert index.search("bread") == ["b", "a"], "Title match should rank first"
+    assert index.search("bre*") == ["b", "a"], "Prefix query failed"
+    assert index.search("bread milk") == ["a"], "All terms should be required"
+    assert index.search("pass") == [], "Partial word should not match without *"
+    print("✓ Term and prefix query test passed")
+
+
+def test_incremental_updates():
+    """Test that re-adding and removing notes updates the index"""
+    index = SearchIndex()
+    index.add("a", "Draft", "first version")
+    index.add("a", "Draft", "second version")
+    assert index.search("first") == [] and index.search("second") == ["a"], "Update not applied"
+
+    index.remove("a")
+    assert index.search("draft") == [] and len(index) == 0, "Removed note still indexed"
+    print("✓ Incremental update test passed")
+
+
+def test_encrypted_persistence_and_reconcile():
+    """Test that the index is stored encrypted and catches up with the vault"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.put({"title": "Open", "content": "visible words", "locked": False})
+        private = store.put({"title": "Private", "content": "hidden words", "locked": True})
+
+        index = SearchIndex()
+        assert index.reconcile(store) == 2, "Both notes should be indexed"
+        assert index.search("hidden") == [], "Locked content indexed"
+        assert len(index.search("private")) == 1, "Locked title should be searchable"
+        index.save(store.key, directory)
+
+        with open(os.path.join(directory, SEARCH_INDEX_NAME), "rb") as f:
+            assert b"visible" not in f.read(), "Index stored in clear"
+
+        reloaded = SearchIndex.load(store.key, directory)
+        assert reloaded.reconcile(store) == 0, "Unchanged notes should not be re-indexed"
+        # Content indexed while locked content could still be searched is dropped
+        reloaded.add(private, "Private", "hidden words", note_stamp(store.summary(private), True))
+        assert reloaded.reconcile(store) == 1 and reloaded.search("hidden") == [], "Locked content kept"
+        print("✓ Encrypted persistence and reconcile test passed")
+
+
+def run_all_tests():
+    """Run all search tests"""
+    print("\n" + "="*60)
+    print("VaultNote Search Tests")
+    print("="*60 + "\n")
+
+    test_term_and_prefix_queries()
+    test_incremental_updates()
+    test_encrypted_persistence_and_reconcile()
+
+    print("\n" + "="*60)
+    print("✅ All search tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,544 @@
+"""
+VaultNote Storage Tests (Standalone - No GUI Dependencies)
+Tests the per-note segment store without Kivy
+"""
+import json
+import os
+import tempfile
+import threading
+
+import instrument
+import vault
+from encryption import CODEC_ZLIB_DICT, KDF, EncryptionManager, VaultKey, compress_payload
+
+
+def make_notes(count):
+    return [{"title": f"Note {i}", "content": f"Content {i}", "locked": False} for i in range(count)]
+
+
+def test_store_roundtrip():
+    """Test that notes survive a save and reopen"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, notes, success = vault.open_vault("vault_pass", directory)
+        assert success and notes == [], "New vault should open empty"
+
+        for note in make_notes(3):
+            store.put(note)
+
+        _, reopened, success = vault.open_vault("vault_pass", directory)
+        assert success, "Vault failed to reopen"
+        assert [n["title"] for n in reopened] == ["Note 0", "Note 1", "Note 2"], "Order lost"
+        print("✓ Segment store roundtrip test passed")
+
+
+def test_single_note_write():
+    """Test that editing one note appends one record, not the whole vault"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        notes = make_notes(50)
+        store.sync(notes)
+        size_before = os.path.getsize(store.segment_path)
+
+        notes[10]["content"] = "Edited"
+        store.sync(notes)
+        growth = os.path.getsize(store.segment_path) - size_before
+
+        revision = store.revisions(notes[10]["id"])[0]["size"]
+        assert 0 < growth - revision < 200, f"One edit should append one record and a revision, grew {growth} bytes"
+        _, reopened, _ = vault.open_vault("vault_pass", directory)
+        assert reopened[10]["content"] == "Edited", "Edit was not persisted"
+        print("✓ Single note write test passed")
+
+
+def test_delete_and_compact():
+    """Test that deleted notes are dropped and compaction reclaims space"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.sync(make_notes(10))
+        for note_id in list(store.order[:8]):
+            store.delete(note_id)
+        old_segment = store.segment_path
+
+        store.compact()
+
+        assert not os.path.exists(old_segment), "Old segment should be removed"
+        assert store.dead_bytes == 0, "Compaction should leave no dead bytes"
+        _, reopened, _ = vault.open_vault("vault_pass", directory)
+        assert [n["title"] for n in reopened] == ["Note 8", "Note 9"], "Live notes lost"
+        print("✓ Delete and compaction test passed")
+
+
+def test_wrong_password():
+    """Test that the wrong password does not open the store"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.sync(make_notes(2))
+
+        store, notes, success = vault.open_vault("wrong_pass", directory)
+        assert not success and store is None and notes == [], "Wrong password accepted"
+        print("✓ Wrong password rejection test passed")
+
+
+def test_legacy_migration():
+    """Test that a single-blob vault is migrated on first open"""
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, vault.LEGACY_VAULT_NAME)
+        with open(legacy_path, "w") as f:
+            f.write(EncryptionManager.encrypt('[{"title": "Old", "content": "Data"}]', "vault_pass"))
+
+        _, notes, success = vault.open_vault("vault_pass", directory)
+
+        assert success and notes[0]["title"] == "Old", "Legacy notes not migrated"
+        assert not os.path.exists(legacy_path), "Legacy blob should be removed"
+        _, reopened, _ = vault.open_vault("vault_pass", directory)
+        assert reopened[0]["content"] == "Data", "Migrated vault failed to reopen"
+        print("✓ Legacy migration test passed")
+
+
+def test_rewrap():
+    """Test that a PIN change rewraps the data key without touching records"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("old_pass", directory)
+        store.sync(make_notes(3))
+        with open(store.segment_path, "rb") as f:
+            segment = f.read()
+
+        store.rewrap("new_pass")
+
+        assert not vault.open_vault("old_pass", directory)[2], "Old password still works"
+        reopened, notes, success = vault.open_vault("new_pass", directory)
+        assert success and len(notes) == 3, "Rewrapped vault failed to open"
+        with open(reopened.segment_path, "rb") as f:
+            assert f.read() == segment, "Records should not be rewritten"
+        print("✓ Vault rewrap test passed")
+
+
+def test_calibrated_kdf_rewrap():
+    """Test that the vault key is rewrapped when the device KDF changes"""
+    with tempfile.TemporaryDirectory() as directory:
+        vault.open_vault("vault_pass", directory)
+        key_path = os.path.join(directory, vault.KEY_NAME)
+
+        _, _, success = vault.open_vault("vault_pass", directory, kdf=KDF.scrypt(14))
+        with open(key_path, "rb") as f:
+            assert success and VaultKey.read_header(f.read())[1] == KDF.scrypt(14), "Key not rewrapped"
+        _, _, success = vault.open_vault("vault_pass", directory)
+        assert success, "Rewrapped key should open from its header alone"
+        print("✓ Calibrated KDF rewrap test passed")
+
+
+def test_unwrapped_store_migration():
+    """Test that a store encrypted directly with the password gets a data key"""
+    with tempfile.TemporaryDirectory() as directory:
+        old_store = vault.VaultStore(VaultKey.derive("vault_pass"), directory)
+        old_store.create(make_notes(2))
+
+        assert not vault.open_vault("wrong_pass", directory)[2], "Wrong password accepted"
+        assert not os.path.exists(os.path.join(directory, vault.KEY_NAME)), "Key written before password check"
+
+        store, notes, success = vault.open_vault("vault_pass", directory)
+        assert success and [n["title"] for n in notes] == ["Note 0", "Note 1"], "Notes lost in migration"
+        assert vault.VaultStore.uses_data_key(directory), "Store not moved to the data key"
+        assert len([name for name in os.listdir(directory) if name.endswith(".seg")]) == 1, "Old segment left behind"
+        print("✓ Unwrapped store migration test passed")
+
+
+def test_group_commit_and_journal_recovery():
+    """Test that debounced saves share an index write and survive a crash"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory, commit_delay=60)
+        with open(store.index_path, "rb") as f:
+            committed = f.read()
+
+        ids = [store.put(note) for note in make_notes(4)]
+        store.delete(ids[0])
+        with open(store.index_path, "rb") as f:
+            assert f.read() == committed, "Index should not be rewritten inside the commit window"
+        with open(store.journal_path, "ab") as f:
+            f.write(b"\x00\x00\x00\x40torn")
+
+        # Reopen without flushing, as after a crash
+        _, notes, success = vault.open_vault("vault_pass", directory)
+        assert success and [n["title"] for n in notes] == ["Note 1", "Note 2", "Note 3"], "Journal not replayed"
+        assert not os.path.exists(store.journal_path), "Replayed journal should be removed"
+        store.close()
+        print("✓ Group commit and journal recovery test passed")
+
+
+def test_compressed_records():
+    """Test that records shrink with a trained dictionary and old records still read"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        # Records from before compression were bare JSON
+        store._pack = lambda plaintext: plaintext
+        store._serialize = lambda note: json.dumps(note.to_dict()).encode()
+        store.put({"title": "Uncompressed", "content": "written before compression"})
+        del store._pack, store._serialize
+
+        notes = [dict(note, content=f"Daily log {i}: backup finished, no errors") for i, note in enumerate(make_notes(40))]
+        store.sync(store.load() + notes)
+        assert store.dictionary is not None, "Dictionary should be trained once the vault is big enough"
+        note_id = store.put({"title": "Note 40", "content": "Daily log 40: backup finished, no errors"})
+        offset, length = store.records[note_id]
+        with open(store.segment_path, "rb") as f:
+            f.seek(offset + vault.RECORD_LENGTH.size + vault.NOTE_ID_SIZE)
+            sealed = f.read(length - vault.RECORD_LENGTH.size - vault.NOTE_ID_SIZE)
+        payload = store.key.decrypt_record(sealed, bytes.fromhex(note_id), "record")
+        assert payload[0] == CODEC_ZLIB_DICT, "New record should use the dictionary"
+        assert len(payload) < store.manifest[note_id]["size"], "Record should be stored compressed"
+
+        _, reopened, success = vault.open_vault("vault_pass", directory)
+        assert success and reopened[0]["content"] == "written before compression", "Old record unreadable"
+        assert reopened[-1]["content"] == "Daily log 40: backup finished, no errors", "Compressed record unreadable"
+        print("✓ Compressed records test passed")
+
+
+def test_bulk_export_and_import():
+    """Test archive and per-file export, then a parallel import in one commit"""
+    with tempfile.TemporaryDirectory() as directory:
+        exports = os.path.join(directory, "exports")
+        os.makedirs(exports)
+        notes = make_notes(5)
+        vault.export_archive(notes[:3], os.path.join(exports, "archive.venc"), "export_pin")
+        items = [(note, os.path.join(exports, f"note{i}.venc")) for i, note in enumerate(notes[3:])]
+        assert len(list(vault.export_notes(items, "export_pin", workers=2))) == 2, "Per-file export incomplete"
+        with open(os.path.join(exports, "plain.txt"), "w") as f:
+            f.write("plain text")
+        with open(os.path.join(exports, "broken.venc"), "wb") as f:
+            f.write(b"not an export")
+
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        commits = []
+        write_index = store._write_index
+        store._write_index = lambda: (commits.append(1), write_index())
+        note_ids, failed = vault.import_directory(store, exports, "export_pin", workers=2)
+
+        assert len(note_ids) == 6 and list(failed) == [os.path.join(exports, "broken.venc")], "Import result wrong"
+        assert len(commits) == 1, f"Import should commit once, committed {len(commits)} times"
+        titles = [store.summary(note_id)["title"] for note_id in note_ids]
+        assert titles == ["Note 0", "Note 1", "Note 2", "Note 3", "Note 4", "plain.txt"], f"Unexpected notes {titles}"
+        try:
+            vault.read_export(os.path.join(exports, "archive.venc"), "export_pin")
+            assert False, "Archive should not read as a single export"
+        except ValueError:
+            pass
+        print("✓ Bulk export and import test passed")
+
+
+def test_import_pipeline():
+    """Test a 1,000-file import: encodings, size limit and errors, with one index write"""
+    with tempfile.TemporaryDirectory() as directory:
+        files = os.path.join(directory, "files")
+        os.makedirs(files)
+        for i in range(995):
+            with open(os.path.join(files, f"note{i:04d}.txt"), "w") as f:
+                f.write(f"Note number {i}\n")
+        samples = {
+            "bom8.txt": "\ufeffcafé".encode("utf-8"),
+            "utf16.txt": "Grüße\r\nzwei".encode("utf-16"),
+            "utf16le.txt": "plain utf16".encode("utf-16-le"),
+            "windows.txt": "na\u00efve \u2013 dash".encode("cp1252"),
+            "image.txt": b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR",
+            "huge.txt": b"x" * 5000,
+        }
+        for name, data in samples.items():
+            with open(os.path.join(files, name), "wb") as f:
+                f.write(data)
+
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        sink = instrument.RingBufferSink()
+        instrument.enable(sink)
+        progress = []
+        try:
+            note_ids, failed = vault.import_files(store, vault.expand_import_paths([files]), workers=2,
+                                                  progress=progress.append, max_bytes=4096)
+        finally:
+            instrument.disable()
+
+        writes = [event for event in sink.events() if event["name"] == "vault.index.write"]
+        assert len(note_ids) == 999 and len(writes) == 1, f"{len(note_ids)} notes took {len(writes)} index writes"
+        assert sorted(map(os.path.basename, failed)) == ["huge.txt", "image.txt"], f"Unexpected failures {failed}"
+        assert "import limit" in failed[os.path.join(files, "huge.txt")], "Size limit not explained"
+        assert progress[-1] == 1.0 and len(progress) == 1001, "Progress not reported per file"
+        contents = {store.summary(note_id)["title"]: store.get(note_id)["content"] for note_id in note_ids}
+        assert contents["bom8.txt"] == "café" and contents["utf16.txt"] == "Grüße\nzwei", "BOM text misread"
+        assert contents["utf16le.txt"] == "plain utf16", "UTF-16 without BOM misread"
+        assert contents["windows.txt"] == "na\u00efve \u2013 dash", "cp1252 text misread"
+
+        # A reader that stops early does not leave the producer blocked
+        reads = vault.iter_import_files(vault.list_import_files(files), workers=1)
+        assert next(reads)[2] is None
+        reads.close()
+        print("✓ Import pipeline test passed")
+
+
+def test_revision_history():
+    """Test listing, rebuilding, restoring and pruning earlier versions"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory, commit_delay=60)
+        body = "".join(f"line {i} of a long note\n" for i in range(2000))
+        versions = [body.replace("line 7 ", f"edit {n} ") for n in range(40)]
+        note_id = store.put({"title": "Draft", "content": versions[0]})
+        for content in versions[1:]:
+            store.put({"id": note_id, "title": "Draft", "content": content})
+
+        revisions = store.revisions(note_id)
+        assert [r["revision"] for r in revisions] == list(range(1, 40)), "Revisions not listed in order"
+        assert sum(r["size"] for r in revisions) < len(body) * 4, "History should grow with edits, not note size"
+        assert store.revision(note_id, 1)["content"] == versions[0], "Oldest revision not rebuilt"
+        assert store.revision(note_id, 25)["content"] == versions[24], "Revision past a snapshot not rebuilt"
+
+        # Crash before the index commit: revisions come back from the journal
+        _, _, success = vault.open_vault("vault_pass", directory)
+        store = vault.VaultStore(store.key, directory)
+        store.open_index()
+        assert len(store.revisions(note_id)) == 39, "Journaled revisions lost"
+
+        store.restore(note_id, 3)
+        assert store.get(note_id)["content"] == versions[2], "Restore did not bring the revision back"
+        assert store.revision(note_id, 40)["content"] == versions[39], "Replaced version not kept"
+
+        assert store.prune_history(keep=5) == 35, "Prune by count dropped the wrong number"
+        store.compact()
+        store.open_index()
+        assert [r["revision"] for r in store.revisions(note_id)] == list(range(36, 41)), "Newest revisions not kept"
+        assert store.revision(note_id, 36)["content"] == versions[35], "Revision lost in compaction"
+        assert store.prune_history(max_age=0) == 5 and store.revisions(note_id) == [], "Prune by age failed"
+        print("✓ Revision history test passed")
+
+
+def test_chunk_dedup():
+    """Test that large notes share stored chunks and free them when deleted"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory, commit_delay=60)
+        text = "".join(f"{i:06d} INFO request served in {i % 97} ms\n" for i in range(20000))
+        edited = text[:300000] + "an inserted line\n" + text[300000:]
+        first = store.put({"title": "server.log", "content": text})
+        written = os.path.getsize(store.segment_path)
+        second = store.put({"title": "server.log (2)", "content": edited})
+        third = store.put({"title": "server.log (3)", "content": text})
+        added = os.path.getsize(store.segment_path) - written
+        assert added < len(text) // 20, f"Duplicate imports wrote {added} bytes"
+
+        # Crash before the index commit: chunk lists come back from the journal
+        store = vault.VaultStore(store.key, directory)
+        store.open_index()
+        assert store.get(second)["content"] == edited and store.get(third)["content"] == text, "Chunked note misread"
+        assert store.verify() == [], "Chunked notes failed verification"
+
+        store.delete(first)
+        store.delete(third)
+        assert store.chunk_refs and store.get(second)["content"] == edited, "Shared chunks freed too early"
+        store.delete(second)
+        assert store.chunks == {} and not store.chunk_refs, "Unreferenced chunks not released"
+        store.compact()
+        assert os.path.getsize(store.segment_path) == len(vault.SEGMENT_HEADER), "Dead chunks not compacted"
+        print("✓ Chunk dedup test passed")
+
+
+def test_sealed_notes():
+    """Test that a note saved with a document PIN is encrypted under its own key"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        note_id = store.put({"title": "Secret", "content": "first draft", "locked": True}, "1234")
+        store.put({"id": note_id, "title": "Secret", "content": "second draft", "locked": True}, "1234")
+
+        sealed = store.get(note_id)
+        assert sealed.sealed and "content" not in sealed and sealed.pin_hash is None, "Note not sealed"
+        try:
+            store.unlock_note(note_id, "0000")
+            assert False, "Wrong document PIN should be rejected"
+        except ValueError:
+            pass
+
+        sink = instrument.RingBufferSink()
+        instrument.enable(sink)
+        try:
+            assert store.unlock_note(note_id, "1234")["content"] == "second draft", "Sealed note not opened"
+        finally:
+            instrument.disable()
+        assert not [e for e in sink.events() if e["name"].startswith("kdf.")], "Cached document key not reused"
+        assert store.revision(note_id, 1, "1234")["content"] == "first draft", "Sealed revision not opened"
+
+        store.close()
+        assert len(store.document_keys) == 0, "Closing the vault should drop document keys"
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        assert store.unlock_note(note_id, "1234")["content"] == "second draft", "Sealed note lost on reopen"
+        print("✓ Sealed note test passed")
+
+
+def test_locked_note_migration():
+    """Test that a note locked by PIN hash is sealed the first time it is opened"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        old = {"title": "Old", "locked": True, "pin_hash": EncryptionManager.hash_pin("1234")}
+        note_id = store.put(dict(old, content="v1"))
+        store.put(dict(old, id=note_id, content="v2"))
+        try:
+            store.unlock_note(note_id, "9999")
+            assert False, "Wrong PIN should be rejected"
+        except ValueError:
+            pass
+
+        assert store.unlock_note(note_id, "1234")["content"] == "v2", "Locked note not opened"
+        assert store.get(note_id).sealed, "Locked note not sealed on open"
+        assert store.revisions(note_id) == [], "Unsealed revisions should be dropped"
+        store.open_index()
+        assert store.unlock_note(note_id, "1234")["content"] == "v2", "Migrated note unreadable"
+        print("✓ Locked note migration test passed")
+
+
+def test_sealing_drops_plain_history():
+    """Test that locking a note with history leaves no revision readable without its PIN"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory, commit_delay=60)
+        note_id = store.put({"title": "Diary", "content": "v1"})
+        store.put({"id": note_id, "title": "Diary", "content": "v2"})
+        assert len(store.revisions(note_id)) == 1, "Edit should keep a revision"
+        store.put({"id": note_id, "title": "Diary", "content": "v3", "locked": True}, "1234")
+        store.put({"id": note_id, "title": "Diary", "content": "v4", "locked": True}, "1234")
+
+        # Reopen without flushing: only the sealed revision may come back
+        store = vault.VaultStore(store.key, directory)
+        store.open_index()
+        for entry in store.revisions(note_id):
+            revision = store.revision(note_id, entry["revision"])
+            assert revision.sealed and "content" not in revision, "Revision readable without the PIN"
+        assert [store.revision(note_id, r["revision"], "1234")["content"] for r in store.revisions(note_id)] == ["v3"]
+        print("✓ Sealing drops plain history test passed")
+
+
+def test_lazy_manifest():
+    """Test that a lazy open returns summaries and bodies load on demand"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.sync(make_notes(5))
+
+        store, summaries, success = vault.open_vault("vault_pass", directory, lazy=True)
+
+        assert success and len(summaries) == 5, "Manifest should list every note"
+        assert "content" not in summaries[0], "Manifest should not carry bodies"
+        assert summaries[3]["title"] == "Note 3" and summaries[3]["size"] > 0, "Summary incomplete"
+        assert store.cache.size == 0, "No body should be decrypted on unlock"
+        assert store.get(summaries[3]["id"])["content"] == "Content 3", "Body failed to load"
+        print("✓ Lazy manifest test passed")
+
+
+def test_version3_index_upgrade():
+    """Test that an index with dict summaries opens and is rewritten as rows"""
+    with tempfile.TemporaryDirectory() as directory:
+        store, _, _ = vault.open_vault("vault_pass", directory)
+        store.sync(make_notes(3))
+        index = {
+            "version": 3, "segment": store.segment, "order": store.order, "records": store.records,
+            "manifest": {note_id: dict(summary.to_dict(), timestamp="2024-01-01T00:00:00")
+                         for note_id, summary in store.manifest.items()},
+            "dead": store.dead_bytes, "dictionary": None,
+        }
+        with open(store.index_path, "wb") as f:
+            f.write(store.key.encrypt(compress_payload(json.dumps(index).encode()), "index"))
+
+        store.open_index()
+        summary = store.summary(store.order[1])
+        assert summary["title"] == "Note 1" and summary["timestamp"] == "2024-01-01T00:00:00", "v3 manifest misread"
+        store.put(dict(make_notes(1)[0], title="Note 3"))
+        store.open_index()
+        assert [store.summary(note_id)["title"] for note_id in store.order][-1] == "Note 3", "Upgraded index unreadable"
+        print("✓ Version 3 index upgrade test passed")
+
+
+def test_body_cache_budget():
+    """Test that the body cache evicts least recently used notes"""
+    cache = vault.BodyCache(budget=100)
+    cache.put("a", {"content": "a"}, 40)
+    cache.put("b", {"content": "b"}, 40)
+    cache.get("a")
+    cache.put("c", {"content": "c"}, 40)
+
+    assert cache.get("b") is None, "Least recently used body should be evicted"
+    assert cache.get("a") is not None and cache.size == 80, "Cache budget not respected"
+    print("✓ Body cache budget test passed")
+
+
+def test_export_roundtrip():
+    """Test binary and armored .venc v2 exports, and reading a v1 export"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "note.venc")
+        note = {"title": "Export", "content": "Ünïcode " * 20000, "timestamp": "2024-01-01T00:00:00"}
+
+        vault.export_note(note, path, "export_pin")
+        assert vault.read_export(path, "export_pin") == note, "v2 export roundtrip failed"
+
+        vault.export_note(note, path, "export_pin", armored=True)
+        with open(path, "rb") as f:
+            assert f.read(4) != b"VENC", "Armored export should be base64 text"
+        assert vault.read_export(path, "export_pin") == note, "Armored export roundtrip failed"
+
+        with open(path, "w") as f:
+            f.write(EncryptionManager.encrypt('{"title": "Old", "content": "v1"}', "export_pin"))
+        assert vault.read_export(path, "export_pin")["content"] == "v1", "v1 export not readable"
+        print("✓ Export roundtrip test passed")
+
+
+def test_concurrent_atomic_writes():
+    """Test that concurrent writers of one file never share a temp file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "settings.json")
+        payloads = [bytes([i]) * 100000 for i in range(8)]
+        errors = []
+
+        def write(payload):
+            try:
+                for _ in range(20):
+                    vault.write_atomic(path, payload)
+            except OSError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == [], f"Concurrent writes failed: {errors}"
+        with open(path, "rb") as f:
+            assert f.read() in payloads, "File mixes data from several writers"
+        assert os.listdir(directory) == ["settings.json"], "Temp files left behind"
+        print("✓ Concurrent atomic writes test passed")
+
+
+def run_all_tests():
+    """Run all storage tests"""
+    print("\n" + "="*60)
+    print("VaultNote Storage Tests")
+    print("="*60 + "\n")
+
+    test_store_roundtrip()
+    test_single_note_write()
+    test_delete_and_compact()
+    test_wrong_password()
+    test_legacy_migration()
+    test_rewrap()
+    test_calibrated_kdf_rewrap()
+    test_unwrapped_store_migration()
+    test_group_commit_and_journal_recovery()
+    test_compressed_records()
+    test_bulk_export_and_import()
+    test_import_pipeline()
+    test_revision_history()
+    test_chunk_dedup()
+    test_sealed_notes()
+    test_locked_note_migration()
+    test_sealing_drops_plain_history()
+    test_lazy_manifest()
+    test_version3_index_upgrade()
+    test_body_cache_budget()
+    test_export_roundtrip()
+    test_concurrent_atomic_writes()
+
+    print("\n" + "="*60)
+    print("✅ All storage tests passed successfully!")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    run_all_tests()
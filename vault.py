@@ -0,0 +1,1575 @@
+"""
+VaultNote Storage Module
+Per-note encrypted records in an append-only segment file (no GUI dependencies)
+
+Each note is sealed on its own with AES-GCM and appended to the current
+segment. A small encrypted index maps note ids to record offsets, so saving
+or deleting one note writes one record plus the index. Dead records are
+reclaimed by compaction, which copies live records into a new segment.
+
+Records, index and search index are encrypted under a random data key.
+vault_key.enc holds that key wrapped by a key derived from the vault PIN
+or device key, so changing the PIN rewrites 32 bytes, not the vault.
+
+The index also carries a manifest with each note's title, lock flag,
+timestamp and size, so unlocking only decrypts the index. Bodies are
+decrypted on demand and kept in a byte-bounded LRU cache. Notes are held
+as compact Note records (see notes.py) and stored in their binary
+encoding; manifest entries are Notes without content.
+
+Saving over a note keeps the replaced version as a revision: a reverse
+delta (or periodic snapshot, see revisions.py) appended to the segment
+and listed per note in the index. Revisions can be listed, rebuilt,
+restored and pruned by count or age.
+
+A note with a document PIN is sealed: its content is encrypted under a
+key derived from that PIN (with its own salt, using the device KDF), and
+the key is kept in a small idle-expiring KeyCache once the note is opened,
+so reopening it skips the KDF. Locked notes saved before sealing only
+carried a PIN hash; they are sealed the first time they are opened.
+
+With a commit delay, saves inside the delay window share one index write.
+Until that write, each save is logged in a small encrypted journal, which
+is replayed the next time the index is opened, so a crash before the
+commit loses nothing that was acknowledged.
+
+Notes whose content is CHUNKED_NOTE_MIN bytes or more are stored as
+content-defined chunks (see chunks.py): each distinct chunk is sealed once
+as its own record, addressed by a keyed hash, and the note record lists
+chunk ids. The index keeps each chunked note's chunk list, from which
+chunk reference counts are rebuilt, so re-importing a file or an edited
+copy of it writes only the chunks that changed. A chunk whose count drops
+to zero when a note is replaced or deleted becomes dead space and is
+reclaimed by compaction. Revisions always hold whole content, so they do
+not reference chunks.
+
+Record and index plaintexts are compressed before sealing, with a codec
+byte per record so each is stored however it came out smallest. Once the
+vault has enough notes, a zlib dictionary is trained from them (and kept
+encrypted in vault_dict.N.enc) so that short notes compress too.
+
+Bulk imports stream files through a bounded queue: worker processes read,
+decode and decrypt files while the writer appends the notes already read,
+and the index is committed once at the end (see import_files()).
+
+Writers in different processes are kept apart by an advisory lock on
+vault.lock, whose header counts commits (see locks.py). A store that finds
+the count moved on since its own last commit reloads the index and journal
+before it writes, keeping the bodies it cached of notes that did not
+change, so one process never commits over another's saves.
+
+Unlock, index reads and writes, record reads, journal appends and file
+writes are timed as instrument spans, and body cache hits and misses are
+counted, while instrumentation is enabled.
+"""
+import base64
+import codecs
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import os
+import queue
+import re
+import struct
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+import instrument
+from chunks import chunk_id, split_chunks
+from encryption import (
+    STREAM_CHUNK_SIZE,
+    KDF,
+    EncryptionManager,
+    KeyCache,
+    StreamEncryptor,
+    VaultKey,
+    compress_payload,
+    decompress_payload,
+    is_stream,
+    iter_decrypt_stream,
+    parallel_map,
+    train_dictionary,
+)
+from locks import VaultLock
+from notes import MICROSECONDS, Note, iso_from_stamp, now_stamp
+from revisions import SNAPSHOT_INTERVAL, apply_delta, make_delta
+
+INDEX_NAME = "vault_index.enc"
+KEY_NAME = "vault_key.enc"
+JOURNAL_NAME = "vault_journal.enc"
+LOCK_NAME = "vault.lock"
+LEGACY_VAULT_NAME = "vault_data.enc"
+IMPORT_EXTENSIONS = (".txt", ".venc")
+# Files bigger than this are not imported
+IMPORT_MAX_BYTES = 64 * 1024 * 1024
+# Files read ahead of the vault writer during an import
+IMPORT_QUEUE_FILES = 16
+# Notes appended per lock hold by put_many()
+PUT_BATCH_NOTES = 256
+SEGMENT_MAGIC = b"VNSG"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = SEGMENT_MAGIC + bytes([SEGMENT_VERSION])
+# Version 3 indexes are compressed; records may be compressed from then on.
+# Version 4 stores manifest entries as rows: title, locked, pin hash,
+# timestamp (epoch microseconds) and size. Version 5 adds revision history,
+# version 6 content chunks.
+INDEX_VERSION = 6
+
+# Record layout: length (4 bytes) + note id (16 bytes) + nonce + ciphertext
+RECORD_LENGTH = struct.Struct(">I")
+NOTE_ID_SIZE = 16
+# Revision records are bound to their note id, revision number and kind
+REVISION_AAD = struct.Struct(">I?")
+
+# Compact once dead records outweigh live ones and are worth the rewrite
+COMPACT_MIN_DEAD_BYTES = 64 * 1024
+
+BODY_CACHE_BYTES = 4 * 1024 * 1024
+
+# Notes with at least this much content are stored as deduplicated chunks
+CHUNKED_NOTE_MIN = 64 * 1024
+
+# Train a compression dictionary once there are enough notes to learn from
+DICTIONARY_MIN_NOTES = 32
+DICTIONARY_SAMPLE_NOTES = 256
+
+_SEGMENT_NAME = re.compile(r"vault_data\.(\d+)\.seg")
+_DICTIONARY_NAME = re.compile(r"vault_dict\.(\d+)\.enc")
+
+
+def new_note_id() -> str:
+    """Generate a random note id"""
+    return os.urandom(NOTE_ID_SIZE).hex()
+
+
+def _as_note(note) -> Note:
+    """Return note as a Note, giving it a new id if it has none
+
+    A dict gets the id set in place too, so callers can read it back.
+    """
+    if isinstance(note, Note):
+        if note.id is None:
+            note.id = new_note_id()
+        return note
+    note.setdefault("id", new_note_id())
+    return Note.from_dict(note)
+
+
+def _map_file(path: str) -> memoryview:
+    """Map a file read-only and return a view over it
+
+    The mapping is released when the last view into it is dropped, so record
+    slices handed to AES-GCM never copy the segment.
+    """
+    with open(path, "rb") as f:
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _temp_file(path: str):
+    """Create a uniquely named temp file next to path; returns (file, temp path)
+
+    Writers in different threads or processes never share a temp file, so
+    the rename always publishes one writer's complete data.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory or ".")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+def write_atomic(path: str, data: bytes):
+    """Write a file via a synced temp file and an atomic rename"""
+    with instrument.span("io.write_atomic", len(data)):
+        f, tmp_path = _temp_file(path)
+        try:
+            with f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+
+class BodyCache:
+    """LRU cache of decrypted note bodies bounded by a byte budget"""
+
+    def __init__(self, budget: int = BODY_CACHE_BYTES):
+        self.budget = budget
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, note_id: str):
+        entry = self._entries.get(note_id)
+        if entry is None:
+            return None
+        self._entries.move_to_end(note_id)
+        return entry[0]
+
+    def put(self, note_id: str, note: dict, size: int):
+        self.discard(note_id)
+        if size > self.budget:
+            return
+        self._entries[note_id] = (note, size)
+        self.size += size
+        while self.size > self.budget:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+
+    def discard(self, note_id: str):
+        entry = self._entries.pop(note_id, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def ids(self) -> list:
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class VaultStore:
+    """Append-only, per-note encrypted vault container"""
+
+    def __init__(self, vault_key: VaultKey, directory: str = ".", cache_bytes: int = BODY_CACHE_BYTES,
+                 commit_delay: float = 0):
+        self.key = vault_key
+        self.directory = directory
+        self.commit_delay = commit_delay
+        self.segment = None
+        self.order = []
+        self.records = {}
+        self.manifest = {}
+        # note id -> [(offset, length, revision, stamp, snapshot)], oldest first
+        self.history = {}
+        # chunk id -> (offset, length); note id -> chunk ids, in content order
+        self.chunks = {}
+        self.chunk_lists = {}
+        self.chunk_refs = Counter()
+        self.dead_bytes = 0
+        # Commit count of the vault as this store last saw or wrote it
+        self.generation = 0
+        self.dictionary_name = None
+        self.dictionary = None
+        self.cache = BodyCache(cache_bytes)
+        self.document_keys = KeyCache()
+        # KDF for new document PINs; open_vault() sets the device's calibrated one
+        self.document_kdf = None
+        self._digests = {}
+        self._lock = threading.RLock()
+        self._file_lock = VaultLock(os.path.join(directory, LOCK_NAME))
+        self._compactor = None
+        self._commit_timer = None
+
+    @staticmethod
+    def exists(directory: str = ".") -> bool:
+        return os.path.exists(os.path.join(directory, INDEX_NAME))
+
+    @staticmethod
+    def unlock(password: str, directory: str = ".", idle_timeout: float = None) -> VaultKey:
+        """Derive the key of an index written before data keys, from its header"""
+        with open(os.path.join(directory, INDEX_NAME), "rb") as f:
+            return VaultKey.for_blob(password, f.read(), idle_timeout)
+
+    @staticmethod
+    def uses_data_key(directory: str = ".") -> bool:
+        """True if the index is encrypted under a wrapped data key"""
+        with open(os.path.join(directory, INDEX_NAME), "rb") as f:
+            header = VaultKey.read_header(f.read(64))
+        return header is not None and header[1] is None
+
+    @property
+    def key_path(self) -> str:
+        return os.path.join(self.directory, KEY_NAME)
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.directory, JOURNAL_NAME)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_NAME)
+
+    @property
+    def segment_path(self) -> str:
+        return os.path.join(self.directory, self.segment)
+
+    @property
+    def live_bytes(self) -> int:
+        revisions = sum(entry[1] for entries in self.history.values() for entry in entries)
+        chunks = sum(length for _, length in self.chunks.values())
+        return sum(length for _, length in self.records.values()) + revisions + chunks
+
+    def create(self, notes: list = ()):
+        """Start a fresh segment holding the given notes"""
+        with self._exclusive():
+            self.order = []
+            self.records = {}
+            self.manifest = {}
+            self.history = {}
+            self.chunks = {}
+            self.chunk_lists = {}
+            self.chunk_refs = Counter()
+            self.dead_bytes = 0
+            self._digests = {}
+            self.cache.clear()
+            self._start_segment(self._next_segment_name())
+            self.dictionary_name = self.dictionary = None
+            notes = [_as_note(note) for note in notes]
+            if len(notes) >= DICTIONARY_MIN_NOTES:
+                step = max(1, len(notes) // DICTIONARY_SAMPLE_NOTES)
+                self._set_dictionary(train_dictionary([self._serialize(note) for note in notes[::step]]))
+            for note in notes:
+                self._append(note)
+            self._write_index()
+            self._remove_stale_files()
+
+    def rewrap(self, password: str, kdf: KDF = None, expected: bytes = None) -> bool:
+        """Wrap the data key under a new password; no record is rewritten
+
+        With expected, the key file is only replaced while it still holds
+        those bytes, so a rekey by another process since they were read is
+        not undone. Returns True if the key file was written.
+        """
+        with self._exclusive():
+            if expected is not None:
+                with open(self.key_path, "rb") as f:
+                    if f.read() != expected:
+                        return False
+            write_atomic(self.key_path, self.key.wrap(password, kdf))
+            return True
+
+    def open_index(self):
+        """Decrypt the index, upgrading an index written without a manifest"""
+        with self._lock, self._file_lock, instrument.span("vault.index.read") as span:
+            with open(self.index_path, "rb") as f:
+                blob = f.read()
+            span.add(len(blob))
+            plaintext = self._unpack(self.key.decrypt(blob, "index"))
+            with instrument.span("json.decode", len(plaintext)):
+                index = json.loads(plaintext)
+            version = index.get("version")
+            if version not in (1, 2, 3, 4, 5, INDEX_VERSION):
+                raise ValueError(f"Unsupported index version {version}")
+            self.segment = index["segment"]
+            self.order = index["order"]
+            self.records = {note_id: tuple(loc) for note_id, loc in index["records"].items()}
+            self.manifest = {note_id: _manifest_entry(note_id, entry)
+                             for note_id, entry in index.get("manifest", {}).items()}
+            self.history = {note_id: [tuple(entry) for entry in entries]
+                            for note_id, entries in index.get("history", {}).items()}
+            self.chunks = {chunk: tuple(loc) for chunk, loc in index.get("chunks", {}).items()}
+            self.chunk_lists = index.get("chunk_lists", {})
+            self.chunk_refs = Counter(chunk for chunks in self.chunk_lists.values() for chunk in chunks)
+            self.dead_bytes = index["dead"]
+            self.generation = index.get("generation", 0)
+            self.dictionary_name = index.get("dictionary")
+            self.dictionary = None
+            if self.dictionary_name is not None:
+                with open(os.path.join(self.directory, self.dictionary_name), "rb") as f:
+                    self.dictionary = self.key.decrypt(f.read(), "dictionary")
+            if version == 1:
+                self._read_all()
+                self._write_index()
+            elif self._replay_journal():
+                self._write_index()
+
+    def load_manifest(self) -> list:
+        """Open the index and return note summaries without decrypting bodies"""
+        with self._lock:
+            self.open_index()
+            return [self.summary(note_id) for note_id in self.order]
+
+    def load(self) -> list:
+        """Read the index and decrypt every live record, in order"""
+        with self._lock:
+            self.open_index()
+            return self._read_all()
+
+    def summary(self, note_id: str) -> Note:
+        """Return the manifest entry of a note: a Note without content"""
+        return self.manifest[note_id]
+
+    def get(self, note_id: str) -> Note:
+        """Return a full note, decrypting its record on a cache miss"""
+        with self._lock:
+            self.key.touch()
+            note = self.cache.get(note_id)
+            if note is not None:
+                instrument.count("cache.hit")
+                return note
+            instrument.count("cache.miss")
+            self._catch_up_if_stale()
+            try:
+                note, size = self._read_note(note_id)
+            except FileNotFoundError:
+                # Another process retired the segment after the check; read the new one
+                self.refresh()
+                note, size = self._read_note(note_id)
+            self.cache.put(note_id, note, size)
+            return note
+
+    def _read_note(self, note_id: str) -> tuple:
+        """Decrypt a note from the segment; returns it and its size for the cache"""
+        offset, length = self.records[note_id]
+        with instrument.span("vault.get", length):
+            with open(self.segment_path, "rb") as f:
+                f.seek(offset)
+                plaintext = self._open_record(note_id, f.read(length))
+            note = self._assemble(self._deserialize(plaintext))
+        return note, self.manifest[note_id].size or len(plaintext)
+
+    def unlock_note(self, note_id: str, pin: str) -> Note:
+        """Return a locked note with its content opened by its document PIN
+
+        Raises ValueError for a wrong PIN. The opened note is not put in
+        the body cache; only its key is cached. A locked note from before
+        sealing is checked against its PIN hash, then sealed, and its
+        revisions, which hold its content unsealed, are dropped.
+        """
+        with self._lock:
+            note = self.get(note_id)
+            if not note.locked:
+                return note
+            if not note.sealed:
+                if EncryptionManager.hash_pin(pin) != note.pin_hash:
+                    raise ValueError("Incorrect document PIN")
+                self.put(note, pin)
+                return note
+            return self._unseal(note, pin)
+
+    def revisions(self, note_id: str) -> list:
+        """List the earlier versions of a note, oldest first
+
+        Each is a dict with the revision number, the time that version was
+        saved and the bytes its record takes.
+        """
+        with self._lock:
+            return [{"revision": revision, "timestamp": iso_from_stamp(stamp), "size": length}
+                    for _, length, revision, stamp, _ in self.history.get(note_id, ())]
+
+    def revision(self, note_id: str, revision: int, pin: str = None) -> Note:
+        """Rebuild an earlier version of a note
+
+        Starts from the nearest newer snapshot, or the current note, and
+        applies the reverse deltas back to the requested revision. A
+        sealed revision is opened when its document PIN is given.
+        """
+        with self._lock, instrument.span("vault.revision"):
+            self._catch_up_if_stale()
+            entries = self.history.get(note_id, [])
+            numbers = [entry[2] for entry in entries]
+            if revision not in numbers:
+                raise KeyError(f"Note {note_id} has no revision {revision}")
+            first = numbers.index(revision)
+            last = first
+            while last < len(entries) and not entries[last][4]:
+                last += 1
+            data = _map_file(self.segment_path)
+            if last == len(entries):
+                plaintext = self._serialize(self.get(note_id))
+            else:
+                plaintext = self._open_revision(note_id, entries[last], data)
+            for entry in reversed(entries[first:last]):
+                plaintext = apply_delta(plaintext, self._open_revision(note_id, entry, data))
+            note = self._deserialize(plaintext)
+            if note.sealed and pin is not None:
+                return self._unseal(note, pin, cache=False)
+            return note
+
+    def restore(self, note_id: str, revision: int) -> str:
+        """Save an earlier version as the current one; the version it replaces is kept as a revision"""
+        with self._exclusive():
+            note = self.revision(note_id, revision)
+            note.stamp = now_stamp()
+            return self.put(note)
+
+    def prune_history(self, keep: int = None, max_age: float = None, note_ids=None) -> int:
+        """Drop the oldest revisions beyond keep per note, or older than max_age seconds
+
+        Applies to every note unless note_ids is given. Newer revisions
+        never depend on older ones, so only the dropped records are
+        affected. Returns the number of revisions dropped.
+        """
+        with self._exclusive():
+            cutoff = None if max_age is None else now_stamp() - int(max_age * MICROSECONDS)
+            dropped = 0
+            for note_id in list(self.history if note_ids is None else note_ids):
+                entries = self.history.get(note_id, [])
+                count = 0 if keep is None else max(0, len(entries) - keep)
+                if cutoff is not None:
+                    while count < len(entries) and entries[count][3] < cutoff:
+                        count += 1
+                if not count:
+                    continue
+                self.dead_bytes += sum(entry[1] for entry in entries[:count])
+                if count == len(entries):
+                    del self.history[note_id]
+                else:
+                    self.history[note_id] = entries[count:]
+                dropped += count
+            if dropped:
+                self._write_index()
+        if dropped:
+            self.maybe_compact()
+        return dropped
+
+    def verify(self, job=None) -> list:
+        """Decrypt every live record and return the ids that fail to open"""
+        with self._lock, instrument.span("vault.verify"):
+            self._catch_up_if_stale()
+            data = _map_file(self.segment_path)
+            if data[:len(SEGMENT_HEADER)] != SEGMENT_HEADER:
+                raise ValueError("Not a vault segment file")
+            damaged = []
+            for note_id in self.order:
+                if job is not None:
+                    job.check()
+                offset, length = self.records[note_id]
+                try:
+                    self._assemble(self._deserialize(self._open_record(note_id, data[offset:offset + length])), data)
+                except Exception:
+                    damaged.append(note_id)
+            return damaged
+
+    def record_map(self) -> tuple:
+        """Snapshot where every live record is, for checking them outside the lock
+
+        Returns (segment path, dictionary, records, chunk owners). Each
+        record is (kind, record id, revision, snapshot, offset, length) with
+        kind "note", "revision" or "chunk"; chunk owners maps a chunk id to
+        the notes that use it.
+        """
+        with self._lock:
+            self._catch_up_if_stale()
+            records = [("note", note_id, None, None, *self.records[note_id]) for note_id in self.order]
+            for note_id, entries in self.history.items():
+                records.extend(("revision", note_id, revision, snapshot, offset, length)
+                               for offset, length, revision, _, snapshot in entries)
+            records.extend(("chunk", chunk, None, None, *location) for chunk, location in self.chunks.items())
+            owners = {}
+            for note_id, chunks in self.chunk_lists.items():
+                for chunk in set(chunks):
+                    owners.setdefault(chunk, []).append(note_id)
+            return self.segment_path, self.dictionary, records, owners
+
+    def refresh(self) -> bool:
+        """Catch up with commits made by other processes; True if there were any"""
+        with self._lock:
+            generation = self.generation
+            with self._exclusive():
+                pass
+            return self.generation != generation
+
+    def flush(self):
+        """Commit journaled saves to the index now"""
+        with self._exclusive():
+            if self._commit_timer is not None:
+                self._write_index()
+
+    def close(self):
+        """Commit pending saves, zeroize the vault and document keys and drop cached bodies"""
+        self.flush()
+        with self._lock:
+            self._file_lock.close()
+        self.key.zeroize()
+        self.document_keys.clear()
+        self.cache.clear()
+
+    def put(self, note, pin: str = None) -> str:
+        """Write one note (a Note or a dict) as a new record and point the index at it
+
+        With a pin, the note is locked and its content sealed under a key
+        derived from the pin; the key is reused from the cache when the
+        note was opened with the same pin. Sealing a note that was not
+        sealed drops its revisions, which hold its content unsealed.
+        """
+        with self._exclusive(), instrument.span("vault.put"):
+            note = _as_note(note)
+            previous = self.manifest.get(note.id)
+            if pin:
+                note = self._seal(note, pin)
+            revisions = len(self.history.get(note.id, ()))
+            note_id = self._append(note)
+            if pin and previous is not None and not previous.sealed:
+                # The journal cannot drop history, so commit the index straight away
+                self.dead_bytes += sum(entry[1] for entry in self.history.pop(note_id, ()))
+                self._write_index()
+            else:
+                entry = {"put": note_id, "at": self.records[note_id], "summary": self.manifest[note_id].row()}
+                if note_id in self.chunk_lists:
+                    entry["chunk_list"] = self.chunk_lists[note_id]
+                    entry["chunks"] = {chunk: self.chunks[chunk] for chunk in set(self.chunk_lists[note_id])}
+                if len(self.history.get(note_id, ())) > revisions:
+                    entry["revision"] = self.history[note_id][-1]
+                self._commit(entry)
+            self._maybe_train()
+        self.maybe_compact()
+        return note_id
+
+    def put_many(self, notes, batch_size: int = PUT_BATCH_NOTES) -> list:
+        """Write many notes with a single index commit; returns their ids
+
+        notes may be a generator, such as an import still reading files. It
+        is taken batch_size notes at a time and the store lock is only held
+        while a batch is appended, so the vault stays readable in between;
+        other processes are kept out until the end. The index is committed
+        once at the end, or, if notes raises, for the notes written up to
+        then.
+        """
+        note_ids = []
+        notes = iter(notes)
+        with self._lock:
+            self._lock_file()
+        try:
+            while True:
+                batch = list(itertools.islice(notes, batch_size))
+                if not batch:
+                    break
+                with self._lock:
+                    note_ids.extend(self._append(_as_note(note)) for note in batch)
+        finally:
+            with self._lock:
+                try:
+                    # Training the dictionary commits the index itself
+                    if not self._maybe_train():
+                        self._write_index()
+                finally:
+                    self._file_lock.release()
+        self.maybe_compact()
+        return note_ids
+
+    def delete(self, note_id: str):
+        """Drop one note from the index; its record becomes dead space"""
+        with self._exclusive():
+            if note_id not in self.records:
+                return
+            self.dead_bytes += self.records.pop(note_id)[1]
+            self.order.remove(note_id)
+            self._forget(note_id)
+            self._commit({"delete": note_id})
+        self.maybe_compact()
+
+    def sync(self, notes: list):
+        """Persist a full notes list, writing only notes that changed
+
+        Changes made meanwhile by another process are merged per note: a
+        note left as this store last saw it does not overwrite a newer
+        version, and only notes this store knew of are deleted for missing
+        from the list; notes added elsewhere are kept, after it.
+        """
+        with self._lock:
+            records, digests = dict(self.records), dict(self._digests)
+            with self._exclusive():
+                keep = set()
+                for note in notes:
+                    record = _as_note(note)
+                    keep.add(record.id)
+                    plaintext = self._serialize(record)
+                    digest = hashlib.sha256(plaintext).digest()
+                    if digest == self._digests.get(record.id):
+                        continue
+                    if digest == digests.get(record.id) and self.records.get(record.id) != records.get(record.id):
+                        continue
+                    self._append(record, plaintext)
+                for note_id in list(self.records):
+                    if note_id not in keep and note_id in records:
+                        self.dead_bytes += self.records.pop(note_id)[1]
+                        self._forget(note_id)
+                added = [note_id for note_id in self.order if note_id not in keep and note_id in self.records]
+                self.order = [note["id"] for note in notes if note["id"] in self.records] + added
+                self._write_index()
+                self._maybe_train()
+        self.maybe_compact()
+
+    def maybe_compact(self):
+        """Start a background compaction once enough space is dead"""
+        if self.dead_bytes < COMPACT_MIN_DEAD_BYTES or self.dead_bytes < self.live_bytes:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """Copy live records into a new segment and retire the old one"""
+        with self._exclusive():
+            old_path = self.segment_path
+            data = _map_file(old_path)
+            new_name = self._next_segment_name()
+            records = {}
+            with open(os.path.join(self.directory, new_name), "wb") as f:
+                f.write(SEGMENT_HEADER)
+                offset = len(SEGMENT_HEADER)
+                for note_id in self.order:
+                    old_offset, length = self.records[note_id]
+                    f.write(data[old_offset:old_offset + length])
+                    records[note_id] = (offset, length)
+                    offset += length
+                history = {}
+                for note_id, entries in self.history.items():
+                    history[note_id] = []
+                    for old_offset, length, *rest in entries:
+                        f.write(data[old_offset:old_offset + length])
+                        history[note_id].append((offset, length, *rest))
+                        offset += length
+                chunks = {}
+                for chunk, (old_offset, length) in self.chunks.items():
+                    f.write(data[old_offset:old_offset + length])
+                    chunks[chunk] = (offset, length)
+                    offset += length
+                f.flush()
+                os.fsync(f.fileno())
+            data.release()
+            self.segment = new_name
+            self.records = records
+            self.history = history
+            self.chunks = chunks
+            self.dead_bytes = 0
+            self._write_index()
+            os.remove(old_path)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Hold the store lock and the vault's file lock, caught up with other processes"""
+        with self._lock:
+            self._lock_file()
+            try:
+                yield
+            finally:
+                self._file_lock.release()
+
+    def _lock_file(self):
+        """Take the file lock (under the store lock), reloading first if the vault moved on"""
+        self._file_lock.acquire()
+        if self._file_lock.depth > 1:
+            return
+        try:
+            self._catch_up()
+        except BaseException:
+            self._file_lock.release()
+            raise
+
+    def _catch_up(self):
+        """Reload the index if another process committed since this store last did
+
+        This is the compare half of the commit: the generation in the lock
+        file is checked against the one this store expects. On a mismatch
+        the index and journal are reloaded, and cached bodies and digests
+        are kept only for notes whose record did not move, so the writer's
+        own change is then applied on top of everyone else's.
+        """
+        generation = self._file_lock.generation()
+        if self.segment is None or generation <= self.generation:
+            return
+        with instrument.span("vault.catch_up"):
+            records = self.records
+            self.open_index()
+            for note_id in self.cache.ids() + list(self._digests):
+                if self.records.get(note_id) != records.get(note_id):
+                    self.cache.discard(note_id)
+                    self._digests.pop(note_id, None)
+            # Holding the lock, nothing is mid-commit: a count ahead of the
+            # index is a writer that crashed before committing
+            self.generation = max(self.generation, generation)
+        instrument.count("vault.stale")
+
+    def _catch_up_if_stale(self):
+        """Before reading records at indexed offsets, reload if another process committed
+
+        Checking the lock file header is one small read, so readers only
+        take the file lock when there is something to catch up with.
+        """
+        if self._file_lock.generation() > self.generation:
+            self.refresh()
+
+    def _next_generation(self) -> int:
+        """Count a commit in the lock file header, before the commit itself is written"""
+        self.generation = max(self.generation, self._file_lock.generation()) + 1
+        self._file_lock.set_generation(self.generation)
+        return self.generation
+
+    def _serialize(self, note: Note) -> bytes:
+        with instrument.span("note.encode") as span:
+            plaintext = note.encode()
+            span.add(len(plaintext))
+        return plaintext
+
+    def _deserialize(self, plaintext: bytes) -> Note:
+        with instrument.span("note.decode", len(plaintext)):
+            return Note.decode(plaintext)
+
+    def _unseal(self, note: Note, pin: str, cache: bool = True) -> Note:
+        """Open a sealed note with its cached key, or one derived from pin"""
+        key = self.document_keys.get(note.id, pin)
+        if key is not None:
+            try:
+                return note.unseal(key)
+            except Exception:
+                pass  # sealed under an earlier key; derive the one its header names
+        key = VaultKey.for_blob(pin, note.sealed_content)
+        try:
+            opened = note.unseal(key)
+        except Exception:
+            key.zeroize()
+            raise ValueError("Incorrect document PIN") from None
+        if cache:
+            self.document_keys.put(note.id, key, pin)
+        else:
+            key.zeroize()
+        return opened
+
+    def _seal(self, note: Note, pin: str) -> Note:
+        key = self.document_keys.get(note.id, pin)
+        if key is None:
+            key = VaultKey.derive(pin, kdf=self.document_kdf)
+            self.document_keys.put(note.id, key, pin)
+        with instrument.span("document.seal"):
+            return note.seal(key)
+
+    def _forget(self, note_id: str):
+        self.document_keys.discard(note_id)
+        self.dead_bytes += sum(entry[1] for entry in self.history.pop(note_id, ()))
+        self._release_chunks(self.chunk_lists.pop(note_id, None))
+        self.manifest.pop(note_id, None)
+        self._digests.pop(note_id, None)
+        self.cache.discard(note_id)
+
+    def _read_all(self) -> list:
+        data = _map_file(self.segment_path)
+        if data[:len(SEGMENT_HEADER)] != SEGMENT_HEADER:
+            raise ValueError("Not a vault segment file")
+        notes = []
+        for note_id in self.order:
+            offset, length = self.records[note_id]
+            plaintext = self._open_record(note_id, data[offset:offset + length])
+            record = self._deserialize(plaintext)
+            note = self._assemble(record, data)
+            note.id = note_id
+            if plaintext[:1] == b"{" or record.chunks is not None:
+                # Digest JSON and chunked records as the whole note would be written now
+                plaintext = self._serialize(note)
+            self._digests[note_id] = hashlib.sha256(plaintext).digest()
+            self.manifest[note_id] = note.summary(len(plaintext))
+            notes.append(note)
+        return notes
+
+    def _append(self, note: Note, plaintext: bytes = None) -> str:
+        note_id = note.id
+        if plaintext is None:
+            plaintext = self._serialize(note)
+        if note_id in self.records:
+            self._add_revision(note_id, plaintext)
+        record = plaintext
+        released = self.chunk_lists.pop(note_id, None)
+        content = note.content_bytes
+        if not note.sealed and content is not None and len(content) >= CHUNKED_NOTE_MIN:
+            chunks = self._store_chunks(content)
+            self.chunk_lists[note_id] = chunks
+            self.chunk_refs.update(chunks)
+            record = self._serialize(note.chunked(chunks))
+        # Released after the new list is counted, so chunks both versions share stay
+        self._release_chunks(released)
+        sealed = self.key.encrypt_record(self._pack(record), bytes.fromhex(note_id), "record")
+        location = self._write_record(note_id, sealed)
+        if note_id in self.records:
+            self.dead_bytes += self.records[note_id][1]
+        else:
+            self.order.append(note_id)
+        self.records[note_id] = location
+        self.manifest[note_id] = note.summary(len(plaintext))
+        self._digests[note_id] = hashlib.sha256(plaintext).digest()
+        self.cache.put(note_id, note, len(plaintext))
+        return note_id
+
+    def _write_record(self, note_id: str, sealed: bytes) -> tuple:
+        return self._write_records([(note_id, sealed)])[0]
+
+    def _write_records(self, sealed_records: list) -> list:
+        """Append (id, sealed) records with one open; returns their (offset, length)"""
+        locations = []
+        with open(self.segment_path, "ab") as f:
+            offset = f.tell()
+            for record_id, sealed in sealed_records:
+                record = RECORD_LENGTH.pack(len(sealed)) + bytes.fromhex(record_id) + sealed
+                f.write(record)
+                locations.append((offset, len(record)))
+                offset += len(record)
+        return locations
+
+    def _store_chunks(self, content: bytes) -> list:
+        """Split content into chunks, write the ones not stored yet and return all their ids"""
+        with instrument.span("vault.chunks.store", len(content)):
+            key = self.key.subkey("chunk")
+            chunks = []
+            new = {}
+            for piece in split_chunks(content):
+                chunk = chunk_id(key, piece)
+                chunks.append(chunk)
+                if chunk not in self.chunks and chunk not in new:
+                    new[chunk] = self.key.encrypt_record(self._pack(piece), bytes.fromhex(chunk), "chunk")
+            self.chunks.update(zip(new, self._write_records(list(new.items()))))
+            instrument.count("chunks.new", len(new))
+            instrument.count("chunks.shared", len(chunks) - len(new))
+            return chunks
+
+    def _release_chunks(self, chunks):
+        """Drop one reference per listed chunk; unreferenced chunks become dead space"""
+        if not chunks:
+            return
+        self.chunk_refs.subtract(chunks)
+        for chunk in set(chunks):
+            if self.chunk_refs[chunk] <= 0:
+                del self.chunk_refs[chunk]
+                self.dead_bytes += self.chunks.pop(chunk)[1]
+
+    def _assemble(self, note: Note, data=None) -> Note:
+        """Fill in the content of a note whose record lists chunks"""
+        if note.chunks is None:
+            return note
+        if data is None:
+            data = _map_file(self.segment_path)
+        parts = []
+        for chunk in note.chunks:
+            offset, length = self.chunks[chunk]
+            parts.append(self._open_record(chunk, data[offset:offset + length], purpose="chunk"))
+        return note.assembled(b"".join(parts))
+
+    def _add_revision(self, note_id: str, newer: bytes):
+        """Keep the current version of a note as a revision before it is replaced
+
+        It is stored as a delta against the newer version, or whole when
+        the run of deltas since the last snapshot is SNAPSHOT_INTERVAL long
+        or the delta would be no smaller.
+        """
+        older_note = self.cache.get(note_id)
+        older = None if older_note is None else self._serialize(older_note)
+        # A cached note edited in place by a caller no longer matches its record
+        if older is None or hashlib.sha256(older).digest() != self._digests.get(note_id):
+            offset, length = self.records[note_id]
+            with open(self.segment_path, "rb") as f:
+                f.seek(offset)
+                older_note = self._assemble(self._deserialize(self._open_record(note_id, f.read(length))))
+            older_note.id = note_id
+            older = self._serialize(older_note)
+        if older == newer:
+            return
+        entries = self.history.setdefault(note_id, [])
+        deltas = 0
+        while deltas < len(entries) and not entries[-1 - deltas][4]:
+            deltas += 1
+        payload = older
+        snapshot = deltas >= SNAPSHOT_INTERVAL - 1
+        if not snapshot:
+            with instrument.span("revision.delta", len(older)):
+                delta = make_delta(newer, older)
+            snapshot = len(delta) >= len(older)
+            if not snapshot:
+                payload = delta
+        revision = entries[-1][2] + 1 if entries else 1
+        aad = bytes.fromhex(note_id) + REVISION_AAD.pack(revision, snapshot)
+        sealed = self.key.encrypt_record(self._pack(payload), aad, "revision")
+        offset, length = self._write_record(note_id, sealed)
+        stamp = older_note.stamp if older_note.stamp is not None else now_stamp()
+        entries.append((offset, length, revision, stamp, snapshot))
+
+    def _open_record(self, note_id: str, record: bytes, aad: bytes = None, purpose: str = "record") -> bytes:
+        (length,) = RECORD_LENGTH.unpack_from(record)
+        start = RECORD_LENGTH.size
+        if record[start:start + NOTE_ID_SIZE] != bytes.fromhex(note_id):
+            raise ValueError(f"Record for note {note_id} is misplaced")
+        sealed = record[start + NOTE_ID_SIZE:start + NOTE_ID_SIZE + length]
+        aad = bytes.fromhex(note_id) if aad is None else aad
+        return self._unpack(self.key.decrypt_record(sealed, aad, purpose))
+
+    def _open_revision(self, note_id: str, entry: tuple, data) -> bytes:
+        offset, length, revision, _, snapshot = entry
+        aad = bytes.fromhex(note_id) + REVISION_AAD.pack(revision, snapshot)
+        return self._open_record(note_id, data[offset:offset + length], aad, "revision")
+
+    def _pack(self, plaintext: bytes) -> bytes:
+        return compress_payload(plaintext, self.dictionary)
+
+    def _unpack(self, payload: bytes) -> bytes:
+        # Records and indexes written before compression are bare JSON
+        if payload[:1] == b"{":
+            return payload
+        return decompress_payload(payload, [self.dictionary])
+
+    def _maybe_train(self) -> bool:
+        """Train the compression dictionary once the vault is big enough
+
+        The index is committed straight away so that no record compressed
+        with the dictionary can be journaled ahead of it. Returns True if
+        it trained (and committed).
+        """
+        if self.dictionary_name is not None or len(self.order) < DICTIONARY_MIN_NOTES:
+            return False
+        data = _map_file(self.segment_path)
+        samples = []
+        for note_id in self.order[::max(1, len(self.order) // DICTIONARY_SAMPLE_NOTES)]:
+            if note_id in self.chunk_lists:
+                continue
+            offset, length = self.records[note_id]
+            samples.append(self._open_record(note_id, data[offset:offset + length]))
+        del data
+        self._set_dictionary(train_dictionary(samples))
+        self._write_index()
+        return True
+
+    def _set_dictionary(self, dictionary: bytes):
+        numbers = [int(match.group(1)) for match in map(_DICTIONARY_NAME.fullmatch, os.listdir(self.directory)) if match]
+        name = f"vault_dict.{max(numbers, default=-1) + 1}.enc"
+        write_atomic(os.path.join(self.directory, name), self.key.encrypt(dictionary, "dictionary"))
+        self.dictionary_name = name
+        self.dictionary = dictionary
+
+    def _start_segment(self, name: str):
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(SEGMENT_HEADER)
+        self.segment = name
+
+    def _segment_numbers(self) -> list:
+        return [int(match.group(1)) for match in map(_SEGMENT_NAME.fullmatch, os.listdir(self.directory)) if match]
+
+    def _next_segment_name(self) -> str:
+        numbers = self._segment_numbers()
+        if self.segment is not None:
+            numbers.append(int(_SEGMENT_NAME.fullmatch(self.segment).group(1)))
+        return f"vault_data.{max(numbers, default=-1) + 1}.seg"
+
+    def _remove_stale_files(self):
+        """Delete segments and dictionaries the committed index no longer uses"""
+        for name in os.listdir(self.directory):
+            if _SEGMENT_NAME.fullmatch(name) and name != self.segment:
+                os.remove(os.path.join(self.directory, name))
+            elif _DICTIONARY_NAME.fullmatch(name) and name != self.dictionary_name:
+                os.remove(os.path.join(self.directory, name))
+
+    def _commit(self, entry: dict):
+        """Write the index now, or journal the change and commit it later"""
+        if not self.commit_delay:
+            self._write_index()
+            return
+        with instrument.span("vault.journal.append"):
+            with open(self.segment_path, "rb") as f:
+                os.fsync(f.fileno())
+            entry = dict(entry, segment=self.segment, generation=self._next_generation())
+            blob = self.key.encrypt(json.dumps(entry).encode(), "journal")
+            with open(self.journal_path, "ab") as f:
+                f.write(RECORD_LENGTH.pack(len(blob)) + blob)
+                f.flush()
+                os.fsync(f.fileno())
+        if self._commit_timer is None:
+            self._commit_timer = threading.Timer(self.commit_delay, self.flush)
+            self._commit_timer.daemon = True
+            self._commit_timer.start()
+
+    def _replay_journal(self) -> bool:
+        """Apply saves journaled after the last index commit
+
+        Returns True if a journal was found, whether or not any of it
+        still applied.
+        """
+        if not os.path.exists(self.journal_path):
+            return False
+        with open(self.journal_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + RECORD_LENGTH.size <= len(data):
+            (length,) = RECORD_LENGTH.unpack_from(data, offset)
+            offset += RECORD_LENGTH.size
+            try:
+                entry = json.loads(self.key.decrypt(data[offset:offset + length], "journal"))
+            except Exception:
+                # A torn last entry is a save that was never acknowledged
+                break
+            offset += length
+            self.generation = max(self.generation, entry.get("generation", 0))
+            if entry["segment"] != self.segment:
+                continue
+            if "put" in entry:
+                note_id = entry["put"]
+                if note_id in self.records:
+                    self.dead_bytes += self.records[note_id][1]
+                else:
+                    self.order.append(note_id)
+                self.records[note_id] = tuple(entry["at"])
+                self.manifest[note_id] = _manifest_entry(note_id, entry["summary"])
+                released = self.chunk_lists.pop(note_id, None)
+                if "chunk_list" in entry:
+                    self.chunks.update((chunk, tuple(loc)) for chunk, loc in entry["chunks"].items())
+                    self.chunk_lists[note_id] = entry["chunk_list"]
+                    self.chunk_refs.update(entry["chunk_list"])
+                self._release_chunks(released)
+                if "revision" in entry:
+                    self.history.setdefault(note_id, []).append(tuple(entry["revision"]))
+                self._digests.pop(note_id, None)
+                self.cache.discard(note_id)
+            elif entry["delete"] in self.records:
+                note_id = entry["delete"]
+                self.dead_bytes += self.records.pop(note_id)[1]
+                self.order.remove(note_id)
+                self._forget(note_id)
+        return True
+
+    def _write_index(self):
+        generation = self._next_generation()
+        index = {
+            "version": INDEX_VERSION,
+            "segment": self.segment,
+            "order": self.order,
+            "records": self.records,
+            "manifest": {note_id: summary.row() for note_id, summary in self.manifest.items()},
+            "history": self.history,
+            "chunks": self.chunks,
+            "chunk_lists": self.chunk_lists,
+            "dead": self.dead_bytes,
+            "dictionary": self.dictionary_name,
+            "generation": generation,
+        }
+        with instrument.span("vault.index.write") as span:
+            with instrument.span("json.encode") as encode:
+                plaintext = json.dumps(index).encode()
+                encode.add(len(plaintext))
+            # The index is rewritten on every commit, so favour speed over ratio
+            blob = self.key.encrypt(compress_payload(plaintext, level=1), "index")
+            write_atomic(self.index_path, blob)
+            span.add(len(blob))
+        if self._commit_timer is not None:
+            self._commit_timer.cancel()
+            self._commit_timer = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def _manifest_entry(note_id: str, entry) -> Note:
+    # Indexes and journals before version 4 hold summaries as dicts
+    if isinstance(entry, dict):
+        return Note.from_dict(entry, note_id)
+    return Note.from_row(note_id, entry)
+
+
+def read_legacy_vault(password: str, directory: str):
+    """Decrypt a single-blob vault written before the segment store"""
+    with open(os.path.join(directory, LEGACY_VAULT_NAME), "r") as f:
+        encrypted_data = f.read()
+    blob = base64.b64decode(encrypted_data.encode())
+    if VaultKey.read_header(blob) is not None:
+        vault_key = VaultKey.for_blob(password, blob)
+        try:
+            return json.loads(vault_key.decrypt(blob))
+        except Exception:
+            pass
+        finally:
+            vault_key.zeroize()
+    return json.loads(EncryptionManager.decrypt(encrypted_data, password))
+
+
+def _read_unwrapped_vault(password: str, directory: str) -> list:
+    """Read the notes of a vault written before data keys, or [] if new
+
+    Covers segment stores whose index is password-encrypted and the
+    single-blob vault_data.enc. Raises if the password is wrong.
+    """
+    if VaultStore.exists(directory) and not VaultStore.uses_data_key(directory):
+        old_store = VaultStore(VaultStore.unlock(password, directory), directory)
+        try:
+            return old_store.load()
+        finally:
+            old_store.key.zeroize()
+    if os.path.exists(os.path.join(directory, LEGACY_VAULT_NAME)):
+        return read_legacy_vault(password, directory)
+    return []
+
+
+def open_vault(password: str, directory: str = ".", idle_timeout: float = None, lazy: bool = False,
+               commit_delay: float = 0, kdf: KDF = None):
+    """Unwrap the vault's data key and load the vault with it.
+
+    Returns (store, notes, success). With lazy=True the notes are manifest
+    summaries and bodies are fetched with store.get(). commit_delay is the
+    group-commit window for index writes, in seconds. kdf is the device's
+    calibrated KDF: a new data key is wrapped with it, and an existing one
+    wrapped with other parameters is rewrapped once it has been unlocked.
+
+    Older vaults (single-blob vault_data.enc, or a segment store encrypted
+    directly with the password) are migrated once: their notes are read
+    with the password first, then a data key is generated and wrapped, and
+    the notes are rewritten under it. The wrapped key is written before
+    the rewrite, so an interrupted migration resumes on the next open.
+    """
+    try:
+        with instrument.span("vault.unlock"):
+            key_path = os.path.join(directory, KEY_NAME)
+            notes = None
+            wrapped = None
+            if os.path.exists(key_path):
+                with open(key_path, "rb") as f:
+                    wrapped = f.read()
+                data_key = VaultKey.unwrap(wrapped, password, idle_timeout)
+            else:
+                notes = _read_unwrapped_vault(password, directory)
+                data_key = VaultKey.generate(idle_timeout)
+                write_atomic(key_path, data_key.wrap(password, kdf))
+            store = VaultStore(data_key, directory, commit_delay=commit_delay)
+            store.document_kdf = kdf
+            if wrapped is not None and kdf is not None and VaultKey.read_header(wrapped)[1] != kdf:
+                store.rewrap(password, kdf, expected=wrapped)
+            if VaultStore.exists(directory) and VaultStore.uses_data_key(directory):
+                return store, store.load_manifest() if lazy else store.load(), True
+            if notes is None:
+                notes = _read_unwrapped_vault(password, directory)
+            store.create(notes)
+            legacy_path = os.path.join(directory, LEGACY_VAULT_NAME)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+            if lazy:
+                notes = [store.summary(note_id) for note_id in store.order]
+            return store, notes, True
+    except Exception:
+        return None, [], False
+
+
+class _ArmoredWriter:
+    """File wrapper that base64-encodes binary writes as they arrive"""
+
+    def __init__(self, f):
+        self._f = f
+        self._pending = b""
+
+    def write(self, data: bytes):
+        data = self._pending + data
+        whole = len(data) - len(data) % 3
+        self._f.write(base64.b64encode(data[:whole]))
+        self._pending = data[whole:]
+
+    def close(self):
+        self._f.write(base64.b64encode(self._pending))
+        self._pending = b""
+
+
+@contextlib.contextmanager
+def _export_file(path: str, pin: str, armored: bool = False):
+    """Open a StreamEncryptor on a temp file that replaces path on success"""
+    f, tmp_path = _temp_file(path)
+    try:
+        with f:
+            target = _ArmoredWriter(f) if armored else f
+            with StreamEncryptor(target, pin) as encryptor:
+                yield encryptor
+            if armored:
+                target.close()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def _export_fields(note: dict) -> dict:
+    return {
+        "title": note["title"],
+        "content": note["content"],
+        "timestamp": note.get("timestamp") or datetime.now().isoformat(),
+    }
+
+
+def export_note(note: dict, path: str, pin: str, armored: bool = False, progress=None):
+    """Write a note as a .venc v2 stream: a metadata line, then the content
+
+    The content is encoded and sealed slice by slice, so exporting a large
+    note never holds more than one chunk of ciphertext in memory. With
+    armored=True the file is base64 text for copy-paste transport.
+    progress(fraction) is called after each slice; if it raises, the
+    partial file is removed and the exception propagates.
+    """
+    metadata = {"title": note["title"], "timestamp": note.get("timestamp")}
+    content = note["content"]
+    with _export_file(path, pin, armored) as encryptor:
+        encryptor.write(json.dumps(metadata).encode() + b"\n")
+        for start in range(0, len(content), STREAM_CHUNK_SIZE):
+            encryptor.write(content[start:start + STREAM_CHUNK_SIZE].encode())
+            if progress is not None:
+                progress(min(1.0, (start + STREAM_CHUNK_SIZE) / len(content)))
+
+
+def _export_item(args) -> str:
+    note, path, pin = args
+    export_note(note, path, pin)
+    return path
+
+
+def export_notes(items, pin: str, workers: int = None):
+    """Export (note, path) pairs as separate .venc files in parallel
+
+    Each file has its own salt and key derivation, so the work is spread
+    over worker processes. Yields each path once its file is written.
+    """
+    return parallel_map(_export_item, ((_export_fields(note), path, pin) for note, path in items), workers)
+
+
+def export_archive(notes, path: str, pin: str, progress=None, count: int = None):
+    """Write many notes into one .venc stream, one JSON line per note
+
+    The whole archive uses a single key derivation and is written as the
+    notes arrive, so notes can be a generator over the vault. progress
+    is called with the fraction done when count is given.
+    """
+    with _export_file(path, pin) as encryptor:
+        encryptor.write(json.dumps({"archive": 1}).encode() + b"\n")
+        for done, note in enumerate(notes, 1):
+            encryptor.write(json.dumps(_export_fields(note)).encode() + b"\n")
+            if progress is not None and count:
+                progress(done / count)
+
+
+def read_export(path: str, pin: str) -> dict:
+    """Decrypt a .venc file into title, content and timestamp
+
+    Accepts binary v2 streams, base64-armored v2 streams and v1 exports.
+    Archives hold several notes and are read with read_export_notes().
+    """
+    notes = _iter_export(path, pin, archive=False)
+    try:
+        return next(notes)
+    finally:
+        notes.close()
+
+
+def read_export_notes(path: str, pin: str):
+    """Yield every note in a .venc file, whether a single export or an archive"""
+    return _iter_export(path, pin, archive=True)
+
+
+def _iter_export(path: str, pin: str, archive: bool):
+    with open(path, "rb") as f:
+        if is_stream(f.read(5)):
+            f.seek(0)
+            yield from _iter_export_stream(f, pin, archive)
+            return
+        f.seek(0)
+        text = f.read()
+    blob = EncryptionManager.dearmor(text)
+    if is_stream(blob):
+        yield from _iter_export_stream(io.BytesIO(blob), pin, archive)
+        return
+    yield json.loads(EncryptionManager.decrypt(text.decode(), pin))
+
+
+def _iter_export_stream(f, pin: str, archive: bool):
+    chunks = iter_decrypt_stream(f, pin)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if b"\n" in head:
+            break
+    else:
+        raise ValueError("Export is missing its metadata line")
+    line, rest = head.split(b"\n", 1)
+    metadata = json.loads(line)
+
+    if "archive" not in metadata:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = [decoder.decode(chunk) for chunk in itertools.chain([rest], chunks)]
+        parts.append(decoder.decode(b"", final=True))
+        metadata["content"] = "".join(parts)
+        yield metadata
+        return
+    if not archive:
+        raise ValueError("File is an archive of several notes")
+    buffered = []
+    for chunk in itertools.chain([rest], chunks):
+        if b"\n" not in chunk:
+            buffered.append(chunk)
+            continue
+        lines = (b"".join(buffered) + chunk).split(b"\n")
+        buffered = [lines.pop()]
+        for line in lines:
+            yield json.loads(line)
+    if b"".join(buffered).strip():
+        raise ValueError("Archive ends with an incomplete note")
+
+
+_TEXT_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """Guess the encoding of a text file from its first bytes
+
+    A byte order mark decides. Without one, NUL bytes in every other
+    position mean UTF-16, and NUL bytes anywhere else mean the file is not
+    text (ValueError). Anything else is taken as UTF-8.
+    """
+    for bom, encoding in _TEXT_BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b"\0" in sample:
+        even, odd = sample[0::2], sample[1::2]
+        if odd.count(0) > len(odd) // 2 and not even.count(0):
+            return "utf-16-le"
+        if even.count(0) > len(even) // 2 and not odd.count(0):
+            return "utf-16-be"
+        raise ValueError("Not a text file")
+    return "utf-8"
+
+
+def _check_import_size(path: str, max_bytes: int):
+    size = os.path.getsize(path)
+    if size > max_bytes:
+        raise ValueError(f"File is {size} bytes, over the {max_bytes} byte import limit")
+
+
+def read_text_file(path: str, max_bytes: int = IMPORT_MAX_BYTES) -> str:
+    """Read a text file of unknown encoding, decoding it as it streams in
+
+    The encoding is detected from the first block (see detect_encoding());
+    a file that is not valid UTF-8 is read as cp1252, then Latin-1. Windows
+    and old Mac line endings become newlines. Raises ValueError for a file
+    over max_bytes or one that is not text.
+    """
+    _check_import_size(path, max_bytes)
+    with open(path, "rb") as f:
+        encoding = detect_encoding(f.read(STREAM_CHUNK_SIZE))
+        candidates = ["utf-8", "cp1252", "latin-1"] if encoding == "utf-8" else [encoding]
+        for encoding in candidates:
+            f.seek(0)
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+            try:
+                parts = [decoder.decode(block) for block in iter(lambda: f.read(STREAM_CHUNK_SIZE), b"")]
+                parts.append(decoder.decode(b"", final=True))
+                return "".join(parts)
+            except UnicodeDecodeError:
+                if encoding == candidates[-1]:
+                    raise
+
+
+def _import_item(args):
+    """Read one import file into notes; runs in a worker process"""
+    path, pin, max_bytes = args
+    try:
+        if path.lower().endswith(".venc"):
+            _check_import_size(path, max_bytes)
+            return path, list(read_export_notes(path, pin)), None
+        return path, [{"title": os.path.basename(path), "content": read_text_file(path, max_bytes)}], None
+    except Exception as e:
+        return path, [], str(e) or type(e).__name__
+
+
+def iter_import_files(paths: list, pin: str = None, workers: int = None, max_bytes: int = IMPORT_MAX_BYTES):
+    """Yield (path, documents, error) for each file, in order
+
+    Files are read and decrypted across workers on a producer thread while
+    the caller handles earlier ones. At most IMPORT_QUEUE_FILES results
+    wait in between, so memory stays bounded however many files there are.
+    """
+    results = queue.Queue(IMPORT_QUEUE_FILES)
+    stop = threading.Event()
+    done = object()
+
+    def offer(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        items = parallel_map(_import_item, ((path, pin, max_bytes) for path in paths), workers)
+        try:
+            for item in items:
+                if not offer(item):
+                    return
+            offer(done)
+        except BaseException as e:
+            offer(e)
+        finally:
+            items.close()
+
+    producer = threading.Thread(target=produce, name="vaultnote-import", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def imported_note(document: dict) -> dict:
+    """Turn an exported document into an unlocked vault note"""
+    return {
+        "title": document["title"],
+        "content": document["content"],
+        "locked": False,
+        "pin_hash": None,
+        "timestamp": document.get("timestamp") or datetime.now().isoformat(),
+    }
+
+
+def import_files(store: VaultStore, paths: list, pin: str = None, workers: int = None, progress=None,
+                 max_bytes: int = IMPORT_MAX_BYTES):
+    """Read .txt files and .venc exports or archives into the vault
+
+    Files are read, decoded and decrypted in parallel (see
+    iter_import_files()) while earlier notes are appended to the vault,
+    and the index is committed once, after the last file. progress is
+    called with the fraction of files done. Returns the new note ids and a
+    {path: error} dict for files that could not be read.
+    """
+    failed = {}
+
+    def notes():
+        for done, (path, read, error) in enumerate(iter_import_files(paths, pin, workers, max_bytes), 1):
+            if error is not None:
+                failed[path] = error
+            yield from map(imported_note, read)
+            if progress is not None:
+                progress(done / len(paths))
+
+    return store.put_many(notes()), failed
+
+
+def list_import_files(directory: str) -> list:
+    """Return the .txt and .venc files directly inside a directory, sorted"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMPORT_EXTENSIONS)
+    )
+
+
+def expand_import_paths(paths: list) -> list:
+    """Replace each directory among paths with the import files directly inside it"""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(list_import_files(path))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def import_directory(store: VaultStore, directory: str, pin: str = None, workers: int = None, progress=None,
+                     max_bytes: int = IMPORT_MAX_BYTES):
+    """Import every .txt and .venc file directly inside a directory"""
+    return import_files(store, list_import_files(directory), pin, workers, progress, max_bytes)